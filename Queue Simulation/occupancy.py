@@ -0,0 +1,59 @@
+import numpy as np
+
+# Number of cars in a system from its arrival and departure times. The times
+# are sorted once; the counts at any time grid then come from np.searchsorted,
+# so an hourly, minute or second grid costs the same O((n + g) log n). The
+# exact piecewise-constant N(t) comes from one merged sweep over the events.
+
+
+def cumulative_counts(times, grid, side='left'):
+    """ Number of `times` strictly before (side='left') or up to (side='right') every grid point """
+    return np.searchsorted(np.sort(np.asarray(times, dtype=float)), grid, side=side)
+
+
+def occupancy_on_grid(arrival_times, departure_times, grid):
+    """ Cumulative arrivals, cumulative departures and number in system at every grid point """
+    # Same counting as the 3.2 cell of the notebook: a car counts as arrived
+    # when A < t, as departed when D < t, and as in the system when A < t < D
+    arrivals = np.sort(np.asarray(arrival_times, dtype=float))
+    departures = np.sort(np.asarray(departure_times, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+    cumulative_arrivals = np.searchsorted(arrivals, grid, side='left')
+    cumulative_departures = np.searchsorted(departures, grid, side='left')
+    # Every car has A < D, so the cars with D <= t are a subset of those with A < t
+    number_in_system = cumulative_arrivals - np.searchsorted(departures, grid, side='right')
+    return cumulative_arrivals, cumulative_departures, number_in_system
+
+
+def time_grid(end, step=1.0, start=0.0):
+    """ Grid points start, start + step, ... strictly before `end` (hours) """
+    return start + step * np.arange(int(np.ceil((end - start) / step)))
+
+
+def occupancy_steps(arrival_times, departure_times):
+    """ Exact N(t) as a step function: N(t) = levels[i] for times[i] <= t < times[i + 1] """
+    arrival_times = np.asarray(arrival_times, dtype=float)
+    departure_times = np.asarray(departure_times, dtype=float)
+    times = np.concatenate((arrival_times, departure_times))
+    steps = np.concatenate((np.ones(len(arrival_times), dtype=np.int64),
+                            -np.ones(len(departure_times), dtype=np.int64)))
+    # Departures go first when they coincide with an arrival
+    order = np.lexsort((steps, times))
+    times = times[order]
+    levels = np.cumsum(steps[order])
+    # Keep only the last level at every distinct event time
+    last = np.append(times[1:] != times[:-1], True)
+    return times[last], levels[last]
+
+
+def time_average(times, levels, start=None, end=None):
+    """ Time average of the step function (times, levels) over [start, end] """
+    start = times[0] if start is None else start
+    end = times[-1] if end is None else end
+    # Level in force at `start`, then every change inside the window
+    inside = (times > start) & (times < end)
+    first = np.searchsorted(times, start, side='right') - 1
+    level_at_start = levels[first] if first >= 0 else 0
+    edges = np.concatenate(([start], times[inside], [end]))
+    values = np.concatenate(([level_at_start], levels[inside]))
+    return np.sum(values * np.diff(edges)) / (end - start)
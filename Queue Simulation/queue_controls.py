@@ -0,0 +1,102 @@
+import numpy as np
+
+from arrival_process import lambda_t, arrivals_by_inversion
+from tandem_queue import TRIP_REQUEST_RATE, SERVICE_RATE, PICKUP_CAPACITY, simulate_tandem, departure_times
+
+# M/M/1 control variates for the airport pickup system (question 3.5 of the
+# notebook, which models Queue 1 as an M/M/1 queue with service rate 200 and
+# Queue 2 as an M/M/1/10 queue).
+#
+# The notebook system itself has no closed form (time-varying arrivals, the
+# pickup queue blocking Queue 1), so every run also pushes its own random
+# numbers through two M/M/1 queues that do: the same unit exponentials that
+# give the arrival times, at the mean rate of lambda_t instead of the varying
+# one, and the same trip request and pickup times as services. Started from
+# their stationary distribution, every customer of these shadow queues sees
+# the stationary M/M/1 (PASTA), so the mean sojourn time of a run has exactly
+# the closed form 1 / (mu - lambda) as its expectation, while it moves with
+# the times of the real system. The trip request and pickup times themselves
+# (means 1 / mu) are controls too.
+#
+# tandem_replication gives a replication for variance_reduction.estimate of
+# the patient flow simulation, whose controls_of regresses each queue on its
+# own shadow queue and service times.
+
+
+def mm1_sojourn_mean(arrival_rate, service_rate):
+    """ T = 1 / (mu - lambda) of a stable M/M/1 queue """
+    if arrival_rate >= service_rate:
+        raise ValueError(f"The M/M/1 queue is unstable: lambda = {arrival_rate} >= mu = {service_rate}")
+    return 1 / (service_rate - arrival_rate)
+
+
+def shadow_mm1_sojourn(arrival_times, service_times, arrival_rate, service_rate, rng):
+    """ Sojourn times of an M/M/1 queue on the given arrivals and services, started in its stationary regime """
+    # At time 0 the queue holds a geometric number of customers with
+    # exponential work each, so the first departure of the work in the queue
+    # at time 0 is a gamma variate
+    rho = arrival_rate / service_rate
+    in_system = rng.geometric(1 - rho) - 1
+    initial_work = rng.gamma(in_system, 1 / service_rate) if in_system else 0.0
+    return departure_times(arrival_times, service_times, initial_work) - arrival_times
+
+
+def tandem_replication(cars=10_000, rate=lambda_t, trip_rate=TRIP_REQUEST_RATE, service_rate=SERVICE_RATE,
+                       capacity=PICKUP_CAPACITY):
+    """ replication(rng) of T, Tq, N and Nq of both queues and the system, with the shadow M/M/1 controls """
+    mean_rate = rate.per_period / rate.period
+
+    def replication(rng):
+        arrivals = arrivals_by_inversion(rate, cars, rng=rng)
+        result = simulate_tandem(arrivals, trip_rate, service_rate, capacity, rng=rng)
+        trip = result['TripRequestTime']
+        service = result['ServiceTime']
+        exit_queue1 = result['TimeExitQueue1']
+        departures = result['DepartureTime']
+        # T, Tq, N and Nq per queue as in streaming_stats.TandemStats: the
+        # area under N(t) up to the last departure is the sum of the sojourn
+        # times, and the waiting time of the system leaves out the pickup
+        sojourn = {'Queue1': exit_queue1 - arrivals, 'Queue2': departures - exit_queue1, 'System': departures - arrivals}
+        waiting = {'Queue1': sojourn['Queue1'] - trip, 'Queue2': sojourn['Queue2'] - service,
+                   'System': sojourn['System'] - service}
+        horizon = departures.max()
+        outputs = {}
+        for queue in sojourn:
+            outputs[f'T_{queue}'] = np.mean(sojourn[queue])
+            outputs[f'Tq_{queue}'] = np.mean(waiting[queue])
+            outputs[f'N_{queue}'] = np.sum(sojourn[queue]) / horizon
+            outputs[f'Nq_{queue}'] = np.sum(waiting[queue]) / horizon
+        # The unit exponentials behind the arrivals, spaced at the mean rate
+        shadow_arrivals = rate.cumulative(arrivals) / mean_rate
+        controls = {
+            'mm1_T_Queue1': np.mean(shadow_mm1_sojourn(shadow_arrivals, trip, mean_rate, trip_rate, rng)),
+            'mm1_T_Queue2': np.mean(shadow_mm1_sojourn(shadow_arrivals, service, mean_rate, service_rate, rng)),
+            'trip_request_time': np.mean(trip),
+            'service_time': np.mean(service),
+        }
+        control_means = {
+            'mm1_T_Queue1': mm1_sojourn_mean(mean_rate, trip_rate),
+            'mm1_T_Queue2': mm1_sojourn_mean(mean_rate, service_rate),
+            'trip_request_time': 1 / trip_rate,
+            'service_time': 1 / service_rate,
+        }
+        return outputs, controls, control_means
+    # Each queue is regressed on its own shadow queue and service times only,
+    # the system on both shadow queues
+    queue_controls = {'Queue1': ['mm1_T_Queue1', 'trip_request_time'], 'Queue2': ['mm1_T_Queue2', 'service_time'],
+                      'System': ['mm1_T_Queue1', 'mm1_T_Queue2']}
+    replication.controls_of = {f'{output}_{queue}': controls for queue, controls in queue_controls.items()
+                               for output in ('T', 'Tq', 'N', 'Nq')}
+    return replication
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Stochastic Simulation',
+                                 'Simulation of Patient Flow'))
+    from variance_reduction import compare_methods
+
+    table = compare_methods(tandem_replication(), runs=40)
+    print(table[['output', 'method', 'mean', 'half_width', 'variance_reduction_factor']].to_string(index=False))
@@ -0,0 +1,186 @@
+import math
+from bisect import insort
+from typing import NamedTuple
+
+import numpy as np
+
+from tandem_queue import TRIP_REQUEST_RATE, SERVICE_RATE, PICKUP_CAPACITY
+
+# Stages of M/M/c/K queues in series. Every stage has `servers` servers and
+# room for `capacity` customers in total (waiting, in service or blocked);
+# either can be math.inf. Customers are served in FIFO order:
+#
+#   - a customer enters a stage once fewer than `capacity` customers are in
+#     it, and starts service once one of the `servers` servers is free;
+#   - after its service it leaves the stage only when the next stage has
+#     room, staying in its server until then (blocking after service).
+#     Every stage but the last also releases customers in FIFO order, like
+#     the airport Queue 1 (a lane cars cannot overtake in), so customers reach
+#     each stage in arrival order; in the last stage they leave as soon as
+#     their service ends.
+#
+# The time a stage frees a server is then the servers-th latest exit time of
+# the customers before, and the time it has room the capacity-th latest, so a
+# stage only keeps its latest max(servers, capacity) exit times, sorted:
+# memory is O(K) whatever the number of customers. A full first stage either
+# turns arrivals away (arrival_blocking='loss', the M/M/c/K loss system) or
+# holds them until there is room ('wait').
+#
+# airport_network is the pickup system of the notebook with any capacity and
+# number of pickup bays. Unlike the recursions of tandem_queue (the fast path
+# for the notebook's own model) a car starts its pickup only after entering
+# the pickup queue, not already at its trip request.
+#
+# With a trace (event_trace.TraceWriter of the patient flow simulation) every
+# customer's arrival, loss, and entry, service start and exit of every stage
+# are recorded, numbered in arrival order; the records of one simulate() call
+# are grouped by event, not sorted in time.
+
+
+class Stage(NamedTuple):
+    servers: float
+    capacity: float
+    service_rate: float
+
+
+class LatestExits:
+    """ The `size` latest exit times of a stage, in increasing order """
+    __slots__ = ('values', 'size')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = []
+
+    def latest(self, m):
+        """ The m-th latest exit time; -inf while fewer than m customers have passed """
+        values = self.values
+        return values[-m] if m <= len(values) else -math.inf
+
+    def add(self, t):
+        values = self.values
+        if not values or t >= values[-1]:
+            values.append(t)  # always the case for FIFO exits
+        else:
+            insort(values, t)
+        if len(values) > self.size:
+            del values[0]
+
+
+class TandemNetwork:
+    """ Stages in series with blocking after service, simulated customer by customer in O(K) memory """
+
+    def __init__(self, stages, arrival_blocking='wait', rng=None, trace=None):
+        if arrival_blocking not in ('wait', 'loss'):
+            raise ValueError(f"Unknown arrival_blocking {arrival_blocking!r}, expected 'wait' or 'loss'")
+        self.stages = [Stage(*stage) for stage in stages]
+        for stage in self.stages:
+            if not 1 <= stage.servers <= stage.capacity or stage.service_rate <= 0:
+                raise ValueError(f"Need 1 <= servers <= capacity and a positive service rate, got {stage}")
+        self.arrival_blocking = arrival_blocking
+        self.rng = np.random.default_rng(rng)
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        """ Empty network """
+        self.exits = [LatestExits(int(max((x for x in stage[:2] if x < math.inf), default=1)))
+                      for stage in self.stages]
+        self.accepted = 0
+        self.lost = 0
+
+    def simulate(self, arrival_times):
+        """ Push the next customers (sorted arrival times) through the network; the state carries over """
+        # Returns per customer the entry, service start, service and exit
+        # time of every stage as (n, stages) arrays, NaN for lost customers
+        arrival_times = np.asarray(arrival_times, dtype=float)
+        n, n_stages = len(arrival_times), len(self.stages)
+        # One batch of service times per stage, drawn for every customer
+        service = np.column_stack([self.rng.exponential(1 / stage.service_rate, n) for stage in self.stages])
+        entry = np.full((n, n_stages), np.nan)
+        start = np.full((n, n_stages), np.nan)
+        exit_ = np.full((n, n_stages), np.nan)
+        lost = np.zeros(n, dtype=bool)
+
+        exits = self.exits
+        first_customer = self.accepted + self.lost
+        servers = [int(stage.servers) if stage.servers < math.inf else None for stage in self.stages]
+        capacity = [int(stage.capacity) if stage.capacity < math.inf else None for stage in self.stages]
+        last = n_stages - 1
+        loss = self.arrival_blocking == 'loss'
+        service_rows = service.tolist()
+
+        for i, t in enumerate(arrival_times.tolist()):
+            if capacity[0] is not None:
+                room = exits[0].latest(capacity[0])
+                if room > t:
+                    if loss:
+                        lost[i] = True
+                        self.lost += 1
+                        continue
+                    t = room
+            times = service_rows[i]
+            for j in range(n_stages):
+                stage_exits = exits[j]
+                entry[i, j] = t
+                if servers[j] is not None:
+                    t = max(t, stage_exits.latest(servers[j]))
+                start[i, j] = t
+                t += times[j]
+                if j < last:
+                    t = max(t, stage_exits.latest(1))
+                    if capacity[j + 1] is not None:
+                        t = max(t, exits[j + 1].latest(capacity[j + 1]))
+                exit_[i, j] = t
+                stage_exits.add(t)
+            self.accepted += 1
+
+        service[lost] = np.nan
+        if self.trace is not None:
+            self.record(first_customer, arrival_times, lost, entry, start, exit_)
+        return {'arrival': arrival_times, 'lost': lost, 'entry': entry, 'start': start, 'service': service,
+                'exit': exit_}
+
+    def record(self, first_customer, arrival_times, lost, entry, start, exit_):
+        """ Trace records of one simulate() call """
+        customers = np.arange(first_customer, first_customer + len(arrival_times))
+        kept = customers[~lost]
+        self.trace.append_many(arrival_times, customers, 0, 'arrival')
+        self.trace.append_many(arrival_times[lost], customers[lost], 0, 'loss')
+        for j in range(len(self.stages)):
+            for event, times in (('stage_entry', entry), ('service_start', start), ('stage_exit', exit_)):
+                self.trace.append_many(times[~lost, j], kept, j, event)
+
+    def run_stream(self, arrival_chunks, stats):
+        """ Simulate consecutive chunks of arrival times, pushing every result into stats.add_chunk """
+        for arrival_times in arrival_chunks:
+            stats.add_chunk(self.simulate(arrival_times))
+        return stats
+
+
+def airport_network(capacity=PICKUP_CAPACITY, bays=1, trip_rate=TRIP_REQUEST_RATE, service_rate=SERVICE_RATE,
+                    rng=None, trace=None):
+    """ The pickup system of the notebook with `capacity` cars in the pickup queue and `bays` pickup bays """
+    return TandemNetwork([Stage(math.inf, math.inf, trip_rate), Stage(bays, capacity, service_rate)], rng=rng,
+                         trace=trace)
+
+
+def tandem_columns(result):
+    """ A two-stage result in the column layout of simulate_tandem (for streaming_stats.TandemStats) """
+    kept = ~result['lost']
+    return {
+        'ArrivalTime': result['arrival'][kept],
+        'TripRequestTime': result['service'][kept, 0],
+        'ServiceTime': result['service'][kept, 1],
+        'DepartureTime': result['exit'][kept, 1],
+        'TimeExitQueue1': result['exit'][kept, 0],
+    }
+
+
+def mmck_blocking(arrival_rate, service_rate, servers, capacity):
+    """ Probability that an arrival finds an M/M/c/K queue full """
+    a = arrival_rate / service_rate
+    n = np.arange(capacity + 1)
+    log_terms = np.where(n <= servers, n * np.log(a) - np.array([math.lgamma(m + 1) for m in n]),
+                         n * np.log(a) - math.lgamma(servers + 1) - (n - servers) * np.log(servers))
+    probabilities = np.exp(log_terms - log_terms.max())
+    return probabilities[-1] / probabilities.sum()
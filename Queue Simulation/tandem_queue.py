@@ -0,0 +1,199 @@
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+# Airport pickup system as two queues in series, on plain NumPy arrays.
+#
+# Car i arrives at A_i, receives its trip request R_i hours later and needs
+# S_i hours at the pickup bay. Queue 1 releases cars in FIFO order and only
+# when the pickup queue has room for them (at most `capacity` cars in Queue 2,
+# server included), which gives the recursions of the notebook:
+#
+#     D_i = max(D_{i-1}, A_i + R_i) + S_i
+#     E_i = max(A_i + R_i, E_{i-1}, D_{i-capacity})
+#
+# with D the departure time from Queue 2 and E the exit time from Queue 1.
+# Both are running maxima, so they are evaluated with maximum.accumulate
+# instead of a Python loop.
+
+TRIP_REQUEST_RATE = 200  # trip requests per hour
+SERVICE_RATE = 110  # pickups per hour
+PICKUP_CAPACITY = 10  # cars in the pickup queue, server included
+
+
+def departure_times(ready_times, service_times, last_departure=0.0):
+    """ D_i = max(D_{i-1}, ready_i) + S_i with D_{-1} = last_departure """
+    # With C_i the cumulative service time, D_i - C_i is the running maximum
+    # of ready_i - C_{i-1} (floored at D_{-1}, 0 for the empty system)
+    cumulative_service = np.cumsum(service_times)
+    previous_cumulative = np.concatenate(([0.0], cumulative_service[:-1]))
+    return cumulative_service + np.maximum(np.maximum.accumulate(ready_times - previous_cumulative), last_departure)
+
+
+def exit_times_queue1(ready_times, departures, capacity, last_exit=0.0, previous_departures=()):
+    """ E_i = max(ready_i, E_{i-1}, D_{i-capacity}) with E_{-1} = last_exit """
+    # previous_departures are the departures of the cars just before this
+    # array (up to `capacity` of them); with none, the first `capacity` cars
+    # always find room in the pickup queue
+    all_departures = np.concatenate((previous_departures, departures))
+    first = max(0, capacity - len(previous_departures))
+    released = ready_times.copy()
+    if first < len(released):
+        np.maximum(released[first:], all_departures[:len(all_departures) - capacity], out=released[first:])
+    if len(released):
+        released[0] = max(released[0], last_exit)
+    return np.maximum.accumulate(released)
+
+
+def phases(profile):
+    """ profile.phase, or a do-nothing context for profile=None """
+    if profile is None:
+        return lambda name: nullcontext()
+    return profile.phase
+
+
+def count_cars(profile, ready_times, departures, exit_queue1):
+    """ Cars through the system, and those still in Queue 1 when their trip request came """
+    # Held cars wait for the car ahead or for room in the pickup queue
+    if profile is not None:
+        profile.count_many({'arrivals': len(departures), 'departures': len(departures),
+                            'held_in_queue1': int(np.count_nonzero(exit_queue1 > ready_times))})
+
+
+def trace_cars(trace, first_car, arrival_times, exit_queue1, departures, service_times):
+    """ Arrival, Queue 1 exit, pickup start and departure records of consecutive cars """
+    # trace is an event trace writer (event_trace.TraceWriter of the patient
+    # flow simulation); location 0 is Queue 1 and 1 the pickup queue
+    if trace is not None:
+        cars = np.arange(first_car, first_car + len(arrival_times))
+        trace.append_many(arrival_times, cars, 0, 'arrival')
+        trace.append_many(exit_queue1, cars, 0, 'stage_exit')
+        trace.append_many(departures - service_times, cars, 1, 'service_start')
+        trace.append_many(departures, cars, 1, 'stage_exit')
+
+
+def simulate_tandem(arrival_times, trip_rate=TRIP_REQUEST_RATE, service_rate=SERVICE_RATE,
+                    capacity=PICKUP_CAPACITY, rng=None, profile=None, trace=None):
+    """ Run the two-queue pickup system for the given arrival times (hours) """
+    # profile is an optional run profile (profiling.RunProfile of the patient
+    # flow simulation) that times the draws and each recursion
+    rng = np.random.default_rng(rng)
+    phase = phases(profile)
+    arrival_times = np.asarray(arrival_times, dtype=float)
+    n = len(arrival_times)
+
+    # All exponential draws are made in one batch per stream
+    with phase('exponential_draws'):
+        trip_request_times = rng.exponential(1 / trip_rate, n)
+        service_times = rng.exponential(1 / service_rate, n)
+
+    ready_times = arrival_times + trip_request_times
+    with phase('departure_recursion'):
+        departures = departure_times(ready_times, service_times)
+    with phase('queue1_exit_recursion'):
+        exit_queue1 = exit_times_queue1(ready_times, departures, capacity)
+    exit_queue2 = departures - service_times
+    count_cars(profile, ready_times, departures, exit_queue1)
+    trace_cars(trace, 0, arrival_times, exit_queue1, departures, service_times)
+
+    return {
+        'ArrivalTime': arrival_times,
+        'TripRequestTime': trip_request_times,
+        'ServiceTime': service_times,
+        'DepartureTime': departures,
+        'InterArrivalTime': np.diff(arrival_times, prepend=0.0),
+        'TimeExitQueue1': exit_queue1,
+        'DelayQueue1': exit_queue1 - arrival_times,
+        'DelayQueue2': exit_queue2 - exit_queue1,
+        'TimeExitQueue2': exit_queue2,
+    }
+
+
+def simulate_tandem_stream(arrival_chunks, stats, trip_rate=TRIP_REQUEST_RATE, service_rate=SERVICE_RATE,
+                           capacity=PICKUP_CAPACITY, rng=None, profile=None, checkpoint=None, checkpoint_every=10,
+                           trace=None):
+    """ Run the pickup system over consecutive chunks of arrival times, pushing every chunk into `stats` """
+    # Only the last departure, the last Queue 1 exit and the last `capacity`
+    # departures are carried between chunks, so memory stays at one chunk
+    # whatever the number of cars. stats needs an add_chunk(result) method,
+    # e.g. streaming_stats.TandemStats.
+    #
+    # With a checkpoint (an object with exists/save/load such as
+    # checkpoint.Checkpoint of the patient flow simulation) this carried
+    # state, the generator states and `stats` are saved every
+    # checkpoint_every chunks and when the run ends, and a run started with an
+    # existing snapshot continues from it with the same results. The arrivals
+    # must then come from an arrival_process.ArrivalStream, whose position is
+    # saved along, and the stats returned are the restored ones.
+    #
+    # With a trace (event_trace.TraceWriter) every car is recorded as it goes,
+    # so the cars need not be kept as in simulate_tandem; a resumed run
+    # records the cars after its snapshot only
+    rng = np.random.default_rng(rng)
+    phase = phases(profile)
+    last_departure = last_exit = 0.0
+    previous_departures = np.empty(0)
+    chunks_done = cars_done = 0
+    if checkpoint is not None and checkpoint.exists():
+        arrays, meta = checkpoint.load()
+        previous_departures = arrays['previous_departures']
+        last_departure, last_exit, chunks_done = meta['last_departure'], meta['last_exit'], meta['chunks']
+        cars_done = meta.get('cars', 0)
+        rng.bit_generator.state = meta['rng']
+        arrival_chunks.set_state(meta['arrivals'])
+        stats = meta['stats']
+
+    def save():
+        checkpoint.save({'previous_departures': previous_departures},
+                        {'last_departure': last_departure, 'last_exit': last_exit, 'chunks': chunks_done,
+                         'cars': cars_done, 'rng': rng.bit_generator.state, 'arrivals': arrival_chunks.get_state(),
+                         'stats': stats})
+
+    chunks = iter(arrival_chunks)
+    while True:
+        # A generator such as arrival_process.arrival_chunks draws the
+        # arrivals on demand, so its time is profiled here
+        with phase('arrival_generation'):
+            arrival_times = next(chunks, None)
+        if arrival_times is None:
+            break
+        arrival_times = np.asarray(arrival_times, dtype=float)
+        n = len(arrival_times)
+        if n == 0:
+            continue
+        with phase('exponential_draws'):
+            trip_request_times = rng.exponential(1 / trip_rate, n)
+            service_times = rng.exponential(1 / service_rate, n)
+        ready_times = arrival_times + trip_request_times
+        with phase('departure_recursion'):
+            departures = departure_times(ready_times, service_times, last_departure)
+        with phase('queue1_exit_recursion'):
+            exit_queue1 = exit_times_queue1(ready_times, departures, capacity, last_exit, previous_departures)
+        count_cars(profile, ready_times, departures, exit_queue1)
+        trace_cars(trace, cars_done, arrival_times, exit_queue1, departures, service_times)
+        with phase('statistics'):
+            stats.add_chunk({
+                'ArrivalTime': arrival_times,
+                'TripRequestTime': trip_request_times,
+                'ServiceTime': service_times,
+                'DepartureTime': departures,
+                'TimeExitQueue1': exit_queue1,
+            })
+        last_departure, last_exit = departures[-1], exit_queue1[-1]
+        previous_departures = np.concatenate((previous_departures, departures))[-capacity:]
+        chunks_done += 1
+        cars_done += n
+        if checkpoint is not None and chunks_done % checkpoint_every == 0:
+            save()
+    if checkpoint is not None:
+        save()
+    return stats
+
+
+def to_dataframe(result):
+    """ DataFrame in the notebook layout, with the all-zero initial row 0 """
+    columns = {'Arrivals': np.arange(len(result['ArrivalTime']) + 1)}
+    for name, values in result.items():
+        columns[name] = np.concatenate(([0.0], values))
+    return pd.DataFrame(columns)
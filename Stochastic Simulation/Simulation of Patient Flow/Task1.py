@@ -2,20 +2,14 @@ import numpy as np
 import pandas as pd
 import random
 import matplotlib.pyplot as plt
+from scenarios import load_scenario
+from hospital_model import simulate_hospital_events
 
 np.random.seed(42)
-# Parameters
-wards = ['A', 'B', 'C', 'D', 'E']
-arrival_rates = {'A': 14.5, 'B': 11.0, 'C': 8.0, 'D': 6.5, 'E': 5.0}
-mean_stay = {'A': 2.9, 'B': 4.0, 'C': 4.5, 'D': 1.4, 'E': 3.9}
-capacities = {'A': 55, 'B': 40, 'C': 30, 'D': 20, 'E': 20}
-relocation_probs = {
-    'A': [0.00, 0.05, 0.10, 0.05, 0.80],
-    'B': [0.20, 0.00, 0.50, 0.15, 0.15],
-    'C': [0.30, 0.20, 0.00, 0.20, 0.30],
-    'D': [0.35, 0.30, 0.05, 0.00, 0.30],
-    'E': [0.20, 0.10, 0.60, 0.10, 0.00]
-}
+# Parameters of the current hospital (scenario_files/task1.toml)
+scenario = load_scenario('task1')
+wards = list(scenario.wards)
+capacities, relocation_probs, arrival_rates, mean_stay = scenario.as_dicts()
 
 # Verify that relocation probabilities sum to 1 for each patient type
 for key, probs in relocation_probs.items():
@@ -68,6 +62,17 @@ results = pd.DataFrame({
 })
 print(results)
 
+# The same year on the next-event model (hospital_model.py): continuous-time
+# arrivals and a length of stay per patient instead of daily Poisson departures
+event_results = simulate_hospital_events(365, capacities, relocation_probs, arrival_rates, mean_stay, rng=42)
+print("\nNext-event model:")
+print(pd.DataFrame({
+    'Admissions': event_results[0],
+    'Relocations': event_results[1],
+    'Losses': event_results[2],
+    'Final Occupancy': event_results[3]
+}))
+
 # Plotting patient admissions in each ward
 plt.figure(figsize=(10, 6))
 plt.bar(results.index, results['Admissions'], color='skyblue')
@@ -1,45 +1,25 @@
 import numpy as np
 import pandas as pd
-from scipy.stats import erlang
+from scenarios import load_scenario
+from result_cache import cached_simulation
+from hospital_model import simulate_hospital_events
+from capacity_search import analytic_bracket, evaluate_with_crn, find_minimum_capacity, simulated_replications
 
-import random
 np.random.seed(42)
 
-# Parameters
-wards = ['A', 'B', 'C', 'D', 'E', 'F']
-arrival_rates = {'A': 14.5, 'B': 11.0, 'C': 8.0, 'D': 6.5, 'E': 5.0, 'F': 13.0}
-mean_stay = {'A': 2.9, 'B': 4.0, 'C': 4.5, 'D': 1.4, 'E': 3.9, 'F': 2.2}
-initial_capacities = {'A': 55, 'B': 40, 'C': 30, 'D': 20, 'E': 20}
-urgency_points = {'A': 7, 'B': 5, 'C': 2, 'D': 10, 'E': 5}
-relocation_probs = {
-    'A': [0.00, 0.05, 0.10, 0.05, 0.80],
-    'B': [0.20, 0.00, 0.50, 0.15, 0.15],
-    'C': [0.30, 0.20, 0.00, 0.20, 0.30],
-    'D': [0.35, 0.30, 0.05, 0.00, 0.30],
-    'E': [0.20, 0.10, 0.60, 0.10, 0.00]
-}
-
-# Determine the minimum bed capacity for Ward F
+# Parameters of the hospital with the new Ward F (scenario_files/new_ward.toml)
+scenario = load_scenario('new_ward')
+wards = list(scenario.wards)
+capacities, relocation_probs, arrival_rates, mean_stay = scenario.as_dicts()
+# The five wards of the current hospital give up the beds of Ward F
+initial_capacities = {ward: beds for ward, beds in capacities.items() if ward != 'F'}
+urgency_points = {ward: int(points) for ward, points in zip(wards, scenario.urgency_points) if ward != 'F'}
+
+# Ward F's arrival rate and mean stay bracket the capacity search
+# (capacity_search.analytic_bracket)
 arrival_rate_F = arrival_rates['F']
 mean_stay_F = mean_stay['F']
 
-def erlang_b(n, traffic_intensity):
-    """ Compute the Erlang B formula """
-    inv_b = 1.0
-    for j in range(1, n + 1):
-        inv_b = 1 + inv_b * j / traffic_intensity
-    return 1.0 / inv_b
-
-# Calculate traffic intensity for Ward F
-traffic_intensity_F = arrival_rate_F * mean_stay_F
-
-# Find the minimum capacity such that the blocking probability is <= 5%
-bed_capacity_F = 0
-for n in range(1, 100):  # Arbitrary upper limit for bed capacity
-    if erlang_b(n, traffic_intensity_F) <= 0.05:
-        bed_capacity_F = n
-        break
-
 # Allocate beds to Ward F and adjust other wards based on urgency points
 def reallocate_beds(initial_capacities, urgency_points, bed_capacity_F):
     # Calculate the total available beds
@@ -69,18 +49,12 @@ def reallocate_beds(initial_capacities, urgency_points, bed_capacity_F):
     
     return adjusted_capacities
 
-# Add relocation probabilities for new Ward F
-def update_relocation_probs(relocation_probs):
-    for ward in relocation_probs:
-        relocation_probs[ward].append(0.0 if ward != 'F' else 1.0)
-    relocation_probs['F'] = [0.20, 0.20, 0.20, 0.20, 0.20, 0.0]
-    return relocation_probs
-
 # Initialize the state of the system
 def initialize_ward_occupancy(adjusted_capacities):
     return {ward: 0 for ward in adjusted_capacities}
 
 # Function to run the simulation
+@cached_simulation
 def simulate_hospital_with_new_ward(days, adjusted_capacities, relocation_probs):
     ward_occupancy = initialize_ward_occupancy(adjusted_capacities)
     total_admissions = {ward: 0 for ward in adjusted_capacities}
@@ -120,32 +94,57 @@ def simulate_hospital_with_new_ward(days, adjusted_capacities, relocation_probs)
     
     return total_admissions, total_relocations, total_losses, ward_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations
 
-# Find the optimal bed capacity for Ward F to ensure 95% hospitalization rate
-def find_optimal_bed_capacity_for_f(days, target_rate=0.95):
-    for bed_capacity in range(1, 101):  # Arbitrary upper limit for bed capacity
-        adjusted_capacities = reallocate_beds(initial_capacities, urgency_points, bed_capacity)
-        adjusted_capacities['F'] = bed_capacity
-        
-        relocation_probs_updated = update_relocation_probs(relocation_probs.copy())
-        total_admissions, total_relocations, total_losses, final_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations = simulate_hospital_with_new_ward(days, adjusted_capacities, relocation_probs_updated)
-        hospitalization_rate_F = total_admissions['F'] / (total_admissions['F'] + total_losses['F'])
-        
-        if hospitalization_rate_F >= target_rate:
-            return bed_capacity, hospitalization_rate_F, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations
-    
-    return None, None, None, None, None, None  # If no suitable capacity is found within the range
-
-# Find the minimum bed capacity for Ward F
-optimal_bed_capacity, hospitalization_rate, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations = find_optimal_bed_capacity_for_f(365)
-print(f"Optimal bed capacity for Ward F: {optimal_bed_capacity}")
-print(f"Hospitalization rate for Ward F: {hospitalization_rate}")
-
-# Display results
-print("Probability that all beds are occupied on arrival:")
-print(prob_all_beds_occupied)
-
-print("Expected number of admissions per day:")
-print(expected_admissions)
-
-print("Expected number of relocated patients per day:")
-print(expected_relocations)
+# Estimate the hospitalization rate of Ward F for one bed capacity on common
+# random numbers (capacity_search.evaluate_with_crn). The per-ward statistics
+# are averaged over the replications.
+def evaluate_bed_capacity_for_f(days, bed_capacity, relocation_probs, target_rate, seed):
+    adjusted_capacities = reallocate_beds(initial_capacities, urgency_points, bed_capacity)
+    adjusted_capacities['F'] = bed_capacity
+
+    def replicate():
+        total_admissions, total_relocations, total_losses, final_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations = simulate_hospital_with_new_ward(days, adjusted_capacities, relocation_probs)
+        return total_admissions['F'] / (total_admissions['F'] + total_losses['F']), (prob_all_beds_occupied, expected_admissions, expected_relocations)
+
+    hospitalization_rate_F, n_replications, replication_stats = evaluate_with_crn(replicate, target_rate, seed)
+    prob_all_beds_occupied, expected_admissions, expected_relocations = (
+        {ward: np.mean([stats[i][ward] for stats in replication_stats]) for ward in adjusted_capacities}
+        for i in range(3))
+    return hospitalization_rate_F, n_replications, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations
+
+# Find the optimal bed capacity for Ward F to ensure 95% hospitalization rate,
+# bracketed from Erlang-B and bisected (capacity_search.py). Also returns the
+# number of years simulated over all capacities tried
+def find_optimal_bed_capacity_for_f(days, target_rate=0.95, seed=42):
+    lower, upper = analytic_bracket(arrival_rate_F, mean_stay_F, relocation_probs['F'], target_rate)
+    optimal_bed_capacity, evaluations = find_minimum_capacity(
+        lambda bed_capacity: evaluate_bed_capacity_for_f(days, bed_capacity, relocation_probs, target_rate, seed),
+        lower, upper, target_rate)
+    simulated_years = simulated_replications(evaluations) * days / 365
+    if optimal_bed_capacity is None:
+        return None, None, None, None, None, None, simulated_years
+
+    hospitalization_rate_F, n_replications, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations = evaluations[optimal_bed_capacity]
+    return optimal_bed_capacity, hospitalization_rate_F, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations, simulated_years
+
+if __name__ == '__main__':
+    # Find the minimum bed capacity for Ward F
+    optimal_bed_capacity, hospitalization_rate, adjusted_capacities, prob_all_beds_occupied, expected_admissions, expected_relocations, simulated_years = find_optimal_bed_capacity_for_f(365)
+    print(f"Capacity search simulated {simulated_years:.1f} years")
+    print(f"Optimal bed capacity for Ward F: {optimal_bed_capacity}")
+    print(f"Hospitalization rate for Ward F: {hospitalization_rate}")
+
+    # Display results
+    print("Probability that all beds are occupied on arrival:")
+    print(prob_all_beds_occupied)
+
+    print("Expected number of admissions per day:")
+    print(expected_admissions)
+
+    print("Expected number of relocated patients per day:")
+    print(expected_relocations)
+
+    # The same capacities for one year on the next-event model (hospital_model.py):
+    # continuous-time arrivals and a length of stay per patient
+    event_results = simulate_hospital_events(365, adjusted_capacities, relocation_probs, arrival_rates, mean_stay, rng=42)
+    print("\nNext-event model, probability that all beds are occupied on arrival:")
+    print(event_results[4])
@@ -1,29 +1,19 @@
 import numpy as np
 import pandas as pd
-from scipy.stats import lognorm
+from scenarios import load_scenario
+from length_of_stay import LogNormal, daily_stays
+from hospital_model import simulate_hospital_events
+from result_cache import cached_simulation
 
 import random
 np.random.seed(42)
-# Parameters
-wards = ['A', 'B', 'C', 'D', 'E', 'F']
-arrival_rates = {'A': 14.5, 'B': 11.0, 'C': 8.0, 'D': 6.5, 'E': 5.0, 'F': 13.0}
-mean_stay = {'A': 2.9, 'B': 4.0, 'C': 4.5, 'D': 1.4, 'E': 3.9, 'F': 2.2}
-initial_capacities = {'A': 55, 'B': 40, 'C': 30, 'D': 20, 'E': 20}
-urgency_points = {'A': 7, 'B': 5, 'C': 2, 'D': 10, 'E': 5}
-relocation_probs = {
-    'A': [0.00, 0.05, 0.10, 0.05, 0.80],
-    'B': [0.20, 0.00, 0.50, 0.15, 0.15],
-    'C': [0.30, 0.20, 0.00, 0.20, 0.30],
-    'D': [0.35, 0.30, 0.05, 0.00, 0.30],
-    'E': [0.20, 0.10, 0.60, 0.10, 0.00]
-}
-
-# Function to update relocation probabilities for the new ward F
-def update_relocation_probs(relocation_probs):
-    for ward in relocation_probs:
-        relocation_probs[ward].append(0.0 if ward != 'F' else 1.0)
-    relocation_probs['F'] = [0.20, 0.20, 0.20, 0.20, 0.20, 0.0]
-    return relocation_probs
+# Parameters of the hospital with the new Ward F (scenario_files/new_ward.toml)
+scenario = load_scenario('new_ward')
+wards = list(scenario.wards)
+capacities, relocation_probs, arrival_rates, mean_stay = scenario.as_dicts()
+# The five wards of the current hospital give up the beds of Ward F
+initial_capacities = {ward: beds for ward, beds in capacities.items() if ward != 'F'}
+urgency_points = {ward: int(points) for ward, points in zip(wards, scenario.urgency_points) if ward != 'F'}
 
 # Function to reallocate beds
 def reallocate_beds(initial_capacities, urgency_points, bed_capacity_F):
@@ -51,13 +41,16 @@ def reallocate_beds(initial_capacities, urgency_points, bed_capacity_F):
     return adjusted_capacities
 
 # Simulate the hospital with log-normal distribution
-def simulate_hospital_with_lognorm(days, adjusted_capacities, relocation_probs, variances):
+@cached_simulation
+def simulate_hospital_with_lognorm(days, adjusted_capacities, relocation_probs, variances, stay_distribution=None):
     ward_occupancy = {ward: 0 for ward in adjusted_capacities}
     total_admissions = {ward: 0 for ward in adjusted_capacities}
     total_relocations = {ward: 0 for ward in adjusted_capacities}
     total_losses = {ward: 0 for ward in adjusted_capacities}
     total_occupied_on_arrival = {ward: 0 for ward in adjusted_capacities}
     
+    stays = daily_stays(days, adjusted_capacities, mean_stay, variances, stay_distribution)
+    
     for day in range(days):
         for ward in adjusted_capacities:
             arrivals = np.random.poisson(arrival_rates[ward])
@@ -80,9 +73,7 @@ def simulate_hospital_with_lognorm(days, adjusted_capacities, relocation_probs,
                         total_losses[ward] += 1
 
             # Handle patient departures based on log-normal distribution
-            mean = np.log(mean_stay[ward]**2 / np.sqrt(variances[ward] + mean_stay[ward]**2))
-            sigma = np.sqrt(np.log(variances[ward] / mean_stay[ward]**2 + 1))
-            departures = np.random.poisson(ward_occupancy[ward] / lognorm.rvs(sigma, scale=np.exp(mean), size=1))
+            departures = np.random.poisson(ward_occupancy[ward] / stays[ward][day])
             ward_occupancy[ward] = max(0, ward_occupancy[ward] - departures)
     
     prob_all_beds_occupied = {ward: total_occupied_on_arrival[ward] / (total_admissions[ward] + total_occupied_on_arrival[ward]) 
@@ -103,13 +94,10 @@ optimal_bed_capacity = 27
 # Calculate adjusted capacities
 adjusted_capacities = reallocate_beds(initial_capacities, urgency_points, optimal_bed_capacity)
 
-# Update relocation probabilities
-relocation_probs_updated = update_relocation_probs(relocation_probs.copy())
-
 # Run simulations with different variances
-results_variances_1 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs_updated, variances_1)
-results_variances_2 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs_updated, variances_2)
-results_variances_3 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs_updated, variances_3)
+results_variances_1 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs, variances_1)
+results_variances_2 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs, variances_2)
+results_variances_3 = simulate_hospital_with_lognorm(365, adjusted_capacities, relocation_probs, variances_3)
 
 # Define a function to format the results
 def format_results(title, results):
@@ -119,10 +107,15 @@ def format_results(title, results):
     print(f"{'Ward':<5} {'Admissions':>12} {'Relocations':>12} {'Losses':>8} {'Occupancy':>10} {'Prob Full':>10} {'Exp Admissions':>15} {'Exp Relocations':>17}")
     print("-" * 90)
     for ward in wards:
-        occupancy = final_occupancy[ward][0] if isinstance(final_occupancy[ward], np.ndarray) else final_occupancy[ward]
-        print(f"{ward:<5} {total_admissions[ward]:>12} {total_relocations[ward]:>12} {total_losses[ward]:>8} {occupancy:>10} {prob_all_beds_occupied[ward]:>10.3f} {expected_admissions[ward]:>15.3f} {expected_relocations[ward]:>17.3f}")
+        print(f"{ward:<5} {total_admissions[ward]:>12} {total_relocations[ward]:>12} {total_losses[ward]:>8} {final_occupancy[ward]:>10} {prob_all_beds_occupied[ward]:>10.3f} {expected_admissions[ward]:>15.3f} {expected_relocations[ward]:>17.3f}")
 
 # Display results for each variance
 format_results("Results with variance 2/μ²", results_variances_1)
 format_results("Results with variance 3/μ²", results_variances_2)
-format_results("Results with variance 4/μ²", results_variances_3)
\ No newline at end of file
+format_results("Results with variance 4/μ²", results_variances_3)
+
+# The same run on the next-event model (hospital_model.py): continuous-time
+# arrivals and one log-normal length of stay per patient
+events_variances_1 = simulate_hospital_events(365, adjusted_capacities, relocation_probs, arrival_rates, mean_stay,
+                                              stay_sampler=LogNormal(mean_stay, variances_1).for_wards(adjusted_capacities), rng=42)
+format_results("Results with variance 2/μ² on the next-event model", events_variances_1)
@@ -0,0 +1,173 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from erlang_loss import overflow_fixed_point
+from replications import run_one, spawn_seeds
+from run_control import DailyHospital
+from scenarios import load_scenario, with_capacities
+
+# Search for the bed allocation that minimises the urgency-weighted losses
+# per day, sum_w urgency_w * losses_w, for a fixed total number of beds.
+# reallocate_beds only scales the initial capacities and hands out the rest
+# by urgency; here every integer allocation is a candidate:
+#
+#   1. greedy: start from no beds and add them one at a time to the ward
+#      where the next bed lowers the score most
+#   2. local search: move single beds between pairs of wards while that
+#      improves the score
+#   3. confirmation: the best allocations seen are simulated with parallel
+#      replications of DailyHospital, and the best simulated one is returned
+#
+# Steps 1 and 2 are scored with the Erlang fixed point of erlang_loss, which
+# solves all neighbours of an allocation in one vectorized call. A target
+# hospitalization rate for some wards (Ward F must admit 95 % of its patients
+# in Task 2) enters the score as a penalty on the shortfall. Both the
+# surrogate scores and the simulations are memoized by allocation, so no
+# allocation is ever scored or simulated twice.
+
+SHORTFALL_PENALTY = 1000.0
+
+
+def simulate_allocation(capacities, relocation_probs, arrival_rates, mean_stay, variances, days, warmup_days, rng=None):
+    """ Losses and hospitalization rate per ward of one DailyHospital run (runs in a worker process) """
+    model = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, variances, rng=rng)
+    model.run(warmup_days)
+    totals = {name: values.sum(axis=0) for name, values in model.run(days).items()}
+    return (totals['losses'] / days,
+            totals['admissions'] / np.maximum(totals['admissions'] + totals['losses'], 1))
+
+
+class BedAllocationOptimizer:
+    """ Surrogate-guided search over integer bed allocations with simulation in the loop """
+
+    def __init__(self, params, weights=None, min_hospitalization=None, variances=None):
+        # weights default to the urgency points of the scenario (0 for a ward
+        # without any); min_hospitalization maps wards to target rates, e.g.
+        # {'F': 0.95}. Given variances, the simulation draws log-normal
+        # lengths of stay as simulate_hospital_with_lognorm; the surrogate only
+        # uses the means
+        self.params = params
+        self.wards = params.wards
+        self.weights = np.asarray(params.urgency_points if weights is None else
+                                  [weights.get(ward, 0.0) for ward in self.wards], dtype=float)
+        self.targets = np.zeros(len(self.wards))
+        for ward, rate in (min_hospitalization or {}).items():
+            self.targets[self.wards.index(ward)] = rate
+        self.variances = variances
+        self.surrogate_cache = {}
+        self.simulation_cache = {}
+
+    def score(self, losses_per_day, hospitalization_rate):
+        """ Urgency-weighted losses per day plus the penalty on any hospitalization shortfall """
+        shortfall = np.maximum(self.targets - hospitalization_rate, 0.0)
+        return losses_per_day @ self.weights + SHORTFALL_PENALTY * shortfall.sum(axis=-1)
+
+    def surrogate(self, allocations):
+        """ Surrogate scores of a list of allocations (tuples of beds in ward order) """
+        missing = list(dict.fromkeys(a for a in allocations if a not in self.surrogate_cache))
+        if missing:
+            params = self.params
+            result = overflow_fixed_point(np.array(missing), params.arrival_rates, params.mean_stay,
+                                          params.relocation_probs)
+            scores = self.score(result['losses_per_day'], result['hospitalization_rate'])
+            self.surrogate_cache.update(zip(missing, scores.tolist()))
+        return [self.surrogate_cache[a] for a in allocations]
+
+    def greedy(self, total_beds):
+        """ Add beds one at a time where the surrogate score drops most """
+        allocation = (0,) * len(self.wards)
+        for _ in range(total_beds):
+            candidates = [allocation[:w] + (allocation[w] + 1,) + allocation[w + 1:] for w in range(len(allocation))]
+            scores = self.surrogate(candidates)
+            allocation = candidates[int(np.argmin(scores))]
+        return allocation
+
+    def local_search(self, allocation, max_steps=1000):
+        """ Best-improvement search over single bed moves between two wards """
+        current = self.surrogate([allocation])[0]
+        for _ in range(max_steps):
+            neighbours = []
+            for i in range(len(allocation)):
+                if allocation[i] == 0:
+                    continue
+                for j in range(len(allocation)):
+                    if j != i:
+                        moved = list(allocation)
+                        moved[i] -= 1
+                        moved[j] += 1
+                        neighbours.append(tuple(moved))
+            scores = self.surrogate(neighbours)
+            best = int(np.argmin(scores))
+            if scores[best] >= current:
+                break
+            allocation, current = neighbours[best], scores[best]
+        return allocation
+
+    def simulate(self, allocations, days=365, warmup_days=30, replications=10, seed=42, workers=None):
+        """ Simulated score (mean, half-width) of every allocation, running only the ones not simulated yet """
+        # Every allocation uses the same replication seeds (common random
+        # numbers), so differences between allocations are not drowned in noise
+        missing = list(dict.fromkeys(a for a in allocations if a not in self.simulation_cache))
+        seeds = spawn_seeds(seed, replications)
+        tasks = []
+        for allocation in missing:
+            capacities, relocation_probs, arrival_rates, mean_stay = with_capacities(self.params, allocation).as_dicts()
+            args = (capacities, relocation_probs, arrival_rates, mean_stay, self.variances, days, warmup_days)
+            tasks += [(simulate_allocation, args, {}, child, False) for child in seeds]
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(tasks) <= 1:
+            runs = [run_one(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                runs = list(pool.map(run_one, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+        for k, allocation in enumerate(missing):
+            losses, rates = (np.array(values) for values in zip(*runs[k * replications:(k + 1) * replications]))
+            scores = self.score(losses, rates)
+            half_width = 1.96 * scores.std(ddof=1) / np.sqrt(replications) if replications > 1 else np.nan
+            self.simulation_cache[allocation] = {
+                'score': float(scores.mean()), 'score_hw': float(half_width),
+                'losses_per_day': losses.mean(axis=0), 'hospitalization_rate': rates.mean(axis=0),
+            }
+        return [self.simulation_cache[a] for a in allocations]
+
+    def optimize(self, total_beds, confirm=5, start=None, **simulation):
+        """ Greedy start, local search, then simulation of the `confirm` best allocations seen """
+        # start overrides the greedy start, e.g. with the reallocate_beds
+        # allocation of the Task scripts; it must hold total_beds beds
+        if start is None:
+            start = self.greedy(total_beds)
+        elif sum(start) != total_beds:
+            raise ValueError(f"The start allocation has {sum(start)} beds, not {total_beds}")
+        best = self.local_search(tuple(int(beds) for beds in start))
+
+        # Candidates for confirmation: the best-scoring allocations with the
+        # right total among everything the search has scored
+        seen = [a for a in self.surrogate_cache if sum(a) == total_beds]
+        candidates = sorted(seen, key=self.surrogate_cache.get)[:confirm]
+        if best not in candidates:
+            candidates[-1:] = [best]
+        results = self.simulate(candidates, **simulation)
+
+        table = pd.DataFrame([dict(zip(self.wards, a), surrogate=self.surrogate_cache[a],
+                                   simulated=r['score'], simulated_hw=r['score_hw'])
+                              for a, r in zip(candidates, results)]).sort_values('simulated', ignore_index=True)
+        allocation = tuple(int(table.loc[0, ward]) for ward in self.wards)
+        return {'allocation': dict(zip(self.wards, allocation)), 'candidates': table,
+                **self.simulation_cache[allocation]}
+
+
+if __name__ == '__main__':
+    # Task 2: Ward F must admit 95 % of its patients; all 180 beds are placed
+    # to keep the urgency-weighted losses of the other wards low
+    params = load_scenario('new_ward')
+    optimizer = BedAllocationOptimizer(params, min_hospitalization={'F': 0.95})
+    result = optimizer.optimize(int(params.capacities.sum()), replications=10, days=365)
+    print(result['candidates'])
+    print(f"Best allocation: {result['allocation']}")
+    print(f"Urgency-weighted losses per day: {result['score']:.3f} +/- {result['score_hw']:.3f}")
+    print(f"Scored {len(optimizer.surrogate_cache)} allocations, simulated {len(optimizer.simulation_cache)}")
@@ -0,0 +1,122 @@
+import functools
+
+import numpy as np
+from scipy.stats import t as student_t
+
+from erlang_loss import erlang_b, servers_for_blocking
+from variance_reduction import estimate
+
+# Search for the smallest bed capacity of one ward (Ward F in Task2.py and
+# Task3.py) whose simulated hospitalization rate meets a target. The bracket
+# comes from the analytic side:
+#
+#   - upper: the Erlang-B capacity for blocking 1 - target, which ignores
+#     relocation and so should meet the target;
+#   - lower: the largest capacity that misses the target even if every
+#     relocation attempt of the ward fails, since a fraction prod(1 - p_j) of
+#     its blocked patients is lost whatever the other wards do.
+#
+# The bracket is widened when the simulation disagrees and then bisected.
+# Every capacity is evaluated with common random numbers, either
+#
+#   - evaluate_with_crn: replication r reseeds the global np.random state with
+#     seed + r, as the Task scripts draw from it, or
+#   - evaluate_with_variance_reduction: antithetic pairs, with the control
+#     variates of the replication if it has any (variance_reduction.py), on
+#     the same seeds for every capacity,
+#
+# and replications stop once the t confidence interval lies on one side of
+# the target or is narrower than the tolerance.
+
+
+def evaluate_with_crn(replicate, target_rate, seed, min_replications=2, max_replications=10, tolerance=0.002):
+    """ (mean rate, replications, extras) of replicate() -> (rate, extra), reseeded with seed + r """
+    rates, extras = [], []
+    for r in range(max_replications):
+        np.random.seed(seed + r)
+        rate, extra = replicate()
+        rates.append(rate)
+        extras.append(extra)
+        if len(rates) >= min_replications:
+            half_width = student_t.ppf(0.975, len(rates) - 1) * np.std(rates, ddof=1) / np.sqrt(len(rates))
+            if abs(np.mean(rates) - target_rate) > half_width or half_width < tolerance:
+                break
+    return np.mean(rates), len(rates), extras
+
+
+def evaluate_with_variance_reduction(replication, output, target_rate, seed, min_runs=4, max_runs=20,
+                                     tolerance=0.002):
+    """ (estimate, runs, variance_reduction.Estimate) of one output of a variance_reduction replication """
+    # One antithetic pair is added at a time. The runs already done are kept:
+    # run r always gets child r of the seed, so estimate() only simulates the
+    # new pair
+    done = {}
+
+    @functools.wraps(replication)
+    def kept(rng):
+        key = (rng.bit_generator.seed_seq.spawn_key, rng.antithetic)
+        if key not in done:
+            done[key] = replication(rng)
+        return done[key]
+
+    runs = min_runs
+    while True:
+        try:
+            result = estimate(kept, runs, seed, antithetic=True, controls=True)[output]
+        except ValueError:
+            # Too few pairs for the controls of the output: the runs are
+            # kept, so adding a pair costs one pair only
+            if runs >= max_runs:
+                raise
+            runs += 2
+            continue
+        if abs(result.mean - target_rate) > result.half_width or result.half_width < tolerance or runs >= max_runs:
+            return result.mean, len(done), result
+        runs += 2
+
+
+def analytic_bracket(arrival_rate, mean_stay, relocation_row, target_rate, max_capacity=100):
+    """ (lower, upper) capacities from Erlang-B, lower missing the target and upper expected to meet it """
+    load = arrival_rate * mean_stay
+    upper = min(int(servers_for_blocking(load, 1 - target_rate)), max_capacity)
+    never_relocated = np.prod([1 - p for p in relocation_row])
+    capacities = np.arange(1, upper)
+    missing = capacities[erlang_b(capacities, load) * never_relocated > 1 - target_rate]
+    return int(missing.max()) if len(missing) else 0, upper
+
+
+def find_minimum_capacity(evaluate, lower, upper, target_rate, max_capacity=100):
+    """ (capacity, evaluations by capacity) of the smallest capacity with evaluate(capacity)[0] >= target_rate """
+    # evaluate(capacity) returns a tuple that starts (rate, replications);
+    # every capacity is evaluated at most once. The capacity is None when
+    # even max_capacity misses the target
+    evaluations = {}
+
+    def is_feasible(capacity):
+        if capacity not in evaluations:
+            evaluations[capacity] = evaluate(capacity)
+        return evaluations[capacity][0] >= target_rate
+
+    # Widen the bracket if the simulation disagrees with the analytic guesses
+    step = 1
+    while not is_feasible(upper):
+        lower, upper, step = upper, min(max_capacity, upper + step), 2 * step
+        if lower == max_capacity:
+            return None, evaluations
+    step = 1
+    while lower > 0 and is_feasible(lower):
+        lower, upper, step = max(0, lower - step), lower, 2 * step
+
+    # Bisection for the smallest capacity that meets the target
+    while upper - lower > 1:
+        middle = (lower + upper) // 2
+        if is_feasible(middle):
+            upper = middle
+        else:
+            lower = middle
+    return upper, evaluations
+
+
+def simulated_replications(evaluations):
+    """ Replications run over all evaluated capacities """
+    return sum(evaluation[1] for evaluation in evaluations.values())
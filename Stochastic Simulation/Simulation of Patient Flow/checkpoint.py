@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+# Snapshots of long runs, so a run interrupted at any point (a preempted
+# machine, a killed job) continues from its last snapshot instead of from the
+# start. A model hands over its state as (arrays, meta): NumPy arrays such as
+# the occupancy and the patients in a bed, and small picklable values such as
+# counters and the bit generator state of its np.random.Generator.
+#
+# A snapshot is one compressed .npz file; meta is pickled into one of its
+# members, so only load snapshots you wrote yourself. Writes go to a temporary
+# file in the same directory that replaces the snapshot only once it is
+# complete and flushed to disk, so a crash during a write leaves the previous
+# snapshot intact.
+#
+# A resumed run draws exactly the random numbers the uninterrupted run would
+# have drawn, so its results are identical bit for bit, as long as the
+# snapshot interval is the same (DailyHospital draws its arrivals one run()
+# call at a time).
+
+META = '__meta__'
+
+
+class Checkpoint:
+    """ One snapshot file, written atomically """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self, arrays, meta):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        members = dict(arrays)
+        members[META] = np.frombuffer(pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                np.savez_compressed(file, **members)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def load(self):
+        """ (arrays, meta) of the snapshot """
+        with open(self.path, 'rb') as file:
+            content = io.BytesIO(file.read())
+        with np.load(content) as snapshot:
+            arrays = {name: snapshot[name] for name in snapshot.files if name != META}
+            meta = pickle.loads(snapshot[META].tobytes())
+        return arrays, meta
+
+    def remove(self):
+        if self.exists():
+            os.unlink(self.path)
+
+
+def fingerprint(*arrays):
+    """ Hash of the parameters of a model, to refuse resuming a snapshot of another model """
+    digest = hashlib.sha256()
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        digest.update(str((values.dtype, values.shape)).encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def check_fingerprint(meta, expected, model):
+    if meta.get('model') != model or meta.get('fingerprint') != expected:
+        raise ValueError(f"The snapshot is not of this {model}: its parameters differ")
+
+
+def run_days_with_checkpoints(model, days, checkpoint, interval=365):
+    """ Totals per ward of `days` days of a DailyHospital, snapshotting every `interval` days """
+    # The totals (arrivals, admissions, relocations, losses and
+    # occupied_on_arrival summed over the days) are part of the snapshot; a
+    # snapshot of a finished run just returns them
+    checkpoint = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+    totals = None
+    if checkpoint.exists():
+        arrays, meta = checkpoint.load()
+        model.set_state({name: arrays[name] for name in ('occupancy',)}, meta)
+        totals = {name[len('total_'):]: arrays[name] for name in arrays if name.startswith('total_')} or None
+    while model.day < days:
+        daily = model.run(min(interval, days - model.day))
+        step = {name: values.sum(axis=0) for name, values in daily.items() if name != 'occupancy'}
+        totals = step if totals is None else {name: totals[name] + step[name] for name in step}
+        arrays, meta = model.get_state()
+        arrays.update({f'total_{name}': values for name, values in totals.items()})
+        checkpoint.save(arrays, meta)
+    return totals
+
+
+def advance_with_checkpoints(model, until, checkpoint, interval=365.0):
+    """ Advance a HospitalModel to time `until`, snapshotting every `interval` days """
+    # advance() gives the same events however the horizon is split, so the
+    # result equals one uninterrupted advance(until) whatever the interval
+    checkpoint = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+    if checkpoint.exists():
+        model.set_state(*checkpoint.load())
+    while model.time < until:
+        model.advance(min(model.time + interval, until))
+        checkpoint.save(*model.get_state())
+    return model
+
+
+def replications_with_checkpoints(capacities, relocation_probs, arrival_rates, mean_stay, days, replications,
+                                  checkpoint, variances=None, seed=42, interval=365):
+    """ Totals of independent DailyHospital replications, as arrays (replications, wards), resumable """
+    # The finished replications are kept in `checkpoint`, the one in progress
+    # in a second snapshot next to it. That one is removed before the
+    # finished list grows, so after a crash in between the replication is run
+    # again from its seed, with the same result
+    from run_control import DailyHospital  # run_control imports this module
+
+    checkpoint = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+    current = Checkpoint(checkpoint.path + '.current')
+    finished, done = {}, 0
+    if checkpoint.exists():
+        finished, meta = checkpoint.load()
+        done = meta['replications']
+
+    children = np.random.SeedSequence(seed).spawn(replications)
+    for r in range(done, replications):
+        model = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, variances, rng=children[r])
+        totals = run_days_with_checkpoints(model, days, current, interval)
+        finished = {name: np.vstack((finished[name], values)) if name in finished else values[None]
+                    for name, values in totals.items()}
+        current.remove()
+        checkpoint.save(finished, {'replications': r + 1})
+    return finished
@@ -0,0 +1,177 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# Per-entity event traces of long runs, for analyses the aggregate counters
+# cannot give (length of stay histograms, relocation chains, the path of every
+# car). A trace is a binary file of fixed-width records
+#
+#     time      f8  simulation time (days for the hospital, hours for the queues)
+#     entity    i8  patient or car number, in arrival order from 0
+#     location  i4  ward index or stage index
+#     event     i4  index into EVENTS
+#
+# after a header of HEADER_SIZE bytes with the record count and a JSON mapping
+# (the event names, the ward or stage names of the run). The writer grows the
+# file `chunk_records` records at a time and copies records into a memory map
+# of it, so appending costs no system call per event, and the count in the
+# header is only raised once the records before it are written: a trace cut
+# short by a crash reads as the events up to its last flush. The reader maps
+# the records as a read-only NumPy structured array without loading them, so
+# a trace of 10^8 events (2.4 GB) can be sliced and reduced chunk by chunk:
+#
+#     with TraceWriter('run.trace', meta={'wards': wards}) as trace:
+#         HospitalModel(..., trace=trace).run(3650)
+#     records, meta = read_trace('run.trace')
+#     stays = length_of_stay(records)
+
+MAGIC = b'SIMTRACE'
+VERSION = 1
+HEADER_SIZE = 4096
+COUNT_OFFSET = len(MAGIC) + 4  # the record count (u8) follows the magic and the version (u4)
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('entity', '<i8'), ('location', '<i4'), ('event', '<i4')])
+EVENTS = ('arrival', 'admission', 'blocked', 'relocation', 'loss', 'discharge', 'stage_entry', 'service_start',
+          'stage_exit')
+EVENT_CODES = {name: code for code, name in enumerate(EVENTS)}
+
+
+class TraceWriter:
+    """ Append-only trace file, written through a memory map in chunks of `chunk_records` records """
+
+    def __init__(self, path, meta=None, chunk_records=2**20):
+        self.path = os.fspath(path)
+        self.chunk_records = chunk_records
+        self.count = 0
+        self.capacity = 0
+        self.map = None
+        self.pending = []  # tuples from append(), written in batches
+        meta = dict(meta or {}, events=list(EVENTS), dtype=EVENT_DTYPE.descr)
+        encoded = json.dumps(meta).encode()
+        header = MAGIC + struct.pack('<IQI', VERSION, 0, len(encoded)) + encoded
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"The trace metadata takes {len(encoded)} bytes, more than the header holds")
+        self.file = open(self.path, 'w+b')
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def reserve(self, n):
+        """ Grow the file, in whole chunks, to hold n more records """
+        needed = self.count + n
+        if needed <= self.capacity:
+            return
+        self.capacity = -(-needed // self.chunk_records) * self.chunk_records
+        self.unmap()
+        self.file.truncate(HEADER_SIZE + self.capacity * EVENT_DTYPE.itemsize)
+        self.map = np.memmap(self.file, dtype=EVENT_DTYPE, mode='r+', offset=HEADER_SIZE, shape=(self.capacity,))
+
+    def unmap(self):
+        """ Flush and close the memory map, so the file can be resized on every platform """
+        if self.map is not None:
+            self.map.flush()
+            # Windows refuses to truncate a file that is still mapped, and
+            # dropping the array alone leaves closing the map to the garbage
+            # collector
+            self.map._mmap.close()
+            self.map = None
+
+    def append(self, time, entity, location, event):
+        """ One event; event is a name of EVENTS or its code """
+        self.pending.append((time, entity, location, EVENT_CODES.get(event, event)))
+        if len(self.pending) >= 65536:
+            self.append_records(self.pending)
+            self.pending = []
+
+    def append_records(self, records):
+        """ A list of (time, entity, location, event code) tuples """
+        if records:
+            self.append_array(np.array(records, dtype=EVENT_DTYPE))
+
+    def append_many(self, time, entity, location, event):
+        """ Events as arrays (scalars are broadcast); event is a name of EVENTS or an array of codes """
+        if isinstance(event, str):
+            event = EVENT_CODES[event]
+        time, entity, location, event = np.broadcast_arrays(time, entity, location, event)
+        records = np.empty(time.shape, dtype=EVENT_DTYPE)
+        records['time'], records['entity'], records['location'], records['event'] = time, entity, location, event
+        self.append_array(records.ravel())
+
+    def append_array(self, records):
+        """ A structured array of EVENT_DTYPE """
+        if self.pending:
+            pending, self.pending = self.pending, []
+            self.append_records(pending)
+        n = len(records)
+        self.reserve(n)
+        self.map[self.count:self.count + n] = records
+        self.count += n
+
+    def flush(self):
+        """ Write the records so far and the count to disk """
+        if self.pending:
+            pending, self.pending = self.pending, []
+            self.append_records(pending)
+        if self.map is not None:
+            self.map.flush()
+        self.file.seek(COUNT_OFFSET)
+        self.file.write(struct.pack('<Q', self.count))
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.unmap()
+        self.file.truncate(HEADER_SIZE + self.count * EVENT_DTYPE.itemsize)
+        self.file.close()
+
+    def __len__(self):
+        return self.count + len(self.pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_trace(path):
+    """ (records, meta): the records as a read-only memory-mapped structured array, and the header mapping """
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a trace file")
+    version, count, meta_size = struct.unpack_from('<IQI', header, len(MAGIC))
+    if version != VERSION:
+        raise ValueError(f"{path} is a version {version} trace, this reader reads version {VERSION}")
+    meta = json.loads(header[len(MAGIC) + 16:len(MAGIC) + 16 + meta_size])
+    if count == 0:
+        return np.empty(0, dtype=EVENT_DTYPE), meta
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,)), meta
+
+
+def chunks(records, size=2**22):
+    """ Consecutive slices of a trace, each a view of at most `size` records """
+    for start in range(0, len(records), size):
+        yield records[start:start + size]
+
+
+def length_of_stay(records, chunk_size=2**22):
+    """ (location, stay) of every patient discharged in a hospital trace """
+    # Patients are numbered in arrival order, so one array indexed by patient
+    # number holds the admission times; the trace itself is read a chunk at
+    # a time
+    n_entities = 0
+    for chunk in chunks(records, chunk_size):
+        if len(chunk):
+            n_entities = max(n_entities, int(chunk['entity'].max()) + 1)
+    admitted = np.full(n_entities, np.nan)
+    locations, stays = [], []
+    placed = (EVENT_CODES['admission'], EVENT_CODES['relocation'])
+    for chunk in chunks(records, chunk_size):
+        is_placed = np.isin(chunk['event'], placed)
+        admitted[chunk['entity'][is_placed]] = chunk['time'][is_placed]
+        discharged = chunk[chunk['event'] == EVENT_CODES['discharge']]
+        locations.append(discharged['location'])
+        stays.append(discharged['time'] - admitted[discharged['entity']])
+    return np.concatenate(locations or [np.empty(0, np.int32)]), np.concatenate(stays or [np.empty(0)])
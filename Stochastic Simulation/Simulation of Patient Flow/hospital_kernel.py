@@ -0,0 +1,284 @@
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+from profiling import relocation_attempts
+from relocation import RelocationSampler
+from scenarios import load_scenario
+from vectorized_hospital import to_arrays, simulate_hospital_batch
+
+try:
+    import numba
+except ImportError:  # the 'numba' backend is unavailable, 'arrays' runs the same loop uncompiled
+    numba = None
+
+# One entry point for the day-based hospital model of Task1.py to Task4
+# (simulate_hospital_with_new_ward / simulate_hospital_with_lognorm) with a
+# choice of backend:
+#
+#     'python'  the loop of the Task scripts over dicts keyed by ward letter,
+#               kept as the reference
+#     'alias'   that loop with the overflow of each ward and day routed by
+#               relocation.RelocationSampler, one uniform per patient
+#     'numba'   the same loop over integer-indexed arrays, compiled with Numba
+#     'arrays'  that loop uncompiled, for when Numba is not installed
+#     'numpy'   simulate_hospital_batch, all replications advanced together;
+#               exponential stays only
+#     'auto'    'numba' when Numba is installed, 'arrays' otherwise
+#
+# All backends return (wards, admissions, relocations, losses, occupancy,
+# occupied_on_arrival) with one row per replication, as simulate_hospital_batch.
+# Each backend draws its random numbers differently, so the results agree in
+# distribution, not number by number; parity_check compares them.
+
+BACKENDS = ('auto', 'python', 'alias', 'numba', 'arrays', 'numpy')
+
+
+def simulate_hospital_reference(days, capacities, relocation_probs, arrival_rates, mean_stay, stays=None, rng=None,
+                                profile=None, relocation_sampler=None):
+    """ One run of the Task script loop; stays[day][ward] overrides mean_stay in the departures """
+    # With a profiling.RunProfile the events are counted and the Poisson
+    # draws, the relocation walks and the departures are timed separately. With a
+    # relocation.RelocationSampler built for the same capacities and
+    # relocation_probs, the overflow of a ward is routed by its alias tables
+    # instead of the walk
+    rng = np.random.default_rng(rng)
+    timed = profile is not None
+    clock = time.perf_counter
+    arrival_time = relocation_time = departure_time = 0.0
+    departures_total = 0
+    loop_start = clock() if timed else 0.0
+    wards = list(capacities.keys())
+    ward_occupancy = {ward: 0 for ward in wards}
+    total_admissions = {ward: 0 for ward in wards}
+    total_relocations = {ward: 0 for ward in wards}
+    total_losses = {ward: 0 for ward in wards}
+    total_occupied_on_arrival = {ward: 0 for ward in wards}
+
+    for day in range(days):
+        for ward in wards:
+            if timed:
+                start = clock()
+                arrivals = rng.poisson(arrival_rates[ward])
+                arrival_time += clock() - start
+            else:
+                arrivals = rng.poisson(arrival_rates[ward])
+            if relocation_sampler is not None:
+                if timed:
+                    start = clock()
+                overflow, lost = relocation_sampler.route(ward, arrivals, ward_occupancy, capacities, total_admissions,
+                                                          total_relocations, rng)
+                total_occupied_on_arrival[ward] += overflow
+                total_losses[ward] += lost
+                if timed:
+                    relocation_time += clock() - start
+                arrivals = 0
+            for _ in range(arrivals):
+                if ward_occupancy[ward] < capacities[ward]:
+                    ward_occupancy[ward] += 1
+                    total_admissions[ward] += 1
+                else:
+                    total_occupied_on_arrival[ward] += 1
+                    relocated = False
+                    if timed:
+                        start = clock()
+                    for j, prob in enumerate(relocation_probs[ward]):
+                        if rng.random() < prob:
+                            alt_ward = wards[j]
+                            if ward_occupancy[alt_ward] < capacities[alt_ward]:
+                                ward_occupancy[alt_ward] += 1
+                                total_relocations[alt_ward] += 1
+                                relocated = True
+                                break
+                    if timed:
+                        relocation_time += clock() - start
+                    if not relocated:
+                        total_losses[ward] += 1
+
+            stay = mean_stay[ward] if stays is None else stays[day][wards.index(ward)]
+            if timed:
+                start = clock()
+                departures = rng.poisson(ward_occupancy[ward] / stay)
+                departures_total += min(departures, ward_occupancy[ward])
+                departure_time += clock() - start
+            else:
+                departures = rng.poisson(ward_occupancy[ward] / stay)
+            ward_occupancy[ward] = max(0, ward_occupancy[ward] - departures)
+
+    if timed:
+        loop = profile.stack + ('day_loop',)
+        profile.add_time(loop, clock() - loop_start)
+        profile.add_time(loop + ('arrival_draws',), arrival_time, days * len(wards))
+        profile.add_time(loop + ('relocation',), relocation_time, sum(total_occupied_on_arrival.values()))
+        profile.add_time(loop + ('departure_draws',), departure_time, days * len(wards))
+        admitted, relocated, lost = (sum(counts.values()) for counts in (total_admissions, total_relocations, total_losses))
+        profile.count_many({'arrivals': admitted + relocated + lost, 'admissions': admitted,
+                            'overflows': sum(total_occupied_on_arrival.values()),
+                            'relocation_attempts': relocation_attempts(
+                                [total_relocations[ward] for ward in wards], lost),
+                            'relocations': relocated, 'losses': lost, 'departures': departures_total})
+
+    return tuple(np.array([counts[ward] for ward in wards]) for counts in
+                 (total_admissions, total_relocations, total_losses, ward_occupancy, total_occupied_on_arrival))
+
+
+def hospital_day_loop(days, caps, rates, stays, probs, seed):
+    """ The Task script loop over arrays: stays is (days, wards), probs[ward, target ward] """
+    # Written in the subset of Python that Numba compiles; the random numbers
+    # come from Numba's own generator, seeded here
+    np.random.seed(seed)
+    n_wards = len(caps)
+    occupancy = np.zeros(n_wards, dtype=np.int64)
+    admissions = np.zeros(n_wards, dtype=np.int64)
+    relocations = np.zeros(n_wards, dtype=np.int64)
+    losses = np.zeros(n_wards, dtype=np.int64)
+    occupied_on_arrival = np.zeros(n_wards, dtype=np.int64)
+
+    for day in range(days):
+        for w in range(n_wards):
+            arrivals = np.random.poisson(rates[w])
+            for _ in range(arrivals):
+                if occupancy[w] < caps[w]:
+                    occupancy[w] += 1
+                    admissions[w] += 1
+                else:
+                    occupied_on_arrival[w] += 1
+                    relocated = False
+                    for j in range(n_wards):
+                        if np.random.random() < probs[w, j]:
+                            if occupancy[j] < caps[j]:
+                                occupancy[j] += 1
+                                relocations[j] += 1
+                                relocated = True
+                                break
+                    if not relocated:
+                        losses[w] += 1
+
+            departures = np.random.poisson(occupancy[w] / stays[day, w])
+            occupancy[w] = max(0, occupancy[w] - departures)
+
+    return admissions, relocations, losses, occupancy, occupied_on_arrival
+
+
+compiled_day_loop = numba.njit(cache=True)(hospital_day_loop) if numba is not None else None
+
+
+def uncompiled_day_loop(days, caps, rates, stays, probs, seed):
+    """ hospital_day_loop in plain Python, leaving the global np.random state as it was """
+    # Compiled, the loop seeds Numba's generator; uncompiled it would reseed
+    # the global state the Task scripts draw from
+    state = np.random.get_state()
+    try:
+        return hospital_day_loop(days, caps, rates, stays, probs, seed)
+    finally:
+        np.random.set_state(state)
+
+
+def daily_stays(days, stays, variances, wards, rng):
+    """ Length of stay per day and ward: the means, or one log-normal draw per day as simulate_hospital_with_lognorm """
+    if variances is None:
+        return np.tile(stays, (days, 1))
+    variances = np.array([variances[ward] for ward in wards], dtype=float)
+    sigma = np.sqrt(np.log(variances / stays**2 + 1))
+    return rng.lognormal(np.log(stays) - sigma**2 / 2, sigma, size=(days, len(wards)))
+
+
+def resolve_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == 'auto':
+        return 'numba' if numba is not None else 'arrays'
+    if backend == 'numba' and numba is None:
+        raise ImportError("The 'numba' backend needs Numba installed; use backend='arrays' or 'auto'")
+    return backend
+
+
+def simulate_hospital(days, capacities, relocation_probs, arrival_rates, mean_stay, replications=1, variances=None,
+                      seed=42, backend='auto', profile=None):
+    """ `replications` independent runs of the day-based hospital model on the chosen backend """
+    # A profiling.RunProfile gets the time of every backend call and, for the
+    # compiled and batched backends, the event counts from their totals; the
+    # python and alias backends also time and count inside the day loop
+    backend = resolve_backend(backend)
+
+    def phase(name):
+        return profile.phase(name) if profile is not None else nullcontext()
+
+    if backend == 'numpy':
+        if variances is not None:
+            raise ValueError("The 'numpy' backend draws exponential stays only; use 'auto', 'numba', 'arrays', "
+                             "'alias' or 'python' for variances")
+        with phase('numpy_batch'):
+            results = simulate_hospital_batch(days, replications, capacities, relocation_probs, arrival_rates,
+                                              mean_stay, rng=seed)
+        count_totals(profile, results[1], results[2], results[3], results[5])
+        return results
+
+    wards, caps, rates, stays, probs = to_arrays(capacities, relocation_probs, arrival_rates, mean_stay)
+    # The alias tables are built once for all replications
+    sampler = RelocationSampler(capacities, relocation_probs) if backend == 'alias' else None
+    runs = []
+    for child in np.random.SeedSequence(seed).spawn(replications):
+        rng = np.random.default_rng(child)
+        with phase('stay_draws'):
+            daily = daily_stays(days, stays, variances, wards, rng)
+        if backend in ('python', 'alias'):
+            runs.append(simulate_hospital_reference(days, capacities, relocation_probs, arrival_rates, mean_stay,
+                                                    stays=daily, rng=rng, profile=profile, relocation_sampler=sampler))
+        else:
+            day_loop = compiled_day_loop if backend == 'numba' else uncompiled_day_loop
+            with phase(backend + '_kernel'):
+                runs.append(day_loop(days, caps, rates, daily, probs, int(child.generate_state(1)[0])))
+    results = (wards,) + tuple(np.array(values) for values in zip(*runs))
+    if backend not in ('python', 'alias'):
+        count_totals(profile, results[1], results[2], results[3], results[5])
+    return results
+
+
+def count_totals(profile, admissions, relocations, losses, occupied_on_arrival):
+    """ Event counts from the totals of a compiled or batched run """
+    if profile is not None:
+        admitted, relocated, lost = int(admissions.sum()), int(relocations.sum()), int(losses.sum())
+        profile.count_many({'arrivals': admitted + relocated + lost, 'admissions': admitted,
+                            'overflows': int(occupied_on_arrival.sum()),
+                            'relocation_attempts': relocation_attempts(relocations, lost),
+                            'relocations': relocated, 'losses': lost})
+
+
+def parity_check(days=365, replications=100, backends=None, seed=42, alpha=0.01):
+    """ Two-sample KS tests of every backend against 'python' on the new_ward scenario; returns a DataFrame """
+    # Compares the per-replication totals of admissions, relocations and
+    # losses of every ward. With many tests at level alpha a few rejections
+    # are expected by chance; a backend that differs in the model fails
+    # nearly all of them
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    if backends is None:
+        backends = ['alias', 'numpy', 'arrays'] + (['numba'] if numba is not None else [])
+    reference = simulate_hospital(days, capacities, relocation_probs, arrival_rates, mean_stay, replications,
+                                  seed=seed, backend='python')
+    rows = []
+    for backend in backends:
+        result = simulate_hospital(days, capacities, relocation_probs, arrival_rates, mean_stay, replications,
+                                   seed=seed + 1, backend=backend)
+        for k, name in ((1, 'admissions'), (2, 'relocations'), (3, 'losses')):
+            for i, ward in enumerate(reference[0]):
+                test = ks_2samp(reference[k][:, i], result[k][:, i])
+                rows.append({'backend': backend, 'metric': name, 'ward': ward,
+                             'python_mean': reference[k][:, i].mean(), 'backend_mean': result[k][:, i].mean(),
+                             'p_value': test.pvalue, 'rejected': test.pvalue < alpha})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    checks = parity_check()
+    print(checks.to_string(index=False))
+    print(f"{checks['rejected'].sum()} of {len(checks)} KS tests rejected at level 0.01")
+
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    for backend in ['python', 'alias', 'arrays', 'numpy'] + (['numba'] if numba is not None else []):
+        start = time.perf_counter()
+        simulate_hospital(365, capacities, relocation_probs, arrival_rates, mean_stay, 100, backend=backend)
+        print(f"{backend}: {time.perf_counter() - start:.2f} s for 100 years")
@@ -0,0 +1,341 @@
+import heapq
+from array import array
+from bisect import bisect_right
+from time import perf_counter
+
+import numpy as np
+
+from checkpoint import fingerprint, check_fingerprint
+from event_trace import EVENT_CODES
+from profiling import relocation_attempts
+from vectorized_hospital import to_arrays, relocation_outcome_probs
+
+# Next-event version of the patient flow model. Arrivals to each ward form a
+# Poisson process in continuous time (rate per day), every admitted patient
+# gets an individual length of stay and is discharged at exactly that time.
+# The event calendar is a binary heap of (discharge time, patient slot). The
+# superposition of the ward arrival processes is one Poisson process whose
+# arrivals are generated in blocks (time, ward, length of stay, relocation
+# uniform), so the next arrival never has to go through the heap.
+
+
+class PatientStore:
+    """ Array-backed store for the patients currently in a bed, with slot reuse """
+    __slots__ = ('ward', 'patient_type', 'admitted', 'patient', 'free')
+
+    def __init__(self, size=1024):
+        self.ward = array('i', bytes(4 * size))
+        self.patient_type = array('i', bytes(4 * size))
+        self.admitted = array('d', bytes(8 * size))
+        self.patient = array('q', bytes(8 * size))  # patient number, kept when tracing
+        # Free slots are handed out from the end, lowest slot first
+        self.free = list(range(size - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.ward) - len(self.free)
+
+    def grow(self):
+        """ Double the number of slots """
+        size = len(self.ward)
+        self.ward.extend(array('i', bytes(4 * size)))
+        self.patient_type.extend(array('i', bytes(4 * size)))
+        self.admitted.extend(array('d', bytes(8 * size)))
+        self.patient.extend(array('q', bytes(8 * size)))
+        self.free[:0] = range(2 * size - 1, size - 1, -1)
+
+    def as_array(self):
+        """ Structured NumPy copy of all slots (free slots included) """
+        records = np.zeros(len(self.ward), dtype=[('ward', 'i4'), ('patient_type', 'i4'), ('admitted', 'f8'),
+                                                 ('patient', 'i8')])
+        records['ward'] = self.ward
+        records['patient_type'] = self.patient_type
+        records['admitted'] = self.admitted
+        records['patient'] = self.patient
+        return records
+
+
+def exponential_stay(mean_stay):
+    """ Exponential length of stay sampler for the given per-ward means """
+    def sampler(rng, ward, size):
+        return rng.exponential(mean_stay[ward], size)
+    return sampler
+
+
+class HospitalModel:
+    """ Discrete-event hospital with per-patient length of stay """
+
+    def __init__(self, capacities, relocation_probs, arrival_rates, mean_stay, stay_sampler=None,
+                 rng=None, block_size=8192, stats=None, profile=None, trace=None):
+        self.wards, self.caps, self.rates, self.stays, self.probs = to_arrays(
+            capacities, relocation_probs, arrival_rates, mean_stay)
+        # stay_sampler(rng, ward_index, size) returns `size` lengths of stay
+        # for patients of that ward; relocated patients keep their own ward's
+        # length of stay
+        self.stay_sampler = stay_sampler or exponential_stay(dict(enumerate(self.stays)))
+        self.rng = np.random.default_rng(rng)
+        self.block_size = block_size
+        # Optional streaming collector (streaming_stats.HospitalStats) that
+        # is told about every admission, loss and discharge as it happens
+        self.stats = stats
+        # Optional profiling.RunProfile: event counts per advance() and the
+        # time spent drawing arrival blocks versus processing events
+        self.profile = profile
+        # Optional event_trace.TraceWriter that gets a record of every
+        # admission, overflow (blocked, then relocation or loss) and discharge,
+        # with the patients numbered in arrival order
+        self.trace = trace
+        # Relocation outcome CDFs indexed by [ward][free-ward bit mask], as in
+        # simulate_hospital_batch: one uniform decides where an overflow
+        # patient goes, with the same probabilities as walking the row
+        n_wards = len(self.wards)
+        self.outcome_cdf = [[list(row) for row in np.cumsum(outcome, axis=1)[:, :n_wards]]
+                            for outcome in relocation_outcome_probs(self.probs)]
+        self.reset()
+
+    def reset(self):
+        """ Empty hospital at time 0 """
+        n_wards = len(self.wards)
+        self.time = 0.0
+        self.events = 0
+        self.arrived = 0
+        # Occupancy never exceeds the total number of beds
+        self.patients = PatientStore(max(1, int(self.caps.sum())))
+        self.calendar = []
+        self.ward_occupancy = [0] * n_wards
+        self.total_admissions = [0] * n_wards
+        self.total_relocations = [0] * n_wards
+        self.total_losses = [0] * n_wards
+        self.total_occupied_on_arrival = [0] * n_wards
+        self.last_arrival = 0.0
+        self.arrivals = ([], [], [], [])
+        self.next_arrival = 0
+
+    def get_state(self):
+        """ (arrays, meta) snapshot for checkpoint.Checkpoint: the patients in a bed, the calendar and the counters """
+        # The calendar is saved in its list order, which is the heap order,
+        # and the unused rest of the current arrival block is saved too, so a
+        # restored model draws exactly the random numbers this one would
+        patients = self.patients
+        arrays = {
+            'patient_ward': np.frombuffer(patients.ward, dtype=np.int32),
+            'patient_type': np.frombuffer(patients.patient_type, dtype=np.int32),
+            'patient_admitted': np.frombuffer(patients.admitted, dtype=np.float64),
+            'patient_number': np.frombuffer(patients.patient, dtype=np.int64),
+            'free_slots': np.array(patients.free, dtype=np.int64),
+            'calendar_times': np.array([event[0] for event in self.calendar], dtype=np.float64),
+            'calendar_slots': np.array([event[1] for event in self.calendar], dtype=np.int64),
+            'arrival_times': np.array(self.arrivals[0], dtype=np.float64),
+            'arrival_wards': np.array(self.arrivals[1], dtype=np.int64),
+            'arrival_stays': np.array(self.arrivals[2], dtype=np.float64),
+            'arrival_uniforms': np.array(self.arrivals[3], dtype=np.float64),
+        }
+        for name in ('ward_occupancy', 'total_admissions', 'total_relocations', 'total_losses',
+                     'total_occupied_on_arrival'):
+            arrays[name] = np.array(getattr(self, name), dtype=np.int64)
+        # The stay sampler cannot be compared, only the arrays of parameters
+        meta = {'model': 'HospitalModel', 'fingerprint': fingerprint(self.caps, self.rates, self.stays, self.probs),
+                'time': self.time, 'events': self.events, 'arrived': self.arrived, 'last_arrival': self.last_arrival,
+                'next_arrival': self.next_arrival, 'block_size': self.block_size,
+                'rng': self.rng.bit_generator.state}
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        """ Continue from a snapshot of a HospitalModel with the same parameters """
+        check_fingerprint(meta, fingerprint(self.caps, self.rates, self.stays, self.probs), 'HospitalModel')
+        patients = PatientStore(0)
+        patients.ward = array('i', arrays['patient_ward'].astype(np.int32).tobytes())
+        patients.patient_type = array('i', arrays['patient_type'].astype(np.int32).tobytes())
+        patients.admitted = array('d', arrays['patient_admitted'].astype(np.float64).tobytes())
+        patients.patient = array('q', arrays.get('patient_number', np.zeros(len(patients.ward), np.int64)).tobytes())
+        patients.free = arrays['free_slots'].tolist()
+        self.patients = patients
+        self.calendar = list(zip(arrays['calendar_times'].tolist(), arrays['calendar_slots'].tolist()))
+        self.arrivals = tuple(arrays[name].tolist() for name in
+                              ('arrival_times', 'arrival_wards', 'arrival_stays', 'arrival_uniforms'))
+        for name in ('ward_occupancy', 'total_admissions', 'total_relocations', 'total_losses',
+                     'total_occupied_on_arrival'):
+            setattr(self, name, arrays[name].tolist())
+        self.time = meta['time']
+        self.events = meta['events']
+        self.arrived = meta.get('arrived', 0)
+        self.last_arrival = meta['last_arrival']
+        self.next_arrival = meta['next_arrival']
+        self.block_size = meta['block_size']
+        self.rng.bit_generator.state = meta['rng']
+
+    def arrival_block(self):
+        """ Draw the next block of arrivals of all wards, merged in time order """
+        rng = self.rng
+        size = self.block_size
+        total_rate = self.rates.sum()
+        if total_rate == 0:
+            return [np.inf], [0], [0.0], [0.0]
+
+        times = self.last_arrival + np.cumsum(rng.standard_exponential(size)) / total_rate
+        wards = np.searchsorted(np.cumsum(self.rates) / total_rate, rng.random(size), side='right')
+        wards = np.minimum(wards, len(self.rates) - 1)
+        stays = np.empty(size)
+        for w in range(len(self.rates)):
+            is_ward = wards == w
+            stays[is_ward] = self.stay_sampler(rng, w, int(is_ward.sum()))
+        self.last_arrival = times[-1]
+        return times.tolist(), wards.tolist(), stays.tolist(), rng.random(size).tolist()
+
+    def run(self, days):
+        """ Simulate from an empty hospital for `days` days and return the Task3 result tuple """
+        self.reset()
+        self.advance(days)
+        return self.results(days)
+
+    def advance(self, until):
+        """ Process every event up to time `until` """
+        calendar = self.calendar
+        heappush, heappop = heapq.heappush, heapq.heappop
+        patients = self.patients
+        # The arrays and the free list are only ever extended in place, so
+        # local references stay valid when the store grows
+        p_ward, p_type, p_admitted, p_number = patients.ward, patients.patient_type, patients.admitted, patients.patient
+        free_slots = patients.free
+        occupancy = self.ward_occupancy
+        admissions, relocations = self.total_admissions, self.total_relocations
+        losses, occupied_on_arrival = self.total_losses, self.total_occupied_on_arrival
+        caps = self.caps.tolist()
+        outcome_cdf = self.outcome_cdf
+        stats = self.stats
+        n_wards = len(caps)
+        free_mask = sum(1 << w for w in range(n_wards) if occupancy[w] < caps[w])
+
+        arrival_times, arrival_wards, arrival_stays, arrival_uniforms = self.arrivals
+        i = first_arrival = self.next_arrival
+        n_arrivals = n_discharges = 0
+        profile = self.profile
+        trace = self.trace
+        if trace is not None:
+            records = []
+            ADMISSION, BLOCKED, RELOCATION, LOSS, DISCHARGE = (EVENT_CODES[name] for name in (
+                'admission', 'blocked', 'relocation', 'loss', 'discharge'))
+        if profile is not None:
+            start = perf_counter()
+            block_time = 0.0
+            n_blocks = 0
+            before = (sum(admissions), sum(relocations), sum(losses), sum(occupied_on_arrival))
+            before_relocations = list(relocations)
+
+        while True:
+            if i == len(arrival_times):
+                n_arrivals += i - first_arrival
+                if profile is not None:
+                    block_start = perf_counter()
+                    n_blocks += 1
+                arrival_times, arrival_wards, arrival_stays, arrival_uniforms = self.arrival_block()
+                if profile is not None:
+                    block_time += perf_counter() - block_start
+                i = first_arrival = 0
+            t = arrival_times[i]
+
+            if calendar and calendar[0][0] < t:
+                # Discharge: free the bed and the patient slot
+                if calendar[0][0] > until:
+                    break
+                discharge_time, slot = heappop(calendar)
+                w = p_ward[slot]
+                occupancy[w] -= 1
+                free_mask |= 1 << w
+                free_slots.append(slot)
+                n_discharges += 1
+                if stats is not None:
+                    stats.discharge(discharge_time, w, occupancy[w])
+                if trace is not None:
+                    records.append((discharge_time, p_number[slot], w, DISCHARGE))
+                continue
+
+            # Arrival: admit, relocate or lose the patient
+            if t > until:
+                break
+            patient_type = w = arrival_wards[i]
+            if trace is not None:
+                number = self.arrived + n_arrivals + i - first_arrival
+                if len(records) >= 65536:
+                    trace.append_records(records)
+                    records = []
+            if occupancy[w] < caps[w]:
+                admissions[w] += 1
+                if trace is not None:
+                    records.append((t, number, w, ADMISSION))
+            else:
+                occupied_on_arrival[w] += 1
+                w = bisect_right(outcome_cdf[patient_type][free_mask], arrival_uniforms[i])
+                if trace is not None:
+                    records.append((t, number, patient_type, BLOCKED))
+                if w == n_wards:
+                    losses[patient_type] += 1
+                    if stats is not None:
+                        stats.lose(t, patient_type)
+                    if trace is not None:
+                        records.append((t, number, patient_type, LOSS))
+                    i += 1
+                    continue
+                relocations[w] += 1
+                if trace is not None:
+                    records.append((t, number, w, RELOCATION))
+
+            occupancy[w] += 1
+            if occupancy[w] == caps[w]:
+                free_mask &= ~(1 << w)
+            if not free_slots:
+                patients.grow()
+            slot = free_slots.pop()
+            p_ward[slot] = w
+            p_type[slot] = patient_type
+            p_admitted[slot] = t
+            if trace is not None:
+                p_number[slot] = number
+            heappush(calendar, (t + arrival_stays[i], slot))
+            if stats is not None:
+                stats.admit(t, patient_type, w, occupancy[w], arrival_stays[i])
+            i += 1
+
+        n_arrivals += i - first_arrival
+        self.events += n_arrivals + n_discharges
+        self.arrived += n_arrivals
+        if trace is not None:
+            trace.append_records(records)
+        if profile is not None:
+            loop = profile.stack + ('event_loop',)
+            profile.add_time(loop, perf_counter() - start)
+            profile.add_time(loop + ('arrival_blocks',), block_time, n_blocks)
+            admitted, relocated, lost, overflowed = (after - b for after, b in zip(
+                (sum(admissions), sum(relocations), sum(losses), sum(occupied_on_arrival)), before))
+            relocated_to = [after - b for after, b in zip(relocations, before_relocations)]
+            profile.count_many({'arrivals': n_arrivals, 'admissions': admitted, 'overflows': overflowed,
+                                'relocation_attempts': relocation_attempts(relocated_to, lost),
+                                'relocations': relocated, 'losses': lost,
+                                'departures': n_discharges})
+        self.arrivals = (arrival_times, arrival_wards, arrival_stays, arrival_uniforms)
+        self.next_arrival = i
+        self.time = until
+
+    def results(self, days):
+        """ Counters in the format returned by simulate_hospital_with_new_ward in Task3.py """
+        def by_ward(values):
+            return {ward: values[i] for i, ward in enumerate(self.wards)}
+
+        total_admissions = by_ward(self.total_admissions)
+        total_relocations = by_ward(self.total_relocations)
+        total_losses = by_ward(self.total_losses)
+        ward_occupancy = by_ward(self.ward_occupancy)
+        occupied_on_arrival = by_ward(self.total_occupied_on_arrival)
+        prob_all_beds_occupied = {ward: occupied_on_arrival[ward] / max(1, total_admissions[ward] + occupied_on_arrival[ward])
+                                  for ward in self.wards}
+        expected_admissions = {ward: total_admissions[ward] / days for ward in self.wards}
+        expected_relocations = {ward: total_relocations[ward] / days for ward in self.wards}
+
+        return total_admissions, total_relocations, total_losses, ward_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations
+
+
+def simulate_hospital_events(days, capacities, relocation_probs, arrival_rates, mean_stay, stay_sampler=None, rng=None,
+                             stats=None, profile=None, trace=None):
+    """ Run one HospitalModel replication for `days` days """
+    model = HospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, stay_sampler=stay_sampler, rng=rng,
+                          stats=stats, profile=profile, trace=trace)
+    return model.run(days)
@@ -0,0 +1,103 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# Length of stay distributions per ward. The parameters are worked out once
+# from the mean (and variance) of every ward, and draws come in blocks: one
+# call per ward for all the days of a run, or for a whole block of patients.
+# `rng` can be a np.random.Generator or the np.random module itself (the
+# global generator the Task scripts seed with np.random.seed).
+
+
+class StayDistribution(ABC):
+    """ Base class: sample(rng, ward, size) draws `size` lengths of stay for `ward` """
+
+    @abstractmethod
+    def sample(self, rng, ward, size):
+        """ `size` lengths of stay of `ward` """
+
+    def block(self, rng, wards, size):
+        """ One array of `size` draws per ward, e.g. one length of stay per day """
+        return {ward: self.sample(rng, ward, size) for ward in wards}
+
+    def for_wards(self, wards):
+        """ Sampler by ward index, as HospitalModel's stay_sampler(rng, ward_index, size) """
+        wards = list(wards)
+
+        def sampler(rng, w, size):
+            return self.sample(rng, wards[w], size)
+        return sampler
+
+    @abstractmethod
+    def mean(self, ward):
+        """ Mean length of stay of `ward` """
+
+
+class Exponential(StayDistribution):
+    def __init__(self, mean_stay):
+        self.mean_stay = dict(mean_stay)
+
+    def sample(self, rng, ward, size):
+        return rng.exponential(self.mean_stay[ward], size)
+
+    def mean(self, ward):
+        return self.mean_stay[ward]
+
+
+class LogNormal(StayDistribution):
+    """ Log-normal with the given mean and variance per ward, as in simulate_hospital_with_lognorm """
+
+    def __init__(self, mean_stay, variances):
+        self.params = {}
+        for ward, mean in mean_stay.items():
+            sigma = np.sqrt(np.log(variances[ward] / mean**2 + 1))
+            self.params[ward] = (np.log(mean**2 / np.sqrt(variances[ward] + mean**2)), sigma)
+
+    def sample(self, rng, ward, size):
+        return rng.lognormal(*self.params[ward], size)
+
+    def mean(self, ward):
+        mu, sigma = self.params[ward]
+        return np.exp(mu + sigma**2 / 2)
+
+
+class Gamma(StayDistribution):
+    """ Gamma with the given mean and variance per ward """
+
+    def __init__(self, mean_stay, variances):
+        # shape * scale = mean, shape * scale^2 = variance
+        self.params = {ward: (mean**2 / variances[ward], variances[ward] / mean) for ward, mean in mean_stay.items()}
+
+    def sample(self, rng, ward, size):
+        return rng.gamma(*self.params[ward], size)
+
+    def mean(self, ward):
+        shape, scale = self.params[ward]
+        return shape * scale
+
+
+class Empirical(StayDistribution):
+    """ Resampling of observed lengths of stay per ward """
+
+    def __init__(self, samples):
+        self.samples = {ward: np.asarray(values, dtype=float) for ward, values in samples.items()}
+        for ward, values in self.samples.items():
+            if len(values) == 0 or np.any(values <= 0):
+                raise ValueError(f"Ward {ward} needs positive observed lengths of stay")
+
+    def sample(self, rng, ward, size):
+        values = self.samples[ward]
+        # randint exists on both the legacy module and Generator.integers
+        draw = rng.integers if hasattr(rng, 'integers') else rng.randint
+        return values[draw(0, len(values), size)]
+
+    def mean(self, ward):
+        return self.samples[ward].mean()
+
+
+def daily_stays(days, wards, mean_stay, variances, stay_distribution=None):
+    """ One length of stay per ward and day from the global np.random state, log-normal unless another distribution is given """
+    # As in the Task4 scripts' simulate_hospital_with_lognorm: the parameters
+    # are computed once and every ward's days are drawn in a single block
+    stay_distribution = stay_distribution or LogNormal(mean_stay, variances)
+    return stay_distribution.block(np.random, wards, days)
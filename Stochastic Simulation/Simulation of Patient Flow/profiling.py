@@ -0,0 +1,121 @@
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Opt-in run profiles for the simulators. A simulator given profile=None (the
+# default) only pays for an `is not None` test per phase; with a RunProfile it
+# counts events by type and times its phases. Phases nest, so every timing is
+# kept under its stack of phase names, which is what flame graph tools read:
+#
+#     profile = RunProfile('DailyHospital')
+#     DailyHospital(..., profile=profile).run(365)
+#     profile.dump_json('profile.json')
+#     profile.dump_collapsed('profile.folded')   # flamegraph.pl, speedscope
+#
+# Counters inside the hot loops are plain local integers that are handed to
+# the profile once per call, not once per event.
+#
+# The hospital simulators count the same events: arrivals, admissions,
+# overflows (patients finding their ward full), relocations, losses and
+# departures. relocation_attempts is the number of relocation-row entries
+# the overflow patients walk in the loop of the Task scripts: j + 1 for a
+# patient relocated to the ward of column j, all W entries for a lost one. It
+# depends only on where the patients ended up, so every backend derives it
+# from its totals with relocation_attempts(), however it routes them.
+
+
+def relocation_attempts(relocations, losses):
+    """ Relocation-row entries walked, from the relocations into each ward (columns in ward order) and the losses """
+    relocations = np.asarray(relocations)
+    n_wards = relocations.shape[-1]
+    walked = relocations.reshape(-1, n_wards).sum(axis=0) @ np.arange(1, n_wards + 1)
+    return int(walked + n_wards * np.sum(losses))
+
+
+class RunProfile:
+    """ Event counts and nested phase timings of one or more simulation runs """
+
+    def __init__(self, name='run'):
+        self.name = name
+        self.counts = {}
+        self.times = {}  # stack of phase names -> [seconds, calls]
+        self.stack = (name,)
+        self.created = time.perf_counter()
+
+    def count(self, event, n=1):
+        self.counts[event] = self.counts.get(event, 0) + n
+
+    def count_many(self, counts):
+        for event, n in counts.items():
+            self.count(event, n)
+
+    @contextmanager
+    def phase(self, name):
+        """ Time the enclosed block as `name` under the current phase """
+        outer = self.stack
+        self.stack = outer + (name,)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(self.stack, time.perf_counter() - start)
+            self.stack = outer
+
+    def add_time(self, stack, seconds, calls=1):
+        """ Add time spent in `stack` (a tuple of phase names, or one name under the current phase) """
+        if isinstance(stack, str):
+            stack = self.stack + (stack,)
+        entry = self.times.setdefault(stack, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def merge(self, other):
+        """ Add the counts and times of another profile, e.g. of another replication """
+        self.count_many(other.counts)
+        for stack, (seconds, calls) in other.times.items():
+            self.add_time(stack, seconds, calls)
+        return self
+
+    def self_times(self):
+        """ Time in each stack minus the time of the phases nested in it """
+        own = {stack: seconds for stack, (seconds, _) in self.times.items()}
+        for stack, (seconds, _) in self.times.items():
+            if len(stack) > 1 and stack[:-1] in own:
+                own[stack[:-1]] -= seconds
+        return own
+
+    def report(self):
+        """ The profile as a JSON-compatible dict """
+        own = self.self_times()
+        phases = [{'stack': ';'.join(stack), 'seconds': seconds, 'self_seconds': max(own[stack], 0.0), 'calls': calls}
+                  for stack, (seconds, calls) in sorted(self.times.items())]
+        timed = sum(seconds for stack, (seconds, _) in self.times.items() if len(stack) == 2)
+        return {
+            'name': self.name,
+            'wall_seconds': time.perf_counter() - self.created,
+            'timed_seconds': timed,
+            'counts': dict(self.counts),
+            'events_per_second': {event: n / timed for event, n in self.counts.items()} if timed > 0 else {},
+            'phases': phases,
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+
+    def collapsed_stacks(self):
+        """ Lines of 'outer;inner self-microseconds', the folded format of flamegraph.pl """
+        return [f"{';'.join(stack)} {round(max(seconds, 0.0) * 1e6)}" for stack, seconds in sorted(self.self_times().items())]
+
+    def dump_collapsed(self, path):
+        with open(path, 'w') as file:
+            file.write('\n'.join(self.collapsed_stacks()) + '\n')
+
+    def __str__(self):
+        report = self.report()
+        lines = [f"Profile {self.name}: {report['timed_seconds']:.4f} s timed"]
+        lines += [f"  {phase['stack']:50s} {phase['seconds']:9.4f} s {phase['calls']:9d} calls" for phase in report['phases']]
+        lines += [f"  {event:24s} {n:12d}" for event, n in report['counts'].items()]
+        return '\n'.join(lines)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from vectorized_hospital import to_arrays, relocation_outcome_probs
+
+# Alias-table routing of overflow patients. The relocation loop of the Task
+# scripts walks relocation_probs[ward] with one np.random.rand() per entry and
+# takes the first ward that both passes its draw and has a free bed. For a
+# given set of free wards that is a categorical draw over W wards plus "lost"
+# (see relocation_outcome_probs), so every (ward, free-ward mask) pair gets
+# its own Walker/Vose alias table, built once, and each overflow patient then
+# costs a single uniform. The 'alias' backend of hospital_kernel routes the
+# overflow of the Task script loop with it.
+
+
+def alias_table(probs):
+    """ Vose's alias method: acceptance probabilities and aliases for a categorical distribution """
+    probs = np.asarray(probs, dtype=float)
+    n = len(probs)
+    scaled = (probs / probs.sum() * n).tolist()
+    accept = [1.0] * n
+    alias = list(range(n))
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        accept[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    # Whatever is left is 1 up to rounding
+    return np.array(accept), np.array(alias, dtype=np.int64)
+
+
+class RelocationSampler:
+    """ Per-ward alias tables for every pattern of free wards, with batched routing of a day's overflow """
+
+    def __init__(self, capacities, relocation_probs):
+        # Relocation column j is the j-th ward of capacities, as in the scripts
+        self.wards, _, _, _, probs = to_arrays(
+            capacities, relocation_probs, dict.fromkeys(capacities, 0.0), dict.fromkeys(capacities, 1.0))
+        self.index = {ward: i for i, ward in enumerate(self.wards)}
+        outcomes = relocation_outcome_probs(probs)
+        n_wards, n_masks, n_outcomes = outcomes.shape
+        self.accept = np.empty(outcomes.shape)
+        self.alias = np.empty(outcomes.shape, dtype=np.int64)
+        for w in range(n_wards):
+            for mask in range(n_masks):
+                self.accept[w, mask], self.alias[w, mask] = alias_table(outcomes[w, mask])
+        # The same tables as Python lists for the per-patient loop of route()
+        self.rows = [[(self.accept[w, mask].tolist(), self.alias[w, mask].tolist()) for mask in range(n_masks)]
+                     for w in range(n_wards)]
+
+    def draw(self, w, mask, size, rng=np.random):
+        """ Outcomes (ward index, or the number of wards for a loss) of `size` overflow patients of ward w """
+        # One uniform per patient: the integer part picks the column, the
+        # fraction decides between the column and its alias
+        x = rng.random(size) * self.accept.shape[2]
+        column = x.astype(np.int64)
+        return np.where(x - column < self.accept[w, mask, column], column, self.alias[w, mask, column])
+
+    def route(self, ward, arrivals, ward_occupancy, capacities, total_admissions, total_relocations, rng=np.random):
+        """ Admit a day's arrivals to `ward`, relocate the overflow; returns (overflow, lost) """
+        # Updates the dicts of the calling script in place, exactly as the
+        # per-patient loop does. rng defaults to the global NumPy generator
+        # the scripts seed with np.random.seed
+        admitted = min(arrivals, max(0, capacities[ward] - ward_occupancy[ward]))
+        ward_occupancy[ward] += admitted
+        total_admissions[ward] += admitted
+        overflow = arrivals - admitted
+        lost = 0
+        if overflow == 0:
+            return 0, 0
+
+        wards = self.wards
+        n_wards = len(wards)
+        n_outcomes = n_wards + 1
+        w = self.index[ward]
+        mask = sum(1 << j for j, name in enumerate(wards) if ward_occupancy[name] < capacities[name])
+        accept, alias = self.rows[w][mask]
+        # All uniforms of the day are drawn at once; each patient still uses
+        # the table of the wards that are free when it is its turn
+        for u in rng.random(overflow).tolist():
+            x = u * n_outcomes
+            j = int(x)
+            if x - j >= accept[j]:
+                j = alias[j]
+            if j == n_wards:
+                lost += 1
+                continue
+            alt_ward = wards[j]
+            ward_occupancy[alt_ward] += 1
+            total_relocations[alt_ward] += 1
+            if ward_occupancy[alt_ward] >= capacities[alt_ward]:
+                mask &= ~(1 << j)
+                accept, alias = self.rows[w][mask]
+        return overflow, lost
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from vectorized_hospital import simulate_hospital_batch
+
+# Replication runner. Every replication gets its own child of one
+# np.random.SeedSequence, so a replication's random numbers depend only on
+# the root seed and its index. Results are collected in replication order,
+# which makes the output identical whatever the number of workers.
+
+
+def spawn_seeds(seed, replications):
+    """ Independent child seed sequences, one per replication """
+    return np.random.SeedSequence(seed).spawn(replications)
+
+
+def run_one(task):
+    """ Run a single replication in a worker process """
+    simulate, args, kwargs, seed, legacy_global_rng = task
+    if legacy_global_rng:
+        # Functions written against np.random.poisson/np.random.rand use the
+        # global RandomState, which is reseeded from the child stream
+        np.random.set_state(np.random.RandomState(np.random.MT19937(seed)).get_state())
+        return simulate(*args, **kwargs)
+    return simulate(*args, rng=np.random.default_rng(seed), **kwargs)
+
+
+def run_replications(simulate, args=(), kwargs=None, replications=1, seed=42, workers=None,
+                     legacy_global_rng=False, chunksize=None):
+    """ Run `replications` independent calls of `simulate` over a process pool """
+    # simulate must be importable (defined at module level) so it can be sent
+    # to the workers; it receives its generator as rng= unless it draws from
+    # the global NumPy RNG, in which case legacy_global_rng=True
+    tasks = [(simulate, tuple(args), dict(kwargs or {}), child, legacy_global_rng)
+             for child in spawn_seeds(seed, replications)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or replications == 1:
+        return [run_one(task) for task in tasks]
+
+    # A few chunks per worker keeps the pool busy without paying the
+    # inter-process overhead once per replication
+    chunksize = chunksize or max(1, replications // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_one, tasks, chunksize=chunksize))
+
+
+def simulate_hospital_batch_parallel(days, replications, capacities, relocation_probs, arrival_rates, mean_stay,
+                                     seed=42, workers=None, chunk=500):
+    """ simulate_hospital_batch split into fixed-size chunks over a process pool """
+    # The chunk size, not the number of workers, decides how replications are
+    # grouped, so the concatenated arrays do not depend on `workers`
+    sizes = [min(chunk, replications - start) for start in range(0, replications, chunk)]
+    tasks = [(simulate_hospital_batch, (days, size, capacities, relocation_probs, arrival_rates, mean_stay), {}, child, False)
+             for size, child in zip(sizes, spawn_seeds(seed, len(sizes)))]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        chunks = [run_one(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(run_one, tasks))
+
+    wards = chunks[0][0]
+    return (wards,) + tuple(np.concatenate([result[i] for result in chunks]) for i in range(1, 6))
@@ -0,0 +1,301 @@
+import ast
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import struct
+import tempfile
+import textwrap
+import types
+
+import numpy as np
+
+# A persistent cache of simulation results shared by the Task scripts, the
+# notebooks and repeated studies. A wrapped simulate function is keyed by
+#
+#   - MODEL_VERSION and an optional version of its own,
+#   - its code (the syntax tree, so comments and layout do not count) and the
+#     code of the repo functions and classes it calls,
+#   - the module-level data it reads (arrival_rates, mean_stay, ...),
+#   - its arguments, and
+#   - for functions drawing from the global np.random state (the Task
+#     scripts), that state at the call.
+#
+# A hit also restores the np.random state the original call left behind, so a
+# script draws the same numbers afterwards as without the cache and its output
+# is identical bit for bit. Since the key holds the code rather than the file,
+# the scripts that carry the same simulate function (Task4_Sensitivity
+# AnalysisTestDistributionBeds.py and Tast4_Sensitivity_Evaluate.py) share
+# the results of the runs they have in common. Calls with arguments the cache
+# cannot key (objects such as a length_of_stay.LogNormal) simply run.
+#
+# Results are pickled one file per key into the cache directory, behind a
+# header with a magic string, the file format version and the size of the
+# pickle, and evicted least recently used first once the directory exceeds
+# max_bytes. A file whose header does not check out or that does not unpickle
+# is dropped and counts as a miss. The directory is only scanned when a result
+# is written, and a result is only read when it is asked for. It lives in the
+# user's cache directory ($XDG_CACHE_HOME, ~/.cache or %LOCALAPPDATA%); the
+# SIMULATION_CACHE environment variable names another directory, or turns the
+# cache off with 'off'. Bump MODEL_VERSION when a change outside the keyed
+# code (numpy, a helper module) changes results.
+
+MODEL_VERSION = 1
+FORMAT_VERSION = 1
+MAGIC = b'SIMCACHE'
+HEADER = struct.Struct('<8sIQ')  # magic, format version, size of the pickle in bytes
+REPO_DIRECTORIES = (os.path.dirname(os.path.abspath(__file__)),
+                    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                 'Queue Simulation'))
+
+_caches = {}
+
+
+def user_cache_directory():
+    """ The directory of the result cache under the user's cache directory """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'patient-flow-simulation')
+
+
+DEFAULT_DIRECTORY = user_cache_directory()
+
+
+class Uncacheable(TypeError):
+    """ A value the cache cannot turn into a key """
+
+
+class CorruptEntry(ValueError):
+    """ A cache file that is not a complete result of this format version """
+
+
+class ResultCache:
+    """ Pickled results on disk, one file per key, with LRU eviction by total size """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=512 * 2**20):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.sizes = None  # path -> bytes, scanned on the first write
+        self.hits = self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key, default=None):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = read_entry(file, self.max_bytes)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except Exception:
+            # A truncated or foreign file, another format version or a result
+            # of code that no longer loads: drop it
+            self.remove(path)
+            self.misses += 1
+            return default
+        os.utime(path)  # the modification time orders the eviction
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(data)))
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        sizes = self.scan()
+        sizes[path] = os.path.getsize(path)
+        self.evict()
+
+    def scan(self):
+        """ Sizes of the stored results, read from the directory once """
+        if self.sizes is None:
+            self.sizes = {}
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.pkl'):
+                        path = os.path.join(root, name)
+                        self.sizes[path] = os.path.getsize(path)
+        return self.sizes
+
+    def evict(self):
+        """ Remove the least recently used results until the cache fits in max_bytes """
+        sizes = self.scan()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for path in sorted(sizes, key=last_used):
+            total -= sizes[path]
+            self.remove(path)
+            if total <= self.max_bytes:
+                break
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        if self.sizes is not None:
+            self.sizes.pop(path, None)
+
+    def clear(self):
+        for path in list(self.scan()):
+            self.remove(path)
+
+    def __len__(self):
+        return len(self.scan())
+
+
+def read_entry(file, max_bytes):
+    """ The result in an open cache file, once its header checks out; raises CorruptEntry """
+    header = file.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise CorruptEntry("Truncated header")
+    magic, version, size = HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise CorruptEntry(f"Not a result cache file of format version {FORMAT_VERSION}")
+    if size > max_bytes or os.fstat(file.fileno()).st_size != HEADER.size + size:
+        raise CorruptEntry(f"Expected {size} bytes of results")
+    return pickle.loads(file.read(size))
+
+
+def last_used(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:  # removed by another process
+        return -np.inf
+
+
+def default_cache():
+    """ The cache named by SIMULATION_CACHE (None when it is 'off') """
+    directory = os.environ.get('SIMULATION_CACHE', DEFAULT_DIRECTORY)
+    if directory.lower() in ('off', '0', 'false', ''):
+        return None
+    if directory not in _caches:
+        _caches[directory] = ResultCache(directory)
+    return _caches[directory]
+
+
+def is_repo_code(value):
+    """ A function or class defined in this repository (a Task script included) """
+    try:
+        path = inspect.getsourcefile(value)
+    except TypeError:
+        return False
+    return path is not None and os.path.dirname(os.path.abspath(path)) in REPO_DIRECTORIES
+
+
+def code_digest(value):
+    """ Hash of the syntax tree of a function or class """
+    source = inspect.getsource(value)
+    tree = ast.parse(textwrap.dedent(source))
+    return hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+
+
+def referenced_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= referenced_names(constant)
+    return names
+
+
+def canonical(value, seen=None):
+    """ A JSON-like, hashable description of a value; raises Uncacheable """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return ('float', value.hex())
+    if isinstance(value, np.generic):
+        return canonical(value.item(), seen)
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise Uncacheable("Object arrays cannot be keyed")
+        return ('array', str(value.dtype), value.shape,
+                hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, dict):
+        # In insertion order: the Task scripts walk the wards in dict order
+        return ('dict', tuple((canonical(k, seen), canonical(v, seen)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(canonical(v, seen) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted(repr(canonical(v, seen)) for v in value)))
+    if isinstance(value, (types.FunctionType, type)) and is_repo_code(value):
+        return ('code', function_digest(value, seen))
+    raise Uncacheable(f"Cannot key a value of type {type(value).__name__}")
+
+
+def function_digest(function, seen=None):
+    """ Hash of a function's code, the repo code it calls and the module-level data it reads """
+    seen = set() if seen is None else seen
+    if function in seen:
+        return 'recursive'
+    seen.add(function)
+    digest = hashlib.sha256(code_digest(function).encode())
+    if isinstance(function, types.FunctionType):
+        namespace = function.__globals__
+        for name in sorted(referenced_names(function.__code__)):
+            if name not in namespace:
+                continue
+            value = namespace[name]
+            if isinstance(value, types.ModuleType) or (callable(value) and not is_repo_code(value)
+                                                       and not isinstance(value, (dict, list, np.ndarray))):
+                continue  # numpy, scipy and builtins are covered by MODEL_VERSION
+            digest.update(repr((name, canonical(value, seen))).encode())
+    return digest.hexdigest()
+
+
+def global_rng_digest():
+    kind, keys, position, has_gauss, gauss = np.random.get_state()
+    return hashlib.sha256(repr((kind, keys.tobytes(), position, has_gauss, float(gauss).hex())).encode()).hexdigest()
+
+
+def cached_simulation(function=None, *, version=None, global_rng=True, cache=None):
+    """ Wrap a simulate function so repeated calls are served from the result cache """
+    # global_rng=False for functions whose randomness comes in as an argument
+    # (seed=..., rng=...); a Generator argument cannot be keyed, so such
+    # calls need an integer or SeedSequence seed to be cached
+    if function is None:
+        return functools.partial(cached_simulation, version=version, global_rng=global_rng, cache=cache)
+    signature = inspect.signature(function)
+
+    def key(*args, **kwargs):
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        parts = (MODEL_VERSION, version, function.__qualname__, function_digest(function),
+                 canonical(dict(arguments.arguments)), global_rng_digest() if global_rng else None)
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        store = cache if cache is not None else default_cache()
+        if store is None:
+            return function(*args, **kwargs)
+        try:
+            result_key = key(*args, **kwargs)
+        except (Uncacheable, OSError):
+            return function(*args, **kwargs)
+        entry = store.get(result_key)
+        if entry is not None:
+            result, rng_state = entry
+            if global_rng:
+                np.random.set_state(rng_state)
+            return result
+        result = function(*args, **kwargs)
+        store.put(result_key, (result, np.random.get_state() if global_rng else None))
+        return result
+
+    wrapper.cache_key = key
+    return wrapper
@@ -0,0 +1,297 @@
+from bisect import bisect_right
+from time import perf_counter
+
+import numpy as np
+from scipy.stats import t as student_t
+
+from checkpoint import fingerprint, check_fingerprint
+from profiling import relocation_attempts
+from vectorized_hospital import to_arrays, relocation_outcome_probs
+
+# Run-length control for the day-based hospital model of Task3.py
+# (simulate_hospital_with_new_ward) and Tast4_Sensitivity_Evaluate.py
+# (simulate_hospital_with_lognorm). One long run is simulated day by day from
+# the empty hospital and summed into batches of days as it goes; the warm-up
+# is cut with MSER on the batch means of the occupancy, the remainder gives
+# batch-means confidence intervals, and the run is extended until they are
+# tight enough.
+
+
+class DailyHospital:
+    """ The day-by-day model of the Task scripts, kept as state so a run can be extended """
+
+    def __init__(self, capacities, relocation_probs, arrival_rates, mean_stay, variances=None, rng=None,
+                 profile=None):
+        self.wards, self.caps, self.rates, self.stays, self.probs = to_arrays(
+            capacities, relocation_probs, arrival_rates, mean_stay)
+        self.rng = np.random.default_rng(rng)
+        # Optional profiling.RunProfile: event counts and the time spent in
+        # the Poisson and log-normal draws, the relocations and the departures
+        self.profile = profile
+        # Departures are Poisson(occupancy / stay) with stay the mean length of
+        # stay (Task3) or, given variances, one log-normal draw per ward and
+        # day with that mean and variance (simulate_hospital_with_lognorm)
+        self.lognormal = None
+        if variances is not None:
+            variances = np.array([variances[ward] for ward in self.wards], dtype=float)
+            sigma = np.sqrt(np.log(variances / self.stays**2 + 1))
+            self.lognormal = (np.log(self.stays) - sigma**2 / 2, sigma)
+        n_wards = len(self.wards)
+        self.outcome_cdf = [[list(row) for row in np.cumsum(outcome, axis=1)[:, :n_wards]]
+                            for outcome in relocation_outcome_probs(self.probs)]
+        self.occupancy = [0] * n_wards
+        self.day = 0
+
+    def fingerprint(self):
+        lognormal = () if self.lognormal is None else self.lognormal
+        return fingerprint(self.caps, self.rates, self.stays, self.probs, *lognormal)
+
+    def get_state(self):
+        """ (arrays, meta) snapshot for checkpoint.Checkpoint """
+        return ({'occupancy': np.array(self.occupancy, dtype=np.int64)},
+                {'model': 'DailyHospital', 'fingerprint': self.fingerprint(), 'day': self.day,
+                 'rng': self.rng.bit_generator.state})
+
+    def set_state(self, arrays, meta):
+        """ Continue from a snapshot of a DailyHospital with the same parameters """
+        check_fingerprint(meta, self.fingerprint(), 'DailyHospital')
+        self.occupancy = arrays['occupancy'].tolist()
+        self.day = meta['day']
+        self.rng.bit_generator.state = meta['rng']
+
+    def run(self, days):
+        """ Simulate `days` more days and return the daily counts, each an array (days, wards) """
+        rng = self.rng
+        n_wards = len(self.wards)
+        caps = self.caps.tolist()
+        occupancy = self.occupancy
+        outcome_cdf = self.outcome_cdf
+        profile = self.profile
+        timed = profile is not None
+        relocation_time = departure_time = 0.0
+        departures_total = 0
+
+        start = perf_counter() if timed else 0.0
+        arrivals = rng.poisson(self.rates, size=(days, n_wards))
+        if timed:
+            profile.add_time('arrival_draws', perf_counter() - start)
+            start = perf_counter()
+        if self.lognormal is None:
+            stays = np.broadcast_to(self.stays, (days, n_wards))
+        else:
+            stays = rng.lognormal(*self.lognormal, size=(days, n_wards))
+            if timed:
+                profile.add_time('stay_draws', perf_counter() - start)
+        loop_start = perf_counter() if timed else 0.0
+        admissions = np.zeros((days, n_wards), dtype=np.int64)
+        relocations = np.zeros((days, n_wards), dtype=np.int64)
+        losses = np.zeros((days, n_wards), dtype=np.int64)
+        occupied_on_arrival = np.zeros((days, n_wards), dtype=np.int64)
+        daily_occupancy = np.zeros((days, n_wards), dtype=np.int64)
+        # Bit j is set while ward j has a free bed, updated whenever an
+        # occupancy reaches or leaves its capacity
+        free_mask = sum(1 << j for j in range(n_wards) if occupancy[j] < caps[j])
+
+        for day in range(days):
+            for w in range(n_wards):
+                admitted = min(arrivals[day, w], caps[w] - occupancy[w])
+                occupancy[w] += admitted
+                admissions[day, w] = admitted
+                if occupancy[w] >= caps[w]:
+                    free_mask &= ~(1 << w)
+                overflow = arrivals[day, w] - admitted
+                if overflow:
+                    if timed:
+                        start = perf_counter()
+                    occupied_on_arrival[day, w] = overflow
+                    for u in rng.random(overflow).tolist():
+                        alt_ward = bisect_right(outcome_cdf[w][free_mask], u)
+                        if alt_ward == n_wards:
+                            losses[day, w] += 1
+                        else:
+                            occupancy[alt_ward] += 1
+                            relocations[day, alt_ward] += 1
+                            if occupancy[alt_ward] == caps[alt_ward]:
+                                free_mask &= ~(1 << alt_ward)
+                    if timed:
+                        relocation_time += perf_counter() - start
+
+                if timed:
+                    start = perf_counter()
+                    departures = rng.poisson(occupancy[w] / stays[day, w])
+                    departures_total += min(departures, occupancy[w])
+                    departure_time += perf_counter() - start
+                else:
+                    departures = rng.poisson(occupancy[w] / stays[day, w])
+                occupancy[w] = max(0, occupancy[w] - departures)
+                if occupancy[w] < caps[w]:
+                    free_mask |= 1 << w
+            daily_occupancy[day] = occupancy
+
+        if timed:
+            # The day loop is split into the relocations, the departures and
+            # the rest (admissions and bookkeeping)
+            loop = profile.stack + ('day_loop',)
+            profile.add_time(loop, perf_counter() - loop_start)
+            profile.add_time(loop + ('relocation',), relocation_time, int(occupied_on_arrival.sum()))
+            profile.add_time(loop + ('departure_draws',), departure_time, days * n_wards)
+            profile.count_many({'arrivals': int(arrivals.sum()), 'admissions': int(admissions.sum()),
+                                'overflows': int(occupied_on_arrival.sum()),
+                                'relocation_attempts': relocation_attempts(relocations, losses),
+                                'relocations': int(relocations.sum()), 'losses': int(losses.sum()),
+                                'departures': departures_total})
+        self.day += days
+        return {'arrivals': arrivals, 'admissions': admissions, 'relocations': relocations, 'losses': losses,
+                'occupied_on_arrival': occupied_on_arrival, 'occupancy': daily_occupancy}
+
+
+class BatchSums:
+    """ Per-batch sums of the daily counts of a run, merged pairwise so at most max_batches are kept """
+    # Batches start at batch_days days; whenever there are more than
+    # max_batches, neighbouring batches are added up and batch_days doubles,
+    # so the memory stays bounded however long the run gets. Days that do
+    # not fill a batch yet are kept as a running sum
+
+    def __init__(self, batch_days=5, max_batches=4096):
+        self.batch_days = batch_days
+        self.max_batches = max_batches
+        self.sums = {}  # name -> (batches, wards)
+        self.partial = {}  # name -> (wards,), the sum of the last partial_days days
+        self.partial_days = 0
+
+    def __len__(self):
+        return len(next(iter(self.sums.values()), ()))
+
+    @property
+    def days(self):
+        return len(self) * self.batch_days + self.partial_days
+
+    def add(self, daily):
+        """ Add the daily counts returned by DailyHospital.run """
+        days = len(next(iter(daily.values())))
+        if not self.sums:
+            self.sums = {name: np.zeros((0,) + values.shape[1:], dtype=values.dtype) for name, values in daily.items()}
+            self.partial = {name: np.zeros(values.shape[1:], dtype=values.dtype) for name, values in daily.items()}
+        start = 0
+        while start < days:
+            if self.partial_days or days - start < self.batch_days:
+                # Days into the partial batch, which becomes a batch once full
+                take = min(days - start, self.batch_days - self.partial_days)
+                for name, values in daily.items():
+                    self.partial[name] = self.partial[name] + values[start:start + take].sum(axis=0)
+                self.partial_days += take
+                start += take
+                if self.partial_days == self.batch_days:
+                    full, self.partial_days = self.partial, 0
+                    self.partial = {name: np.zeros_like(values) for name, values in full.items()}
+                    self.append({name: values[None] for name, values in full.items()})
+            else:
+                whole = (days - start) // self.batch_days * self.batch_days
+                self.append({name: values[start:start + whole].reshape((-1, self.batch_days) + values.shape[1:])
+                             .sum(axis=1) for name, values in daily.items()})
+                start += whole
+
+    def append(self, batches):
+        self.sums = {name: np.concatenate((self.sums[name], batches[name])) for name in self.sums}
+        while len(self) > self.max_batches:
+            # An odd last batch goes back into the partial batch, which stays
+            # shorter than a merged batch
+            if len(self) % 2:
+                for name, values in self.sums.items():
+                    self.partial[name] = self.partial[name] + values[-1]
+                    self.sums[name] = values[:-1]
+                self.partial_days += self.batch_days
+            self.sums = {name: values.reshape((-1, 2) + values.shape[1:]).sum(axis=1)
+                         for name, values in self.sums.items()}
+            self.batch_days *= 2
+
+
+def mser(batch_means, max_fraction=0.5):
+    """ Number of leading batches to cut, chosen by MSER on the batch means """
+    # Cut the d batches that minimise the squared standard error of the mean
+    # of what is left; d is limited to max_fraction of the batches, beyond
+    # which the rule is unreliable
+    z = np.asarray(batch_means, dtype=float)
+    m = len(z)
+    if m < 2:
+        return 0
+    # Sums over z[d:] for every d, from the end
+    tail_sum = np.cumsum(z[::-1])[::-1]
+    tail_sq = np.cumsum((z * z)[::-1])[::-1]
+    remaining = m - np.arange(m)
+    sse = tail_sq - tail_sum**2 / remaining
+    candidates = max(1, int(max_fraction * m))
+    return int(np.argmin(sse[:candidates] / remaining[:candidates] ** 2))
+
+
+def mser5(series, max_fraction=0.5):
+    """ Warm-up length (in observations) chosen by MSER-5 """
+    series = np.asarray(series, dtype=float)
+    m = len(series) // 5
+    return 5 * mser(series[:5 * m].reshape(m, 5).mean(axis=1), max_fraction)
+
+
+def batch_ratio(numerator, denominator, n_batches, confidence=0.95):
+    """ Batch-means estimate and half-width of sum(numerator) / sum(denominator) """
+    # Columns are wards; every batch contributes the ratio of its own sums
+    size = len(numerator) // n_batches
+    shape = (n_batches, size) + numerator.shape[1:]
+    top = numerator[len(numerator) - n_batches * size:].reshape(shape).sum(axis=1)
+    bottom = denominator[len(denominator) - n_batches * size:].reshape(shape).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = np.where(bottom > 0, top / bottom, 0.0)
+    half_width = student_t.ppf(0.5 + confidence / 2, n_batches - 1) * ratios.std(axis=0, ddof=1) / np.sqrt(n_batches)
+    return ratios.mean(axis=0), half_width
+
+
+def run_until_precision(model, relative_half_width=0.05, absolute_half_width=0.001, confidence=0.95,
+                        initial_days=365, max_days=365 * 200, n_batches=20, chunk_days=3650):
+    """ Extend one run of a DailyHospital until every controlled metric reaches the requested precision """
+    # Controlled metrics, per ward: the probability that all beds are
+    # occupied on arrival and the hospitalization rate (admitted directly
+    # out of admitted or lost). A metric counts as precise when its half-width
+    # is at most relative_half_width times its mean, or at most
+    # absolute_half_width, so rare events such as a ward that is almost never
+    # full do not drive the run length on their own. Only the per-batch sums
+    # of BatchSums are kept, and the run is extended chunk_days at a time, so
+    # the memory does not grow with the run length; MSER works on the batch
+    # means of the total occupancy (MSER-5 while the batches are 5 days long)
+    batches = BatchSums()
+
+    def extend(days):
+        while days > 0:
+            daily = model.run(min(days, chunk_days))
+            daily.pop('relocations')
+            batches.add(daily)
+            days -= chunk_days
+
+    extend(initial_days)
+    while True:
+        warmup = mser(batches.sums['occupancy'].sum(axis=1))
+        kept = {name: values[warmup:] for name, values in batches.sums.items()}
+        metrics = {
+            'prob_all_beds_occupied': batch_ratio(kept['occupied_on_arrival'], kept['arrivals'], n_batches, confidence),
+            'hospitalization_rate': batch_ratio(kept['admissions'], kept['admissions'] + kept['losses'], n_batches,
+                                                confidence),
+        }
+        # Precision relative to the target, 1 when the slowest metric is just precise enough
+        precision = max(float(np.max(np.minimum(half_width / np.maximum(relative_half_width * mean, 1e-300),
+                                                half_width / max(absolute_half_width, 1e-300)), initial=0.0))
+                        for mean, half_width in metrics.values())
+        if precision <= 1 or model.day >= max_days:
+            break
+
+        # Half-widths shrink like 1 / sqrt(days): aim for the days needed,
+        # with 10 % to spare, at most doubling and never past max_days
+        kept_days = (len(batches) - warmup) * batches.batch_days
+        needed = kept_days * precision**2 * 1.1
+        extend(int(min(max(needed - kept_days, 5 * n_batches), model.day, max_days - model.day)))
+
+    return {
+        'days': model.day,
+        'warmup_days': warmup * batches.batch_days,
+        'converged': precision <= 1,
+        'precision': precision,
+        'metrics': {name: {ward: (mean[i], half_width[i]) for i, ward in enumerate(model.wards)}
+                    for name, (mean, half_width) in metrics.items()},
+    }
@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+from scipy.stats import poisson
+from scipy.stats import t as student_t
+
+# Common random numbers for comparing bed distribution scenarios. All the
+# randomness of one replication of simulate_hospital_with_lognorm (Task4) is
+# drawn up front, per ward and per day, and every scenario is run on the same
+# streams. Patient k arriving at ward w on day d always uses the same
+# relocation uniforms, and departures are drawn by inverting the Poisson CDF
+# with a fixed uniform, so scenarios only differ where their capacities
+# actually make them differ.
+
+
+def lognorm_parameters(mean_stay, variance):
+    """ Log-scale mean and sigma of a log-normal with the given mean and variance """
+    mean = np.log(mean_stay**2 / np.sqrt(variance + mean_stay**2))
+    sigma = np.sqrt(np.log(variance / mean_stay**2 + 1))
+    return mean, sigma
+
+
+def poisson_quantile(u, mu, limit):
+    """ min(limit, smallest k with P(X <= k) >= u) for X ~ Poisson(mu) """
+    if mu > 700:
+        # exp(-mu) underflows; the walk below would stop at k = 0
+        return min(limit, int(poisson.ppf(u, mu)))
+    k = 0
+    pmf = cdf = math.exp(-mu)
+    while cdf < u and k < limit:
+        k += 1
+        pmf *= mu / k
+        cdf += pmf
+    return k
+
+
+def generate_streams(days, wards, arrival_rates, mean_stay, variances, rng):
+    """ Pre-generate the arrival, relocation, length of stay and departure streams of one replication """
+    n_wards = len(wards)
+    rates = np.array([arrival_rates[ward] for ward in wards])
+    arrivals = rng.poisson(rates, size=(days, n_wards))
+    relocation_uniforms = rng.random((days, n_wards, max(1, arrivals.max()), n_wards))
+    stays = np.empty((days, n_wards))
+    for i, ward in enumerate(wards):
+        mean, sigma = lognorm_parameters(mean_stay[ward], variances[ward])
+        stays[:, i] = rng.lognormal(mean, sigma, size=days)
+    departure_uniforms = rng.random((days, n_wards))
+    return arrivals, relocation_uniforms, stays, departure_uniforms
+
+
+def simulate_hospital_with_streams(capacities, relocation_probs, streams):
+    """ simulate_hospital_with_lognorm driven by pre-generated streams """
+    arrivals, relocation_uniforms, stays, departure_uniforms = streams
+    days = len(arrivals)
+    wards = list(capacities.keys())
+    ward_occupancy = {ward: 0 for ward in wards}
+    total_admissions = {ward: 0 for ward in wards}
+    total_relocations = {ward: 0 for ward in wards}
+    total_losses = {ward: 0 for ward in wards}
+    total_occupied_on_arrival = {ward: 0 for ward in wards}
+
+    for day in range(days):
+        for w, ward in enumerate(wards):
+            for k in range(arrivals[day, w]):
+                if ward_occupancy[ward] < capacities[ward]:
+                    ward_occupancy[ward] += 1
+                    total_admissions[ward] += 1
+                else:
+                    total_occupied_on_arrival[ward] += 1
+                    relocated = False
+                    for j, prob in enumerate(relocation_probs[ward][:len(wards)]):
+                        if relocation_uniforms[day, w, k, j] < prob:
+                            alt_ward = wards[j]
+                            if ward_occupancy[alt_ward] < capacities[alt_ward]:
+                                ward_occupancy[alt_ward] += 1
+                                total_relocations[alt_ward] += 1
+                                relocated = True
+                                break
+                    if not relocated:
+                        total_losses[ward] += 1
+
+            departures = poisson_quantile(departure_uniforms[day, w], ward_occupancy[ward] / stays[day, w], ward_occupancy[ward])
+            ward_occupancy[ward] -= departures
+
+    prob_all_beds_occupied = {ward: total_occupied_on_arrival[ward] / max(1, total_admissions[ward] + total_occupied_on_arrival[ward])
+                              for ward in wards}
+    expected_admissions = {ward: total_admissions[ward] / days for ward in wards}
+    expected_relocations = {ward: total_relocations[ward] / days for ward in wards}
+
+    return total_admissions, total_relocations, total_losses, ward_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations
+
+
+def scenario_metrics(results, days):
+    """ Per-ward metrics compared between scenarios """
+    total_admissions, total_relocations, total_losses, final_occupancy, prob_all_beds_occupied, expected_admissions, expected_relocations = results
+    metrics = {
+        'Hospitalization rate': {ward: total_admissions[ward] / max(1, total_admissions[ward] + total_losses[ward])
+                                 for ward in total_admissions},
+        'Losses per day': {ward: total_losses[ward] / days for ward in total_losses},
+        'Prob Full': prob_all_beds_occupied,
+    }
+    metrics['Losses per day']['Total'] = sum(total_losses.values()) / days
+    return metrics
+
+
+def compare_scenarios(scenarios, relocation_probs, arrival_rates, mean_stay, variances, days=365,
+                      replications=20, baseline=None, seed=42, confidence=0.95):
+    """ Paired differences of every scenario against the baseline under common random numbers """
+    # scenarios maps a name to a capacities dict; all must list the same
+    # wards in the same order, since relocation columns follow that order
+    names = list(scenarios)
+    baseline = baseline or names[0]
+    wards = list(scenarios[baseline].keys())
+    rng = np.random.default_rng(seed)
+
+    samples = {name: [] for name in names}
+    for r in range(replications):
+        streams = generate_streams(days, wards, arrival_rates, mean_stay, variances, rng)
+        for name in names:
+            samples[name].append(scenario_metrics(simulate_hospital_with_streams(scenarios[name], relocation_probs, streams), days))
+
+    t_value = student_t.ppf(0.5 + confidence / 2, replications - 1)
+    comparison = {}
+    for name in names:
+        if name == baseline:
+            continue
+        comparison[name] = {}
+        for metric, values in samples[name][0].items():
+            comparison[name][metric] = {}
+            for key in values:
+                differences = np.array([samples[name][r][metric][key] - samples[baseline][r][metric][key]
+                                        for r in range(replications)])
+                half_width = t_value * differences.std(ddof=1) / np.sqrt(replications)
+                comparison[name][metric][key] = (differences.mean(), half_width)
+    return baseline, comparison
+
+
+def format_comparison(baseline, comparison):
+    """ Print the paired differences in the layout of format_results """
+    for name, metrics in comparison.items():
+        print(f"\n{name} minus {baseline} (paired, common random numbers)\n")
+        print(f"{'Ward':<6} " + " ".join(f"{metric:>26}" for metric in metrics))
+        print("-" * (7 + 27 * len(metrics)))
+        for key in metrics['Losses per day']:
+            cells = []
+            for metric in metrics:
+                if key in metrics[metric]:
+                    mean, half_width = metrics[metric][key]
+                    cells.append(f"{mean:>+14.4f} ± {half_width:<9.4f}")
+                else:
+                    cells.append(" " * 26)
+            print(f"{key:<6} " + " ".join(f"{cell:>26}" for cell in cells))
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JSON scenarios still work
+    tomllib = None
+
+# Scenario files describe a hospital declaratively, one table per ward:
+#
+#     name = "New ward F"
+#
+#     [wards.A]
+#     capacity = 55
+#     arrival_rate = 14.5        # patients per day
+#     mean_stay = 2.9            # days
+#     variance = 0.2378          # optional, log-normal length of stay
+#     urgency = 7                # optional
+#     relocation = { B = 0.05, C = 0.10, D = 0.05, E = 0.80 }
+#
+# Relocation targets are given by name, so the columns cannot be misaligned.
+# The order of the ward tables is the ward order of the compiled arrays. JSON
+# files with the same structure work too. A compiled scenario is cached under
+# the SHA-256 of its content and its arrays are read-only, so sweeps can reuse
+# it freely without parsing or validating it again.
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenario_files')
+
+_compiled = {}
+
+
+class HospitalParams(NamedTuple):
+    """ Validated, read-only parameters of one hospital scenario """
+    name: str
+    wards: tuple
+    capacities: np.ndarray
+    arrival_rates: np.ndarray
+    mean_stay: np.ndarray
+    variances: np.ndarray  # NaN where the scenario gives no variance
+    urgency_points: np.ndarray  # 0 where the scenario gives no urgency
+    relocation_probs: np.ndarray  # [ward, target ward]
+    relocation_cdf: np.ndarray  # cumulative over the target wards
+    digest: str
+
+    def as_dicts(self):
+        """ Fresh (capacities, relocation_probs, arrival_rates, mean_stay) dicts for the simulate functions """
+        # New lists every call, so a caller changing a relocation row cannot
+        # change the compiled scenario
+        wards = self.wards
+        return ({ward: int(self.capacities[i]) for i, ward in enumerate(wards)},
+                {ward: self.relocation_probs[i].tolist() for i, ward in enumerate(wards)},
+                {ward: float(self.arrival_rates[i]) for i, ward in enumerate(wards)},
+                {ward: float(self.mean_stay[i]) for i, ward in enumerate(wards)})
+
+    def variance_dict(self):
+        return {ward: float(self.variances[i]) for i, ward in enumerate(self.wards)}
+
+
+def read_only(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def is_integer(value):
+    # bool is an int subclass, but true = 1 bed is a typo, not a capacity
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_number(value):
+    # Checked before any comparison, which raises TypeError on a string
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compile_scenario(config, digest=None):
+    """ Validate a parsed scenario mapping and compile it into HospitalParams """
+    if digest is None:
+        # json.dumps keeps the key order, which is the ward order
+        digest = hashlib.sha256(json.dumps(config).encode()).hexdigest()
+    if digest in _compiled:
+        return _compiled[digest]
+
+    ward_tables = config.get('wards')
+    if not isinstance(ward_tables, dict) or not ward_tables:
+        raise ValueError("A scenario needs a non-empty 'wards' table")
+    wards = tuple(ward_tables)
+    index = {ward: i for i, ward in enumerate(wards)}
+    n_wards = len(wards)
+
+    probs = np.zeros((n_wards, n_wards))
+    for i, ward in enumerate(wards):
+        table = ward_tables[ward]
+        if not isinstance(table, dict):
+            raise ValueError(f"Ward {ward}: expected a table, got {table!r}")
+        unknown = set(table) - {'capacity', 'arrival_rate', 'mean_stay', 'variance', 'urgency', 'relocation'}
+        if unknown:
+            raise ValueError(f"Ward {ward}: unknown keys {sorted(unknown)}")
+        for key in ('capacity', 'arrival_rate', 'mean_stay'):
+            if key not in table:
+                raise ValueError(f"Ward {ward}: missing {key}")
+        capacity = table['capacity']
+        if not is_integer(capacity) or capacity < 0:
+            raise ValueError(f"Ward {ward}: capacity must be a non-negative integer, got {capacity!r}")
+        if not is_number(table['arrival_rate']) or not table['arrival_rate'] >= 0:
+            raise ValueError(f"Ward {ward}: arrival_rate must be non-negative, got {table['arrival_rate']!r}")
+        if not is_number(table['mean_stay']) or not table['mean_stay'] > 0:
+            raise ValueError(f"Ward {ward}: mean_stay must be positive, got {table['mean_stay']!r}")
+        if 'variance' in table and (not is_number(table['variance']) or not table['variance'] > 0):
+            raise ValueError(f"Ward {ward}: variance must be positive, got {table['variance']!r}")
+        if 'urgency' in table and not is_integer(table['urgency']):
+            raise ValueError(f"Ward {ward}: urgency must be an integer, got {table['urgency']!r}")
+        relocation = table.get('relocation', {})
+        if not isinstance(relocation, dict):
+            raise ValueError(f"Ward {ward}: relocation must be a table of probabilities, got {relocation!r}")
+        for target, prob in relocation.items():
+            if target not in index:
+                raise ValueError(f"Ward {ward}: relocation to unknown ward {target}")
+            if target == ward or not is_number(prob) or not 0 <= prob <= 1:
+                raise ValueError(f"Ward {ward}: invalid relocation probability {prob!r} to {target}")
+            probs[i, index[target]] = prob
+        # Whatever the row leaves over is the probability of losing the patient
+        if probs[i].sum() > 1 + 1e-9:
+            raise ValueError(f"Ward {ward}: relocation probabilities add up to more than 1")
+
+    def column(key, default):
+        return [ward_tables[ward].get(key, default) for ward in wards]
+
+    params = HospitalParams(
+        name=str(config.get('name', '')),
+        wards=wards,
+        capacities=read_only(column('capacity', 0), np.int64),
+        arrival_rates=read_only(column('arrival_rate', 0.0), float),
+        mean_stay=read_only(column('mean_stay', 1.0), float),
+        variances=read_only(column('variance', np.nan), float),
+        urgency_points=read_only(column('urgency', 0), np.int64),
+        relocation_probs=read_only(probs, float),
+        relocation_cdf=read_only(np.cumsum(probs, axis=1), float),
+        digest=digest,
+    )
+    _compiled[digest] = params
+    return params
+
+
+def load_scenario(path):
+    """ Load and compile a .toml or .json scenario file (a bare name is looked up in SCENARIO_DIR) """
+    if not os.path.exists(path) and not os.path.dirname(path):
+        path = os.path.join(SCENARIO_DIR, path if os.path.splitext(path)[1] else path + '.toml')
+    with open(path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if digest in _compiled:
+        return _compiled[digest]
+
+    if path.endswith('.json'):
+        config = json.loads(content)
+    elif path.endswith('.toml'):
+        if tomllib is None:
+            raise ImportError("Reading TOML scenarios needs Python 3.11 (tomllib); use a JSON scenario instead")
+        config = tomllib.loads(content.decode())
+    else:
+        raise ValueError(f"Unknown scenario format: {path}")
+    return compile_scenario(config, digest)
+
+
+def with_capacities(params, capacities):
+    """ The same scenario with other bed counts (a dict by ward or a sequence in ward order) """
+    if isinstance(capacities, dict):
+        capacities = [capacities[ward] for ward in params.wards]
+    capacities = np.asarray(capacities)
+    if capacities.shape != (len(params.wards),) or np.any(capacities < 0) or np.any(capacities != np.round(capacities)):
+        raise ValueError(f"Expected {len(params.wards)} non-negative integer capacities, got {capacities.tolist()}")
+    digest = hashlib.sha256((params.digest + json.dumps(capacities.astype(int).tolist())).encode()).hexdigest()
+    if digest not in _compiled:
+        _compiled[digest] = params._replace(capacities=read_only(capacities, np.int64), digest=digest)
+    return _compiled[digest]
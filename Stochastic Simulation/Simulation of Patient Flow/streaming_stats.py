@@ -0,0 +1,282 @@
+import math
+
+import numpy as np
+
+# Online statistics with memory that does not grow with the run length.
+# Simulators push observations as they happen (or one array chunk at a time)
+# instead of keeping every patient or car until the end of the run.
+
+
+class Welford:
+    """ Running count, mean and variance (Welford, Chan et al. for chunks) """
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values):
+            self.merge_moments(len(values), values.mean(), np.sum((values - values.mean()) ** 2))
+
+    def merge_moments(self, n, mean, m2):
+        """ Combine with the moments of another sample of size n """
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+    def merge(self, other):
+        if other.n:
+            self.merge_moments(other.n, other.mean, other.m2)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class TimeWeightedAverage:
+    """ Time average of a piecewise-constant level such as N(t) or Nq(t) """
+    __slots__ = ('start', 'last_time', 'level', 'area')
+
+    def __init__(self, start=0.0, level=0.0):
+        self.start = start
+        self.last_time = start
+        self.level = level
+        self.area = 0.0
+
+    def update(self, t, level):
+        """ The level changes to `level` at time t """
+        self.area += self.level * (t - self.last_time)
+        self.last_time = t
+        self.level = level
+
+    def mean(self, t=None):
+        """ Average over [start, t], with t the last update by default """
+        t = self.last_time if t is None else t
+        if t <= self.start:
+            return self.level
+        return (self.area + self.level * (t - self.last_time)) / (t - self.start)
+
+
+class P2Quantile:
+    """ P-squared estimate of one quantile with five markers (Jain and Chlamtac, 1985) """
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Cell of the new observation, widening the extreme markers if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = max(q[4], x)
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        d = self.desired
+        for i in range(5):
+            d[i] += self.increments[i]
+
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            offset = d[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic step leaves the bracket, fall back to linear
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def add_many(self, values):
+        for x in np.asarray(values, dtype=float).tolist():
+            self.add(x)
+
+    @property
+    def value(self):
+        q = self.heights
+        if len(q) < 5:
+            # Too few observations for the markers, use the sorted sample
+            return q[min(len(q) - 1, int(self.p * len(q)))] if q else math.nan
+        return q[2]
+
+
+class LogHistogramQuantiles:
+    """ Quantiles of non-negative values within relative error `accuracy`, in log-spaced bins """
+    # Bin k holds values in (gamma^(k-1), gamma^k]; with gamma = (1+a)/(1-a)
+    # every value in a bin is within relative error a of the bin's midpoint.
+    # The number of bins grows with log(max/min), not with the count, and
+    # whole arrays are added with one np.unique
+    __slots__ = ('accuracy', 'log_gamma', 'bins', 'zeros', 'n')
+
+    def __init__(self, accuracy=0.005):
+        self.accuracy = accuracy
+        self.log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        self.bins = {}
+        self.zeros = 0
+        self.n = 0
+
+    def add(self, x):
+        self.add_many([x])
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        self.n += len(values)
+        keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        bins = self.bins
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            bins[key] = bins.get(key, 0) + count
+
+    def quantile(self, p):
+        if self.n == 0:
+            return math.nan
+        rank = p * (self.n - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * math.exp(key * self.log_gamma) / (1 + math.exp(self.log_gamma))
+        return 2 * math.exp(max(self.bins) * self.log_gamma) / (1 + math.exp(self.log_gamma))
+
+
+class BlockingCounters:
+    """ Per-ward arrival outcomes: admitted, found the ward full, relocated elsewhere or lost """
+    __slots__ = ('wards', 'admitted', 'blocked', 'relocated', 'lost')
+
+    def __init__(self, wards):
+        self.wards = list(wards)
+        n_wards = len(self.wards)
+        self.admitted = [0] * n_wards
+        self.blocked = [0] * n_wards
+        # Counted by the patient's own ward, not by the ward taking them in
+        self.relocated = [0] * n_wards
+        self.lost = [0] * n_wards
+
+    def blocking_probability(self):
+        return {ward: self.blocked[i] / max(1, self.admitted[i] + self.blocked[i])
+                for i, ward in enumerate(self.wards)}
+
+    def loss_probability(self):
+        return {ward: self.lost[i] / max(1, self.admitted[i] + self.blocked[i])
+                for i, ward in enumerate(self.wards)}
+
+
+class HospitalStats:
+    """ Streaming statistics pushed by HospitalModel while it runs """
+
+    def __init__(self, wards, start=0.0, quantiles=(0.5, 0.9)):
+        self.wards = list(wards)
+        self.counters = BlockingCounters(self.wards)
+        self.occupancy = [TimeWeightedAverage(start) for _ in self.wards]
+        self.length_of_stay = [Welford() for _ in self.wards]
+        self.stay_quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def admit(self, t, patient_type, ward, occupancy, stay):
+        """ A patient of `patient_type` takes a bed in `ward`, which now holds `occupancy` patients """
+        counters = self.counters
+        if ward == patient_type:
+            counters.admitted[ward] += 1
+        else:
+            counters.blocked[patient_type] += 1
+            counters.relocated[patient_type] += 1
+        self.occupancy[ward].update(t, occupancy)
+        self.length_of_stay[patient_type].add(stay)
+        for estimate in self.stay_quantiles.values():
+            estimate.add(stay)
+
+    def lose(self, t, patient_type):
+        self.counters.blocked[patient_type] += 1
+        self.counters.lost[patient_type] += 1
+
+    def discharge(self, t, ward, occupancy):
+        self.occupancy[ward].update(t, occupancy)
+
+    def summary(self, t):
+        """ Everything collected up to time t, by ward """
+        return {
+            'prob_all_beds_occupied': self.counters.blocking_probability(),
+            'prob_lost': self.counters.loss_probability(),
+            'mean_occupancy': {ward: self.occupancy[i].mean(t) for i, ward in enumerate(self.wards)},
+            'mean_length_of_stay': {ward: self.length_of_stay[i].mean for i, ward in enumerate(self.wards)},
+            'length_of_stay_quantiles': {p: estimate.value for p, estimate in self.stay_quantiles.items()},
+        }
+
+
+class TandemStats:
+    """ Streaming statistics for the airport tandem queue, fed one chunk of cars at a time """
+    # Every car leaves the system, so the area under N(t) up to the last
+    # departure is the sum of the sojourn times (and likewise for Nq and the
+    # waiting times); the time averages need only these running sums
+
+    def __init__(self, accuracy=0.005):
+        self.cars = 0
+        self.last_departure = 0.0
+        self.sojourn = {queue: Welford() for queue in ('Queue1', 'Queue2', 'System')}
+        self.waiting = {queue: Welford() for queue in ('Queue1', 'Queue2', 'System')}
+        self.waiting_quantiles = {queue: LogHistogramQuantiles(accuracy) for queue in ('Queue1', 'Queue2', 'System')}
+
+    def add_chunk(self, result):
+        """ Push a chunk in the format returned by simulate_tandem """
+        arrivals = result['ArrivalTime']
+        exit_queue1 = result['TimeExitQueue1']
+        departures = result['DepartureTime']
+        service = result['ServiceTime']
+        self.cars += len(arrivals)
+        self.last_departure = max(self.last_departure, departures.max())
+        # Queue 1 treats the trip request as its service, Queue 2 the pickup
+        sojourn = {'Queue1': exit_queue1 - arrivals, 'Queue2': departures - exit_queue1, 'System': departures - arrivals}
+        waiting = {'Queue1': sojourn['Queue1'] - result['TripRequestTime'], 'Queue2': sojourn['Queue2'] - service,
+                   'System': sojourn['System'] - service}
+        for queue in sojourn:
+            self.sojourn[queue].add_many(sojourn[queue])
+            self.waiting[queue].add_many(waiting[queue])
+            self.waiting_quantiles[queue].add_many(waiting[queue])
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """ T, Tq, N and Nq per queue as in questions 3.5 and 3.6 of the notebook """
+        horizon = max(self.last_departure, 1e-300)
+        return {queue: {
+            'T': self.sojourn[queue].mean,
+            'Tq': self.waiting[queue].mean,
+            'N': self.sojourn[queue].mean * self.sojourn[queue].n / horizon,
+            'Nq': self.waiting[queue].mean * self.waiting[queue].n / horizon,
+            'Tq quantiles': {p: self.waiting_quantiles[queue].quantile(p) for p in quantiles},
+        } for queue in self.sojourn}
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from run_control import DailyHospital
+from scenarios import load_scenario, with_capacities
+
+# Sensitivity sweeps over the Task4 factors. A design is a list of points,
+# each a dict of factor values:
+#
+#     total_beds       beds of all wards together, Ward F included
+#     bed_capacity_F   beds of the new ward
+#     variance_factor  length of stay variance k / mean_stay^2 (Task4 uses
+#                      k = 2, 3, 4); None for the exponential model of Task3
+#     arrival_scale    multiplier on every arrival rate
+#
+# Factors a point leaves out keep the value of the base scenario. Every point
+# is run for a number of independent replications over a process pool, and
+# each finished point is committed to an SQLite table straight away, keyed by
+# a hash of the point and the run settings, so a restarted sweep only runs
+# the points that are missing. Every scenario has a table of its own, since
+# its wards decide the metric columns.
+
+FACTORS = ('total_beds', 'bed_capacity_F', 'variance_factor', 'arrival_scale')
+METRICS = ('prob_full', 'hospitalization_rate', 'losses_per_day')
+
+
+def grid_design(**levels):
+    """ Full factorial design, e.g. grid_design(total_beds=[150, 170, 180], variance_factor=[2, 3, 4]) """
+    names = list(levels)
+    return [dict(zip(names, values)) for values in product(*(levels[name] for name in names))]
+
+
+def latin_hypercube_design(n, seed=42, **ranges):
+    """ n points of a Latin hypercube; ranges are (low, high), integer factors are rounded """
+    names = list(ranges)
+    unit = qmc.LatinHypercube(d=len(names), seed=seed).random(n)
+    points = []
+    for row in unit:
+        point = {}
+        for name, u in zip(names, row):
+            low, high = ranges[name]
+            if isinstance(low, int) and isinstance(high, int):
+                # Every integer in [low, high] gets an equal share of [0, 1)
+                point[name] = int(low + min(int(u * (high - low + 1)), high - low))
+            else:
+                point[name] = float(low + u * (high - low))
+        points.append(point)
+    return points
+
+
+def reallocate_beds(params, total_beds, bed_capacity_F, new_ward='F'):
+    """ Capacities for `total_beds` beds, as reallocate_beds in the Task4 scripts """
+    # The other wards keep their share of the base capacities (rounded down),
+    # and the beds left over go one each to the most urgent wards
+    others = [i for i, ward in enumerate(params.wards) if ward != new_ward]
+    base = params.capacities[others]
+    remaining_beds = total_beds - bed_capacity_F
+    if remaining_beds < 0:
+        raise ValueError(f"Ward {new_ward} cannot have {bed_capacity_F} of {total_beds} beds")
+    shares = (base / base.sum() * remaining_beds).astype(np.int64)
+    by_urgency = sorted(range(len(others)), key=lambda k: -params.urgency_points[others[k]])
+    for k in by_urgency[:remaining_beds - shares.sum()]:
+        shares[k] += 1
+    capacities = params.capacities.copy()
+    capacities[others] = shares
+    capacities[params.wards.index(new_ward)] = bed_capacity_F
+    return capacities
+
+
+def point_id(point, days, replications, seed, digest):
+    """ Key of a point in the result store """
+    settings = {'point': {name: point.get(name) for name in FACTORS}, 'days': days,
+                'replications': replications, 'seed': seed, 'scenario': digest}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def replication_metrics(daily, days):
+    """ Metrics of one DailyHospital run, per ward (losses_per_day also has the total last) """
+    totals = {name: values.sum(axis=0) for name, values in daily.items()}
+    return {
+        'prob_full': totals['occupied_on_arrival'] / np.maximum(totals['arrivals'], 1),
+        'hospitalization_rate': totals['admissions'] / np.maximum(totals['admissions'] + totals['losses'], 1),
+        'losses_per_day': np.append(totals['losses'], totals['losses'].sum()) / days,
+    }
+
+
+def run_point(task):
+    """ All replications of one design point (runs in a worker process) """
+    params, point, days, replications, seed, key = task
+    total_beds = point.get('total_beds', int(params.capacities.sum()))
+    bed_capacity_F = point.get('bed_capacity_F', int(params.capacities[params.wards.index('F')]))
+    variance_factor = point.get('variance_factor')
+    arrival_scale = point.get('arrival_scale', 1.0)
+
+    params = with_capacities(params, reallocate_beds(params, total_beds, bed_capacity_F))
+    capacities, relocation_probs, arrival_rates, mean_stay = params.as_dicts()
+    arrival_rates = {ward: rate * arrival_scale for ward, rate in arrival_rates.items()}
+    variances = None
+    if variance_factor is not None:
+        variances = {ward: variance_factor / stay**2 for ward, stay in mean_stay.items()}
+
+    # The seed depends on the point itself, not on its place in the design
+    child_seeds = np.random.SeedSequence([seed, int(key, 16) % 2**63]).spawn(replications)
+    metrics = {name: [] for name in METRICS}
+    for child in child_seeds:
+        daily = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, variances, rng=child).run(days)
+        for name, values in replication_metrics(daily, days).items():
+            metrics[name].append(values)
+
+    row = {'point_id': key, 'total_beds': total_beds, 'bed_capacity_F': bed_capacity_F,
+           'variance_factor': variance_factor, 'arrival_scale': arrival_scale,
+           'days': days, 'replications': replications, 'seed': seed}
+    for name, samples in metrics.items():
+        samples = np.array(samples)
+        labels = list(params.wards) + (['Total'] if name == 'losses_per_day' else [])
+        mean = samples.mean(axis=0)
+        half_width = 1.96 * samples.std(axis=0, ddof=1) / np.sqrt(replications) if replications > 1 else np.full(len(labels), np.nan)
+        for i, label in enumerate(labels):
+            row[f'{name}_{label}'] = float(mean[i])
+            row[f'{name}_{label}_hw'] = float(half_width[i])
+    return row
+
+
+def open_store(path):
+    """ SQLite store with one row per finished point """
+    connection = sqlite3.connect(path)
+    # A scenario's table is created from the first row written. WAL mode lets
+    # the store be queried while a sweep is still writing to it
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+def results_table(params):
+    """ Name of the table holding the points of a compiled scenario """
+    return f'results_{params.digest[:16]}'
+
+
+def quoted(name):
+    """ An SQL identifier in double quotes """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def completed_points(connection, table):
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchall()
+    if not tables:
+        return set()
+    return {key for (key,) in connection.execute(f'SELECT point_id FROM {quoted(table)}')}
+
+
+def store_row(connection, table, row):
+    columns = ', '.join(quoted(name) for name in row)
+    connection.execute(f'CREATE TABLE IF NOT EXISTS {quoted(table)} ({columns}, PRIMARY KEY ("point_id"))')
+    connection.execute(f"INSERT OR REPLACE INTO {quoted(table)} ({columns}) VALUES ({', '.join('?' * len(row))})",
+                       list(row.values()))
+    connection.commit()
+
+
+def run_sweep(design, store, scenario='new_ward', days=365, replications=10, seed=42, workers=None, verbose=True):
+    """ Run every design point that is not in `store` yet and return the whole store as a DataFrame """
+    params = load_scenario(scenario)
+    table = results_table(params)
+    connection = open_store(store)
+    done = completed_points(connection, table)
+    tasks = []
+    for point in design:
+        key = point_id(point, days, replications, seed, params.digest)
+        if key not in done:
+            done.add(key)  # duplicate points in the design run once
+            tasks.append((params, point, days, replications, seed, key))
+    if verbose:
+        print(f"Sweep: {len(design)} points, {len(design) - len(tasks)} already in {store}, {len(tasks)} to run")
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            store_row(connection, table, run_point(task))
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_point, task) for task in tasks]
+            for finished, future in enumerate(as_completed(futures), 1):
+                store_row(connection, table, future.result())
+                if verbose and finished % max(1, len(tasks) // 20) == 0:
+                    print(f"  {finished}/{len(tasks)} points")
+    connection.close()
+    return load_results(store, scenario=scenario)
+
+
+def load_results(store, where=None, scenario='new_ward'):
+    """ Stored results of a scenario as a DataFrame, optionally filtered by an SQL condition """
+    table = results_table(load_scenario(scenario))
+    connection = sqlite3.connect(store)
+    try:
+        if not completed_points(connection, table):
+            return pd.DataFrame()
+        return pd.read_sql(f"SELECT * FROM {quoted(table)}{' WHERE ' + where if where else ''}", connection)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    # The three Task4 studies as one grid: total beds x length of stay variance
+    design = grid_design(total_beds=[150, 170, 180], variance_factor=[2, 3, 4])
+    results = run_sweep(design, 'task4_sweep.sqlite', replications=10)
+    print(results[['total_beds', 'variance_factor', 'losses_per_day_Total', 'losses_per_day_Total_hw']])
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# The modules of this directory import each other by name, as the Task
+# scripts do, the queue modules live in Queue Simulation and service.py at the
+# top of the repository. The result cache is off so every test simulates.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PATIENT_FLOW = os.path.dirname(HERE)
+ROOT = os.path.dirname(os.path.dirname(PATIENT_FLOW))
+QUEUES = os.path.join(ROOT, 'Queue Simulation')
+sys.path[:0] = [PATIENT_FLOW, QUEUES, ROOT]
+os.environ['SIMULATION_CACHE'] = 'off'
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from arrival_process import (ArrivalStream, PiecewiseLinearRate, arrival_chunks, arrivals_by_inversion,
+                             arrivals_by_thinning, lambda_t)
+
+
+def test_inverse_undoes_the_integrated_rate():
+    rate = PiecewiseLinearRate([0, 2, 3, 6], [5.0, 0.0, 0.0, 5.0])
+    t = np.random.default_rng(0).uniform(0, 30, 1000)
+    # Outside the segment without arrivals, Lambda is strictly increasing
+    t = t[(np.mod(t, 6) < 2) | (np.mod(t, 6) > 3)]
+    assert np.allclose(rate.inverse(rate.cumulative(t)), t)
+    assert rate.per_period == pytest.approx(5 + 7.5)
+    assert rate.cumulative(6.0) == pytest.approx(rate.per_period)
+
+
+@pytest.mark.parametrize('method', [arrivals_by_inversion, arrivals_by_thinning])
+def test_hourly_counts_follow_the_integrated_rate(method):
+    n = 200_000
+    arrivals = method(lambda_t, n, rng=1)
+    assert len(arrivals) == n and np.all(np.diff(arrivals) > 0)
+    # Arrivals in each hour of the period, over the whole periods covered
+    periods = int(arrivals[-1] // lambda_t.period)
+    counted = arrivals[arrivals < periods * lambda_t.period]
+    counts = np.bincount(np.mod(counted, lambda_t.period).astype(int), minlength=10)
+    hours = np.arange(11)
+    expected = periods * np.diff(lambda_t.cumulative(hours))
+    assert np.all(np.abs(counts - expected) <= 4 * np.sqrt(expected))
+
+
+def test_stream_chunks_resume_from_their_state():
+    whole = arrivals_by_inversion(lambda_t, 1000, rng=2)
+    stream = ArrivalStream(lambda_t, 1000, chunk_size=300, rng=2)
+    first = next(stream)
+    state = stream.get_state()
+    rest = np.concatenate(list(stream))
+    resumed = ArrivalStream(lambda_t, 1000, chunk_size=300, rng=99)
+    resumed.set_state(state)
+    assert np.allclose(np.concatenate((first, rest)), whole)
+    assert np.array_equal(np.concatenate(list(resumed)), rest)
+
+
+def test_thinning_chunks():
+    chunks = list(arrival_chunks(lambda_t, 1000, chunk_size=256, method='thinning', rng=3))
+    assert [len(chunk) for chunk in chunks] == [256, 256, 256, 232]
+    assert np.all(np.diff(np.concatenate(chunks)) > 0)
+    with pytest.raises(ValueError):
+        next(arrival_chunks(lambda_t, 10, method='exact'))
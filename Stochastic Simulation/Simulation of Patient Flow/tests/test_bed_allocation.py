@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import bed_allocation
+from bed_allocation import BedAllocationOptimizer
+from erlang_loss import overflow_fixed_point
+from scenarios import load_scenario
+
+
+def moves(allocation):
+    """ Every allocation one bed move away """
+    for i in range(len(allocation)):
+        for j in range(len(allocation)):
+            if i != j and allocation[i] > 0:
+                moved = list(allocation)
+                moved[i] -= 1
+                moved[j] += 1
+                yield tuple(moved)
+
+
+def test_local_search_ends_in_a_local_optimum():
+    params = load_scenario('new_ward')
+    optimizer = BedAllocationOptimizer(params)
+    start = optimizer.greedy(180)
+    best = optimizer.local_search(start)
+    assert sum(start) == sum(best) == 180
+    # Scored from scratch, no single bed move improves on the result
+    neighbours = np.array([best] + list(moves(best)))
+    result = overflow_fixed_point(neighbours, params.arrival_rates, params.mean_stay, params.relocation_probs)
+    scores = result['losses_per_day'] @ params.urgency_points
+    assert scores[0] <= scores[1:].min()
+    assert optimizer.surrogate([best])[0] == pytest.approx(scores[0])
+    assert optimizer.surrogate([best])[0] <= optimizer.surrogate([start])[0]
+
+
+def test_shortfall_penalty_enforces_the_target_rate():
+    params = load_scenario('new_ward')
+    optimizer = BedAllocationOptimizer(params, min_hospitalization={'F': 0.95})
+    best = optimizer.local_search(optimizer.greedy(180))
+    result = overflow_fixed_point(np.array(best), params.arrival_rates, params.mean_stay, params.relocation_probs)
+    assert result['hospitalization_rate'][params.wards.index('F')] >= 0.95
+    # Below the target the penalty outweighs any losses
+    assert optimizer.score(np.zeros(6), np.full(6, 0.94)) == pytest.approx(10.0)
+
+
+def test_simulations_are_memoized_and_share_their_seeds(monkeypatch):
+    params = load_scenario('new_ward')
+    runs = []
+    run_one = bed_allocation.run_one
+
+    def counted(task):
+        runs.append(task)
+        return run_one(task)
+
+    monkeypatch.setattr(bed_allocation, 'run_one', counted)
+    allocation = tuple(int(beds) for beds in params.capacities)
+    optimizer = BedAllocationOptimizer(params)
+    first = optimizer.simulate([allocation], days=60, warmup_days=10, replications=3, workers=1)[0]
+    again = optimizer.simulate([allocation, allocation], days=60, warmup_days=10, replications=3, workers=1)
+    assert len(runs) == 3 and again == [first, first]
+    # Another optimizer draws the same replications (common random numbers)
+    other = BedAllocationOptimizer(params).simulate([allocation], days=60, warmup_days=10, replications=3, workers=1)
+    assert other[0]['score'] == first['score']
+    assert first['score'] == pytest.approx(first['losses_per_day'] @ params.urgency_points)
+
+
+def test_optimize_returns_the_best_simulated_candidate():
+    params = load_scenario('new_ward')
+    optimizer = BedAllocationOptimizer(params)
+    with pytest.raises(ValueError):
+        optimizer.optimize(180, start=(30,) * 5)
+    result = optimizer.optimize(180, confirm=3, days=60, warmup_days=10, replications=2, workers=1)
+    table = result['candidates']
+    assert len(table) == 3 and sum(result['allocation'].values()) == 180
+    assert result['score'] == table['simulated'].min()
+    assert [result['allocation'][ward] for ward in params.wards] == table.loc[0, list(params.wards)].tolist()
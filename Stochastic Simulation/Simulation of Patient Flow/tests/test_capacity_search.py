@@ -0,0 +1,41 @@
+import numpy as np
+
+from capacity_search import analytic_bracket, evaluate_with_crn, find_minimum_capacity, simulated_replications
+from erlang_loss import erlang_b
+
+
+def test_bisection_finds_smallest_feasible_capacity():
+    # A rate that first meets the target at 31 beds, inside, above and at the top of the bracket
+    def evaluate(capacity):
+        return min(1.0, 0.8 + capacity / 206), 3
+
+    for lower, upper in ((20, 25), (10, 40), (30, 31)):
+        capacity, evaluations = find_minimum_capacity(evaluate, lower, upper, 0.95)
+        assert capacity == 31
+        assert evaluations[30][0] < 0.95 <= evaluations[31][0]
+        assert simulated_replications(evaluations) == 3 * len(evaluations)
+
+
+def test_no_capacity_meets_an_unreachable_target():
+    capacity, evaluations = find_minimum_capacity(lambda capacity: (0.5, 1), 10, 20, 0.95, max_capacity=50)
+    assert capacity is None and max(evaluations) == 50
+
+
+def test_analytic_bracket():
+    lower, upper = analytic_bracket(13.0, 2.2, [0.2] * 5 + [0.0], 0.95)
+    assert erlang_b(upper, 13.0 * 2.2) <= 0.05 < erlang_b(upper - 1, 13.0 * 2.2)
+    assert 0 < lower < upper
+
+
+def test_crn_replications_reseed_the_global_state():
+    draws = []
+
+    def replicate():
+        draws.append(np.random.random())
+        return draws[-1], None
+
+    evaluate_with_crn(replicate, 2.0, seed=7, max_replications=3)
+    first = list(draws)
+    draws.clear()
+    evaluate_with_crn(replicate, 2.0, seed=7, max_replications=3)
+    assert draws == first
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+import checkpoint
+from checkpoint import (Checkpoint, advance_with_checkpoints, replications_with_checkpoints,
+                        run_days_with_checkpoints)
+from hospital_model import HospitalModel
+from run_control import DailyHospital
+from scenarios import load_scenario, with_capacities
+
+
+def assert_same_totals(first, second):
+    assert first.keys() == second.keys()
+    for name in first:
+        assert np.array_equal(first[name], second[name]), name
+
+
+def test_a_failed_write_keeps_the_previous_snapshot(tmp_path, monkeypatch):
+    snapshot = Checkpoint(tmp_path / 'run.npz')
+    snapshot.save({'occupancy': np.arange(3)}, {'day': 1})
+
+    def interrupted(file, **members):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(checkpoint.np, 'savez_compressed', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        snapshot.save({'occupancy': np.arange(5)}, {'day': 2})
+    arrays, meta = snapshot.load()
+    assert arrays['occupancy'].tolist() == [0, 1, 2] and meta == {'day': 1}
+    assert os.listdir(tmp_path) == ['run.npz']
+
+
+def test_daily_hospital_resumes_bit_identical(tmp_path):
+    args = load_scenario('new_ward').as_dicts()
+    uninterrupted = run_days_with_checkpoints(DailyHospital(*args, rng=3), 500, tmp_path / 'whole.npz', interval=100)
+    # The first run stops after 200 days; a fresh model picks up its snapshot
+    path = tmp_path / 'interrupted.npz'
+    run_days_with_checkpoints(DailyHospital(*args, rng=3), 200, path, interval=100)
+    resumed_model = DailyHospital(*args, rng=99)
+    resumed = run_days_with_checkpoints(resumed_model, 500, path, interval=100)
+    assert resumed_model.day == 500
+    assert_same_totals(resumed, uninterrupted)
+    # A snapshot of a finished run just returns its totals
+    assert_same_totals(run_days_with_checkpoints(DailyHospital(*args), 500, path, interval=100), uninterrupted)
+
+
+def test_hospital_model_resumes_bit_identical(tmp_path):
+    args = load_scenario('new_ward').as_dicts()
+    whole = HospitalModel(*args, rng=5)
+    whole.advance(400.0)
+    path = tmp_path / 'events.npz'
+    advance_with_checkpoints(HospitalModel(*args, rng=5), 150.0, path, interval=60.0)
+    resumed = advance_with_checkpoints(HospitalModel(*args, rng=0), 400.0, path, interval=60.0)
+    for expected, got in zip(whole.results(400), resumed.results(400)):
+        assert expected == got
+
+
+def test_a_snapshot_of_another_model_is_refused(tmp_path):
+    params = load_scenario('new_ward')
+    path = tmp_path / 'run.npz'
+    run_days_with_checkpoints(DailyHospital(*params.as_dicts(), rng=0), 50, path, interval=25)
+    other = with_capacities(params, params.capacities + 1).as_dicts()
+    with pytest.raises(ValueError):
+        run_days_with_checkpoints(DailyHospital(*other, rng=0), 100, path)
+    # Same parameters, but log-normal stays
+    variances = {ward: 1.0 for ward in params.wards}
+    with pytest.raises(ValueError):
+        run_days_with_checkpoints(DailyHospital(*params.as_dicts(), variances, rng=0), 100, path)
+
+    events = tmp_path / 'events.npz'
+    advance_with_checkpoints(HospitalModel(*params.as_dicts(), rng=0), 10.0, events)
+    with pytest.raises(ValueError):
+        advance_with_checkpoints(HospitalModel(*other, rng=0), 20.0, events)
+    with pytest.raises(ValueError):
+        DailyHospital(*params.as_dicts()).set_state(*Checkpoint(events).load())
+
+
+def test_replications_resume_where_they_stopped(tmp_path):
+    args = load_scenario('new_ward').as_dicts()
+    whole = replications_with_checkpoints(*args, days=120, replications=4, checkpoint=tmp_path / 'whole.npz',
+                                          interval=50)
+    path = tmp_path / 'replications.npz'
+    replications_with_checkpoints(*args, days=120, replications=2, checkpoint=path, interval=50)
+    resumed = replications_with_checkpoints(*args, days=120, replications=4, checkpoint=path, interval=50)
+    assert whole['losses'].shape == (4, 6)
+    assert_same_totals(resumed, whole)
+    assert not os.path.exists(str(path) + '.current')
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from erlang_loss import attempt_probabilities, erlang_b, overflow_fixed_point, servers_for_blocking
+from hospital_model import HospitalModel
+from scenarios import load_scenario
+
+
+def erlang_b_recursion(servers, load):
+    """ Textbook recursion B(0) = 1, B(n) = a B(n-1) / (n + a B(n-1)) for a single pair """
+    blocking = 1.0
+    for n in range(1, servers + 1):
+        blocking = load * blocking / (n + load * blocking)
+    return blocking
+
+
+def test_vectorized_erlang_b_matches_the_scalar_recursion():
+    servers = np.arange(0, 60)[:, None]
+    # Light to heavy loads, a zero load and loads where exp(-a) underflows
+    load = np.array([0.0, 0.3, 2.5, 14.0, 45.0, 120.0, 800.0, 2000.0])
+    blocking = erlang_b(servers, load)
+    expected = [[erlang_b_recursion(c, a) for a in load] for c in servers[:, 0]]
+    assert blocking.shape == (60, 8)
+    assert np.allclose(blocking, expected, rtol=1e-10, atol=1e-300)
+    assert erlang_b(5, 3.0) == pytest.approx(erlang_b_recursion(5, 3.0))
+
+
+def test_servers_for_blocking_is_the_smallest_sufficient():
+    load = np.array([0.5, 4.0, 30.0, 250.0])
+    servers = servers_for_blocking(load, 0.01)
+    assert np.all(erlang_b(servers, load) <= 0.01)
+    assert np.all(erlang_b(servers - 1, load) > 0.01)
+    with pytest.raises(ValueError):
+        servers_for_blocking([1000.0], 1e-6, max_servers=100)
+
+
+def test_attempt_probabilities_follow_the_relocation_walk():
+    probs = np.array([[0.0, 0.5, 0.3], [0.4, 0.0, 0.6], [0.2, 0.2, 0.0]])
+    blocking = np.array([0.1, 0.4, 0.7])
+    tried, lost = attempt_probabilities(probs, blocking)
+    # Walk the row with every ward tried with p_ij, and found free with 1 - B_j
+    rng = np.random.default_rng(0)
+    n = 200_000
+    for i in range(3):
+        remaining = np.ones(n, dtype=bool)
+        for j in range(3):
+            tries = remaining & (rng.random(n) < probs[i, j])
+            assert tries.mean() == pytest.approx(tried[i, j], abs=0.005)
+            remaining &= ~(tries & (rng.random(n) >= blocking[j]))
+        assert remaining.mean() == pytest.approx(lost[i], abs=0.005)
+
+
+def test_without_relocation_every_ward_is_an_erlang_loss_system():
+    params = load_scenario('new_ward')
+    result = overflow_fixed_point(params.capacities, params.arrival_rates, params.mean_stay,
+                                  np.zeros_like(params.relocation_probs))
+    assert np.allclose(result['blocking'], erlang_b(params.capacities, params.arrival_rates * params.mean_stay))
+    assert np.allclose(result['lost'], 1.0) and result['iterations'] <= 2
+    assert np.allclose(result['losses_per_day'], params.arrival_rates * result['blocking'])
+
+
+def test_fixed_point_is_consistent_and_stacks_allocations():
+    params = load_scenario('new_ward')
+    args = params.arrival_rates, params.mean_stay, params.relocation_probs
+    result = overflow_fixed_point(params.capacities, *args)
+    blocking, tried = result['blocking'], attempt_probabilities(params.relocation_probs, result['blocking'])[0]
+    # At the fixed point the blocking is Erlang-B of the own and relocated load
+    overflow = (params.arrival_rates * blocking)[:, None] * tried
+    load = (params.arrival_rates + overflow.sum(axis=0)) * params.mean_stay
+    assert np.allclose(blocking, erlang_b(params.capacities, load), atol=1e-8)
+    assert np.allclose(result['relocated'].sum(axis=1) + result['lost'], 1.0)
+
+    allocations = np.array([params.capacities, params.capacities + 2])
+    stacked = overflow_fixed_point(allocations, *args)
+    assert np.allclose(stacked['blocking'][0], blocking, atol=1e-8)
+    assert stacked['losses_per_day'][1].sum() < result['losses_per_day'].sum()
+
+
+def test_fixed_point_is_close_to_the_simulated_losses():
+    params = load_scenario('new_ward')
+    result = overflow_fixed_point(params.capacities, params.arrival_rates, params.mean_stay,
+                                  params.relocation_probs, own_stay=True)
+    days = 2000
+    losses = HospitalModel(*params.as_dicts(), rng=0).run(days)[2]
+    simulated = sum(losses.values()) / days
+    # The approximation treats the overflow as Poisson, so agreement is rough
+    assert simulated == pytest.approx(result['losses_per_day'].sum(), rel=0.25)
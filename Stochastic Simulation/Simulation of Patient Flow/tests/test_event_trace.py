@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from event_trace import EVENT_CODES, EVENT_DTYPE, HEADER_SIZE, TraceWriter, length_of_stay, read_trace
+from hospital_model import HospitalModel
+from scenarios import load_scenario
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'run.trace'
+    rng = np.random.default_rng(0)
+    expected = np.zeros(1000, dtype=EVENT_DTYPE)
+    expected['time'] = np.sort(rng.random(1000))
+    expected['entity'] = np.arange(1000)
+    expected['location'] = rng.integers(0, 6, 1000)
+    expected['event'] = rng.integers(0, len(EVENT_CODES), 1000)
+
+    # Small chunks, so the file and its map are grown many times
+    with TraceWriter(path, meta={'wards': list('ABCDEF')}, chunk_records=64) as trace:
+        for record in expected[:300]:
+            trace.append(*record.item())
+        trace.append_array(expected[300:700])
+        trace.append_many(expected['time'][700:], expected['entity'][700:], expected['location'][700:],
+                          expected['event'][700:])
+        assert len(trace) == 1000
+
+    records, meta = read_trace(path)
+    assert np.array_equal(records, expected)
+    assert meta['wards'] == list('ABCDEF') and meta['events'][EVENT_CODES['discharge']] == 'discharge'
+    # The spare records of the last chunk are cut off
+    assert os.path.getsize(path) == HEADER_SIZE + 1000 * EVENT_DTYPE.itemsize
+
+
+def test_flushed_records_survive_a_writer_that_never_closes(tmp_path):
+    path = tmp_path / 'cut.trace'
+    trace = TraceWriter(path, chunk_records=16)
+    trace.append_many(np.arange(40.0), np.arange(40), 0, 'admission')
+    trace.flush()
+    trace.append_many(np.arange(40.0, 50.0), np.arange(40, 50), 0, 'admission')
+    records, _ = read_trace(path)
+    assert len(records) == 40 and records['entity'][-1] == 39
+    trace.close()
+    assert len(read_trace(path)[0]) == 50
+
+
+def test_length_of_stay():
+    records = np.zeros(6, dtype=EVENT_DTYPE)
+    records['time'] = [0.0, 0.5, 1.0, 2.5, 3.0, 4.0]
+    records['entity'] = [0, 1, 2, 0, 2, 1]
+    records['location'] = [0, 1, 1, 0, 1, 1]
+    records['event'] = [EVENT_CODES[name] for name in
+                        ('admission', 'relocation', 'admission', 'discharge', 'discharge', 'discharge')]
+    # Chunks of 2 records split every patient's admission from the discharge
+    locations, stays = length_of_stay(records, chunk_size=2)
+    assert locations.tolist() == [0, 1, 1] and stays.tolist() == [2.5, 2.0, 3.5]
+
+
+def test_hospital_trace(tmp_path):
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    path = tmp_path / 'hospital.trace'
+    untraced = HospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, rng=3).run(365)
+    with TraceWriter(path, meta={'wards': list(capacities)}, chunk_records=4096) as trace:
+        traced = HospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, rng=3, trace=trace).run(365)
+    assert repr(traced) == repr(untraced)
+
+    records, _ = read_trace(path)
+    events = records['event']
+    admissions, relocations, losses = traced[:3]
+    for name, counts in (('admission', admissions), ('relocation', relocations), ('loss', losses)):
+        # Every event of the counters is in the trace
+        assert np.sum(events == EVENT_CODES[name]) == sum(counts.values()), name
+    # Every patient arrives once, numbered from 0 without gaps
+    arrived = records['entity'][np.isin(events, [EVENT_CODES['admission'], EVENT_CODES['blocked']])]
+    assert np.array_equal(np.sort(arrived), np.arange(len(arrived)))
+
+    locations, stays = length_of_stay(records, chunk_size=10**4)
+    assert len(stays) == np.sum(events == EVENT_CODES['discharge']) and np.all(stays >= 0)
+
+
+def test_length_of_stay_of_a_single_ward(tmp_path):
+    path = tmp_path / 'ward.trace'
+    with TraceWriter(path) as trace:
+        HospitalModel({'A': 10}, {'A': [0.0]}, {'A': 8.0}, {'A': 1.5}, rng=0, trace=trace).run(365)
+    locations, stays = length_of_stay(read_trace(path)[0])
+    # Exponential stays with mean 1.5 days: the standard deviation is 1.5 too
+    assert np.all(locations == 0)
+    assert abs(stays.mean() - 1.5) <= 4 * 1.5 / np.sqrt(len(stays))
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+
+import Task3
+import Task4_SensitivityAnalysis_TestDistributionBeds as Task4
+from hospital_kernel import resolve_backend, simulate_hospital, simulate_hospital_reference
+from relocation import alias_table
+from scenarios import load_scenario
+
+DAYS = 365
+RUNS = 60
+
+
+def task_script_totals(simulate, seeds):
+    """ (admissions, relocations, losses) with one row per replication of a Task script's simulate function """
+    runs = []
+    for seed in seeds:
+        np.random.seed(seed)
+        admissions, relocations, losses = simulate()[:3]
+        runs.append([[counts[ward] for ward in admissions] for counts in (admissions, relocations, losses)])
+    return np.array(runs).transpose(1, 0, 2)
+
+
+def assert_same_distribution(script, kernel):
+    for name, s, k in zip(('admissions', 'relocations', 'losses'), script, kernel):
+        # Every ward's difference of means lies within 4 standard errors and
+        # the two-sample KS test does not reject at level 1e-4
+        standard_error = np.sqrt(s.var(axis=0, ddof=1) / len(s) + k.var(axis=0, ddof=1) / len(k))
+        difference = np.abs(s.mean(axis=0) - k.mean(axis=0))
+        assert np.all(difference <= 4 * standard_error + 1e-12), (name, difference, standard_error)
+        p_values = [ks_2samp(s[:, i], k[:, i]).pvalue for i in range(s.shape[1])]
+        assert min(p_values) > 1e-4, (name, p_values)
+
+
+@pytest.mark.parametrize('backend', ['auto', 'numpy'])
+def test_exponential_stays_agree_with_task3(backend):
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    script = task_script_totals(lambda: Task3.simulate_hospital_with_new_ward(DAYS, capacities, relocation_probs),
+                                range(RUNS))
+    kernel = simulate_hospital(DAYS, capacities, relocation_probs, arrival_rates, mean_stay, RUNS, seed=1,
+                               backend=backend)
+    assert_same_distribution(script, kernel[1:4])
+
+
+def test_lognormal_stays_agree_with_task4():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    variances = Task4.variances
+    script = task_script_totals(
+        lambda: Task4.simulate_hospital_with_lognorm(DAYS, capacities, relocation_probs, variances), range(RUNS))
+    # 'auto' has a lognormal path whether or not Numba is installed
+    kernel = simulate_hospital(DAYS, capacities, relocation_probs, arrival_rates, mean_stay, RUNS,
+                               variances=variances, seed=1)
+    assert_same_distribution(script, kernel[1:4])
+
+
+def test_alias_tables_keep_the_probabilities():
+    probs = np.array([0.05, 0.0, 0.3, 0.15, 0.5])
+    accept, alias = alias_table(probs)
+    # Column i keeps accept[i] of its 1/n share and gives the rest to alias[i]
+    recovered = accept.copy()
+    np.add.at(recovered, alias, 1.0 - accept)
+    assert np.allclose(recovered / len(probs), probs)
+
+
+def test_alias_routing_agrees_with_the_relocation_walk():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    # Half the beds, so most patients overflow and every relocation path is used
+    capacities = {ward: beds // 2 for ward, beds in capacities.items()}
+    walk = simulate_hospital(DAYS, capacities, relocation_probs, arrival_rates, mean_stay, RUNS, seed=1,
+                             backend='python')
+    alias = simulate_hospital(DAYS, capacities, relocation_probs, arrival_rates, mean_stay, RUNS, seed=2,
+                              backend='alias')
+    assert_same_distribution(walk[1:4], alias[1:4])
+    # Every overflow patient is relocated or lost
+    assert np.array_equal(alias[5].sum(axis=1), alias[2].sum(axis=1) + alias[3].sum(axis=1))
+
+
+def test_uncompiled_loop_keeps_the_global_state():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    np.random.seed(5)
+    expected = np.random.random()
+    np.random.seed(5)
+    simulate_hospital(30, capacities, relocation_probs, arrival_rates, mean_stay, 2, backend='arrays')
+    assert np.random.random() == expected
+    assert resolve_backend('arrays') == 'arrays'
+
+
+def test_reference_counts_a_loss_as_walking_the_whole_row():
+    class Profile:
+        stack = ()
+
+        def add_time(self, *args):
+            pass
+
+        def count_many(self, counts):
+            self.counts = counts
+
+    profile = Profile()
+    admissions, relocations, losses, _, occupied_on_arrival = simulate_hospital_reference(
+        50, {'A': 1}, {'A': []}, {'A': 5.0}, {'A': 1.0}, rng=0, profile=profile)
+    assert losses[0] == occupied_on_arrival[0] > 0 and relocations[0] == 0
+    # The row of a single ward has one entry, padded as in to_arrays
+    assert profile.counts['relocation_attempts'] == losses[0]
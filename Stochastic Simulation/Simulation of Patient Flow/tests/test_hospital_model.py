@@ -0,0 +1,68 @@
+import numpy as np
+
+import Task3
+from erlang_loss import erlang_b
+from hospital_model import HospitalModel
+from scenarios import load_scenario
+
+DAYS = 365
+RUNS = 60
+
+
+def hospital_counts(run):
+    """ Per-replication arrivals and hospitalization rates of wards, from result tuples in the Task3 format """
+    arrivals, rates = [], []
+    for admissions, _, losses, _, prob_all_beds_occupied, _, _ in run:
+        # Blocked arrivals are admissions * p / (1 - p) with p = P(all beds occupied)
+        arrivals.append([admissions[w] / (1 - p) for w, p in prob_all_beds_occupied.items()])
+        rates.append([admissions[w] / (admissions[w] + losses[w]) for w in admissions])
+    return np.array(arrivals), np.array(rates)
+
+
+def task3_runs(capacities, relocation_probs):
+    for seed in range(RUNS):
+        np.random.seed(seed)
+        yield Task3.simulate_hospital_with_new_ward(DAYS, capacities, relocation_probs)
+
+
+def event_runs(capacities, relocation_probs, arrival_rates, mean_stay):
+    for seed in range(RUNS):
+        yield HospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, rng=seed).run(DAYS)
+
+
+def test_agrees_with_task3():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    day_arrivals, day_rates = hospital_counts(task3_runs(capacities, relocation_probs))
+    event_arrivals, event_rates = hospital_counts(event_runs(capacities, relocation_probs, arrival_rates, mean_stay))
+
+    # Both models see the same demand: the arrivals of every ward agree
+    # within 4 standard errors
+    standard_error = np.sqrt((day_arrivals.var(axis=0, ddof=1) + event_arrivals.var(axis=0, ddof=1)) / RUNS)
+    assert np.all(np.abs(day_arrivals.mean(axis=0) - event_arrivals.mean(axis=0)) <= 4 * standard_error)
+
+    # The Task scripts admit a whole day of arrivals before that day's
+    # departures, so their beds look fuller in the morning and emptier in the
+    # evening than in continuous time; the hospitalization rates still agree
+    # to within a few points in every ward
+    assert np.all(np.abs(day_rates.mean(axis=0) - event_rates.mean(axis=0)) < 0.05)
+
+
+def test_single_ward_blocking_is_erlang_b():
+    # One ward with no relocation is an M/M/c/c loss system
+    blocking = []
+    for seed in range(40):
+        model = HospitalModel({'A': 10}, {'A': [0.0]}, {'A': 8.0}, {'A': 1.0}, rng=seed)
+        admissions, _, losses, _, prob_all_beds_occupied, _, _ = model.run(DAYS)
+        assert admissions['A'] + losses['A'] > 0
+        blocking.append(prob_all_beds_occupied['A'])
+    standard_error = np.std(blocking, ddof=1) / np.sqrt(len(blocking))
+    assert abs(np.mean(blocking) - erlang_b(10, 8.0)) <= 4 * standard_error
+
+
+def test_patient_store_reuses_slots():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    model = HospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, rng=1)
+    model.run(100)
+    # Every patient in a bed holds one slot, and the store never outgrows the hospital
+    assert len(model.patients) == sum(model.ward_occupancy) == len(model.calendar)
+    assert len(model.patients.ward) == sum(capacities.values())
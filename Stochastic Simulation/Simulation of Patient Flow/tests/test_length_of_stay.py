@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from length_of_stay import Empirical, Exponential, Gamma, LogNormal, StayDistribution, daily_stays
+
+MEAN_STAY = {'A': 2.9, 'F': 2.2}
+VARIANCES = {'A': 1.5, 'F': 0.4}
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        StayDistribution()
+
+
+@pytest.mark.parametrize('distribution', [
+    Exponential(MEAN_STAY), LogNormal(MEAN_STAY, VARIANCES), Gamma(MEAN_STAY, VARIANCES),
+    Empirical({'A': [1.0, 2.9, 4.8], 'F': [2.2]}),
+])
+def test_sample_means(distribution):
+    rng = np.random.default_rng(0)
+    for ward, mean in MEAN_STAY.items():
+        assert np.isclose(distribution.mean(ward), mean)
+        assert abs(distribution.sample(rng, ward, 200000).mean() - mean) < 0.02 * mean
+
+
+def test_daily_stays_draw_from_the_global_state():
+    np.random.seed(3)
+    stays = daily_stays(365, MEAN_STAY, MEAN_STAY, VARIANCES)
+    np.random.seed(3)
+    expected = LogNormal(MEAN_STAY, VARIANCES).block(np.random, MEAN_STAY, 365)
+    assert all(np.array_equal(stays[ward], expected[ward]) for ward in MEAN_STAY)
+    assert stays['A'].shape == (365,)
@@ -0,0 +1,48 @@
+import numpy as np
+
+from arrival_process import arrivals_by_inversion, lambda_t
+from occupancy import occupancy_on_grid, occupancy_steps, time_average, time_grid
+from tandem_queue import simulate_tandem
+
+
+def notebook_counts(arrivals, departures, hours):
+    """ Cumulative arrivals, departures and number in system as in the double loop of the notebook (cell 10) """
+    in_system, cumulative_arrivals, cumulative_departures = [], [], []
+    for t in hours:
+        in_system.append(0)
+        cumulative_arrivals.append(0)
+        cumulative_departures.append(0)
+        for a, d in zip(arrivals, departures):
+            if a < t:
+                cumulative_arrivals[-1] += 1
+                if d > t:
+                    in_system[-1] += 1
+            if d < t:
+                cumulative_departures[-1] += 1
+    return cumulative_arrivals, cumulative_departures, in_system
+
+
+def test_searchsorted_counts_match_the_double_loop():
+    result = simulate_tandem(arrivals_by_inversion(lambda_t, 800, rng=0), rng=1)
+    arrivals, departures = result['ArrivalTime'], result['DepartureTime']
+    # Whole hours as in the notebook, and a grid that hits some times exactly
+    for grid in (time_grid(int(np.ceil(departures.max())), step=1), np.sort(np.concatenate((arrivals[::50],
+                                                                                             departures[::70])))):
+        expected = notebook_counts(arrivals, departures, grid)
+        for counts, reference in zip(occupancy_on_grid(arrivals, departures, grid), expected):
+            assert counts.tolist() == reference
+
+
+def test_time_average_is_the_total_sojourn_over_the_horizon():
+    result = simulate_tandem(arrivals_by_inversion(lambda_t, 2000, rng=2), rng=3)
+    arrivals, departures = result['ArrivalTime'], result['DepartureTime']
+    times, levels = occupancy_steps(arrivals, departures)
+    assert levels[-1] == 0 and levels.min() >= 0
+    # The area under N(t) is the sum of the sojourn times
+    average = time_average(times, levels, start=0.0, end=departures.max())
+    assert np.isclose(average, np.sum(departures - arrivals) / departures.max())
+
+
+def test_departures_go_first_at_a_shared_time():
+    times, levels = occupancy_steps([0.0, 1.0], [1.0, 2.0])
+    assert times.tolist() == [0.0, 1.0, 2.0] and levels.tolist() == [1, 1, 0]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from hospital_kernel import simulate_hospital
+from hospital_model import HospitalModel
+from profiling import RunProfile, relocation_attempts
+from run_control import DailyHospital
+from scenarios import load_scenario
+
+
+def test_relocation_attempts_count_the_entries_walked():
+    # The relocation loop of the Task scripts, counting the entries it walks
+    rng = np.random.default_rng(0)
+    probs = np.array([[0.0, 0.6, 0.3], [0.5, 0.0, 0.2], [0.1, 0.4, 0.0]])
+    free = np.array([True, False, True])
+    relocations, losses, walked = np.zeros(3, dtype=int), 0, 0
+    for ward in rng.integers(0, 3, 2000):
+        for j, prob in enumerate(probs[ward]):
+            walked += 1
+            if rng.random() < prob and free[j]:
+                relocations[j] += 1
+                break
+        else:
+            losses += 1
+    assert relocation_attempts(relocations, losses) == walked
+    assert relocation_attempts(np.stack((relocations, relocations)), [losses, losses]) == 2 * walked
+
+
+@pytest.mark.parametrize('simulator', ['python', 'alias', 'arrays', 'numpy', 'DailyHospital', 'HospitalModel'])
+def test_every_simulator_counts_relocation_attempts_alike(simulator):
+    params = load_scenario('new_ward')
+    # Half the beds, so that patients are relocated and lost
+    capacities, relocation_probs, arrival_rates, mean_stay = params.as_dicts()
+    capacities = {ward: beds // 2 for ward, beds in capacities.items()}
+    args = capacities, relocation_probs, arrival_rates, mean_stay
+    profile = RunProfile(simulator)
+    if simulator == 'DailyHospital':
+        daily = DailyHospital(*args, rng=0, profile=profile).run(100)
+        relocations, losses = daily['relocations'], daily['losses']
+    elif simulator == 'HospitalModel':
+        model = HospitalModel(*args, rng=0, profile=profile)
+        model.advance(100.0)
+        relocations, losses = model.total_relocations, model.total_losses
+    else:
+        results = simulate_hospital(100, *args, replications=2, backend=simulator, profile=profile)
+        relocations, losses = results[2], results[3]
+    counts = profile.counts
+    assert counts['losses'] > 0 and counts['relocations'] > 0
+    assert counts['relocation_attempts'] == relocation_attempts(relocations, losses)
+    assert counts['overflows'] <= counts['relocation_attempts'] <= len(capacities) * counts['overflows']
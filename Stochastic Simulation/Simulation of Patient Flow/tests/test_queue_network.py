@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+import pytest
+
+from erlang_loss import erlang_b
+from queue_network import Stage, TandemNetwork, airport_network, mmck_blocking
+
+
+def poisson_arrivals(rate, n, rng):
+    return np.cumsum(np.random.default_rng(rng).exponential(1 / rate, n))
+
+
+def in_stage(entry, exit_, times):
+    """ Number of customers inside a stage just after each of `times` """
+    return np.searchsorted(np.sort(entry), times, side='right') - np.searchsorted(np.sort(exit_), times, side='right')
+
+
+def test_mmck_blocking_formula():
+    # c = K is the Erlang loss system; c = 1 the geometric M/M/1/K
+    assert mmck_blocking(6.0, 1.0, 8, 8) == pytest.approx(erlang_b(8, 6.0))
+    rho, k = 0.8, 5
+    assert mmck_blocking(0.8, 1.0, 1, k) == pytest.approx((1 - rho) * rho**k / (1 - rho**(k + 1)))
+
+
+@pytest.mark.parametrize('servers, capacity', [(1, 4), (3, 6), (5, 5)])
+def test_loss_network_blocks_as_mmck(servers, capacity):
+    arrival_rate, service_rate, n = 4.0, 1.5, 200_000
+    network = TandemNetwork([Stage(servers, capacity, service_rate)], arrival_blocking='loss', rng=1)
+    result = network.simulate(poisson_arrivals(arrival_rate, n, 0))
+    expected = mmck_blocking(arrival_rate, service_rate, servers, capacity)
+    assert result['lost'].mean() == pytest.approx(expected, abs=4 * math.sqrt(expected * (1 - expected) / n) + 0.005)
+    assert network.lost == result['lost'].sum() and network.accepted + network.lost == n
+    assert np.all(np.isnan(result['exit'][result['lost']]))
+
+
+def test_mm1_sojourn_time():
+    network = TandemNetwork([Stage(1, math.inf, 1.0)], rng=2)
+    result = network.simulate(poisson_arrivals(0.7, 200_000, 3))
+    sojourn = result['exit'][:, 0] - result['arrival']
+    assert sojourn.mean() == pytest.approx(1 / (1.0 - 0.7), rel=0.05)
+
+
+def test_unlimited_pickup_queue_follows_the_notebook_recursions():
+    network = airport_network(capacity=math.inf, rng=4)
+    arrivals = poisson_arrivals(5.0, 2000, 5)
+    result = network.simulate(arrivals)
+    trip, service = result['service'][:, 0], result['service'][:, 1]
+    # Queue 1 releases cars in order of their trip requests, Queue 2 serves them in that order
+    ready = arrivals + trip
+    exits, departures = np.maximum.accumulate(ready), np.empty(len(arrivals))
+    previous = 0.0
+    for i in range(len(arrivals)):
+        previous = departures[i] = max(previous, ready[i]) + service[i]
+    assert np.allclose(result['exit'][:, 0], exits, rtol=0, atol=1e-12)
+    assert np.allclose(result['exit'][:, 1], departures, rtol=0, atol=1e-12)
+
+
+def test_blocked_stages_never_hold_more_than_their_capacity():
+    stages = [Stage(2, 4, 3.0), Stage(1, 3, 1.2), Stage(2, 2, 1.0)]
+    result = TandemNetwork(stages, rng=6).simulate(poisson_arrivals(1.5, 20_000, 7))
+    entry, start, exit_ = result['entry'], result['start'], result['exit']
+    assert np.all(entry <= start) and np.all(start + result['service'] <= exit_ + 1e-12)
+    # A customer leaves a stage exactly when it enters the next one
+    assert np.array_equal(exit_[:, :-1], entry[:, 1:])
+    for j, stage in enumerate(stages):
+        assert in_stage(entry[:, j], exit_[:, j], entry[:, j]).max() <= stage.capacity
+        assert in_stage(start[:, j], exit_[:, j], start[:, j]).max() <= stage.servers
+
+
+def test_state_carries_over_between_calls():
+    arrivals = poisson_arrivals(1.0, 3000, 8)
+    whole = TandemNetwork([Stage(2, 3, 0.6)], arrival_blocking='loss', rng=9).simulate(arrivals)
+    network = TandemNetwork([Stage(2, 3, 0.6)], arrival_blocking='loss', rng=9)
+    parts = [network.simulate(chunk) for chunk in np.array_split(arrivals, 7)]
+    assert np.array_equal(np.concatenate([part['lost'] for part in parts]), whole['lost'])
+    assert np.array_equal(np.concatenate([part['exit'] for part in parts]), whole['exit'], equal_nan=True)
+
+
+def test_invalid_networks_are_refused():
+    with pytest.raises(ValueError):
+        TandemNetwork([Stage(1, 1, 1.0)], arrival_blocking='drop')
+    with pytest.raises(ValueError):
+        TandemNetwork([Stage(3, 2, 1.0)])
+    with pytest.raises(ValueError):
+        TandemNetwork([Stage(1, 2, 0.0)])
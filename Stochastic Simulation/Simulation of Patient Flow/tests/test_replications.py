@@ -0,0 +1,38 @@
+import numpy as np
+
+import Task3
+from replications import run_replications, simulate_hospital_batch_parallel
+from scenarios import load_scenario
+from vectorized_hospital import simulate_hospital_batch
+
+
+def test_results_do_not_depend_on_the_workers():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    args = (60, 3, capacities, relocation_probs, arrival_rates, mean_stay)
+    serial, pooled = (run_replications(simulate_hospital_batch, args, replications=5, seed=7, workers=workers)
+                      for workers in (1, 2))
+    for one, other in zip(serial, pooled):
+        for a, b in zip(one[1:], other[1:]):
+            assert np.array_equal(a, b)
+    # Every replication has a stream of its own
+    assert not np.array_equal(serial[0][1], serial[1][1])
+
+
+def test_global_rng_functions_are_reseeded_per_replication():
+    capacities, relocation_probs, _, _ = load_scenario('new_ward').as_dicts()
+    args = (60, capacities, relocation_probs)
+    serial, pooled = (run_replications(Task3.simulate_hospital_with_new_ward, args, replications=4, seed=3,
+                                       workers=workers, legacy_global_rng=True)
+                      for workers in (1, 2))
+    assert [repr(result) for result in serial] == [repr(result) for result in pooled]
+    assert repr(serial[0]) != repr(serial[1])
+
+
+def test_batch_chunks_do_not_depend_on_the_workers():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    serial, pooled = (simulate_hospital_batch_parallel(60, 7, capacities, relocation_probs, arrival_rates,
+                                                       mean_stay, seed=1, workers=workers, chunk=3)
+                      for workers in (1, 3))
+    assert serial[0] == pooled[0] and len(serial[1]) == 7
+    for a, b in zip(serial[1:], pooled[1:]):
+        assert np.array_equal(a, b)
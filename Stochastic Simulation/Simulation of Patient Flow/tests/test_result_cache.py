@@ -0,0 +1,47 @@
+import numpy as np
+
+import result_cache
+from result_cache import HEADER, MAGIC, ResultCache, cached_simulation
+
+
+def test_round_trip_and_damaged_files_are_misses(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put('ab01', {'A': np.arange(3)})
+    assert np.array_equal(cache.get('ab01')['A'], np.arange(3)) and cache.hits == 1
+
+    path = cache.path('ab01')
+    with open(path, 'rb') as file:
+        data = file.read()
+    damaged = [
+        data[:HEADER.size - 1],  # truncated header
+        data[:-1],  # truncated pickle
+        HEADER.pack(MAGIC, 99, len(data) - HEADER.size) + data[HEADER.size:],  # another format version
+        data[HEADER.size:],  # a bare pickle without the header
+        HEADER.pack(MAGIC, 1, 4) + b'junk',  # a header over bytes that do not unpickle
+    ]
+    for content in damaged:
+        with open(path, 'wb') as file:
+            file.write(content)
+        assert cache.get('ab01', 'missing') == 'missing'
+    assert cache.misses == len(damaged) and len(cache) == 0
+
+
+def test_decorated_function_replays_the_random_state(tmp_path):
+    calls = []
+
+    @cached_simulation(cache=ResultCache(tmp_path))
+    def simulate(days):
+        calls.append(days)
+        return np.random.poisson(5.0, days).sum()
+
+    np.random.seed(1)
+    first, after = simulate(10), np.random.random()
+    np.random.seed(1)
+    assert simulate(10) == first and np.random.random() == after
+    assert calls == [10]
+
+
+def test_default_directory_is_outside_the_repository(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache.os, 'name', 'posix')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert result_cache.user_cache_directory() == str(tmp_path / 'patient-flow-simulation')
@@ -0,0 +1,35 @@
+import numpy as np
+
+from run_control import BatchSums, DailyHospital, mser5, run_until_precision
+from scenarios import load_scenario
+
+
+def test_batch_sums_match_the_daily_counts():
+    rng = np.random.default_rng(0)
+    daily = rng.integers(0, 10, (10007, 3))
+    batches = BatchSums(batch_days=5, max_batches=64)
+    start = 0
+    while start < len(daily):
+        size = int(rng.integers(1, 900))
+        batches.add({'counts': daily[start:start + size]})
+        start += size
+
+    assert batches.days == len(daily) and len(batches) <= 64
+    n = len(batches) * batches.batch_days
+    assert np.array_equal(batches.sums['counts'], daily[:n].reshape(len(batches), batches.batch_days, 3).sum(axis=1))
+    assert np.array_equal(batches.partial['counts'], daily[n:].sum(axis=0))
+
+
+def test_mser5_cuts_the_transient():
+    series = np.concatenate((np.linspace(0, 100, 50), 100 + np.random.default_rng(1).normal(0, 1, 950)))
+    assert 40 <= mser5(series) <= 60
+
+
+def test_run_until_precision():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    model = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, rng=1)
+    result = run_until_precision(model, relative_half_width=0.1, chunk_days=1000)
+    assert result['converged'] and result['days'] == model.day
+    for name, by_ward in result['metrics'].items():
+        for ward, (mean, half_width) in by_ward.items():
+            assert half_width <= max(0.1 * mean, 0.001) + 1e-12, (name, ward)
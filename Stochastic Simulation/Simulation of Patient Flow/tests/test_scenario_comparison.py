@@ -0,0 +1,44 @@
+import numpy as np
+from scipy.stats import poisson
+
+import Task4_SensitivityAnalysis_TestDistributionBeds as Task4
+from scenario_comparison import compare_scenarios, generate_streams, poisson_quantile, simulate_hospital_with_streams
+from scenarios import load_scenario
+
+DAYS = 365
+RUNS = 40
+
+
+def test_poisson_quantile_is_the_capped_inverse_cdf():
+    u = np.random.default_rng(0).random(200)
+    for mu in (0.0, 0.7, 12.5, 800.0):
+        for limit in (3, 10**6):
+            expected = np.minimum(limit, poisson.ppf(u, mu)).astype(int)
+            assert [poisson_quantile(x, mu, limit) for x in u] == expected.tolist(), (mu, limit)
+
+
+def test_a_scenario_compared_with_itself_differs_by_nothing():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    baseline, comparison = compare_scenarios({'base': capacities, 'same': dict(capacities)}, relocation_probs,
+                                             arrival_rates, mean_stay, Task4.variances, days=60, replications=3)
+    assert baseline == 'base'
+    for metric in comparison['same'].values():
+        assert all(mean == 0 and half_width == 0 for mean, half_width in metric.values())
+
+
+def test_streams_agree_with_task4():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    wards = list(capacities)
+    rng = np.random.default_rng(5)
+    streams, script = [], []
+    for seed in range(RUNS):
+        results = simulate_hospital_with_streams(
+            capacities, relocation_probs, generate_streams(DAYS, wards, arrival_rates, mean_stay, Task4.variances, rng))
+        streams.append([[results[k][ward] for ward in wards] for k in range(3)])
+        np.random.seed(seed)
+        results = Task4.simulate_hospital_with_lognorm(DAYS, capacities, relocation_probs, Task4.variances)
+        script.append([[results[k][ward] for ward in wards] for k in range(3)])
+    streams, script = np.array(streams, dtype=float), np.array(script, dtype=float)
+    # Admissions, relocations and losses of every ward within 4 standard errors
+    standard_error = np.sqrt((streams.var(axis=0, ddof=1) + script.var(axis=0, ddof=1)) / RUNS)
+    assert np.all(np.abs(streams.mean(axis=0) - script.mean(axis=0)) <= 4 * standard_error + 1e-12)
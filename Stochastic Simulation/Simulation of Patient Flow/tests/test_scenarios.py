@@ -0,0 +1,32 @@
+import pytest
+
+from scenarios import compile_scenario, load_scenario
+
+
+def ward(**changes):
+    table = {'capacity': 10, 'arrival_rate': 2.0, 'mean_stay': 1.5, 'relocation': {'B': 0.5}}
+    table.update(changes)
+    return table
+
+
+@pytest.mark.parametrize('changes', [
+    {'capacity': '10'}, {'capacity': True}, {'capacity': -1},
+    {'arrival_rate': '2.0'}, {'arrival_rate': -1.0},
+    {'mean_stay': None}, {'mean_stay': 0},
+    {'variance': 'high'}, {'urgency': 2.5},
+    {'relocation': {'B': '0.5'}}, {'relocation': {'B': 1.5}}, {'relocation': [0.5]},
+])
+def test_invalid_values_raise_value_error(changes):
+    with pytest.raises(ValueError):
+        compile_scenario({'wards': {'A': ward(**changes), 'B': ward(relocation={})}})
+
+
+def test_new_ward_scenario():
+    params = load_scenario('new_ward')
+    capacities, relocation_probs, _, _ = params.as_dicts()
+    assert params.wards == ('A', 'B', 'C', 'D', 'E', 'F')
+    assert relocation_probs['A'] == [0.0, 0.05, 0.1, 0.05, 0.8, 0.0]
+    assert relocation_probs['F'] == [0.2] * 5 + [0.0]
+    # Every call returns new lists
+    relocation_probs['A'].append(0.0)
+    assert len(params.as_dicts()[1]['A']) == 6
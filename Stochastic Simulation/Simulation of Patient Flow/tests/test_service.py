@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+import service
+from service import HttpError, QueryError, hospital_query, read_request
+
+
+def read(data):
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(main())
+
+
+def test_read_request():
+    body = '{"scenario": "new_ward"}'.encode()
+    request = b'POST /hospital?x=1 HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+    assert read(request) == ('POST', '/hospital', '{"scenario": "new_ward"}')
+
+
+@pytest.mark.parametrize('length, body', [(b'ten', b''), (b'-5', b''), (b'2', b'\xff\xfe')])
+def test_bad_requests_are_400(length, body):
+    with pytest.raises(HttpError) as error:
+        read(b'POST /hospital HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n' + body)
+    assert error.value.status == 400
+
+
+def test_scenarios_come_from_scenario_files_only(monkeypatch, tmp_path):
+    # Files of the working directory are not scenarios, even with a known format
+    monkeypatch.chdir(service.ROOT)
+    for name in ('service.py', 'requests.jsonl', 'benchmarks.py'):
+        with pytest.raises(QueryError):
+            hospital_query({'scenario': name})
+    assert hospital_query({'scenario': 'new_ward'})[1].wards == ('A', 'B', 'C', 'D', 'E', 'F')
+
+    # A shipped file that does not parse is a bad query, not a crash
+    (tmp_path / 'broken.toml').write_text('[wards.A]\ncapacity = "many"\n')
+    monkeypatch.setattr(service, 'SCENARIO_DIR', str(tmp_path))
+    with pytest.raises(QueryError, match='Invalid scenario'):
+        hospital_query({'scenario': 'broken'})
+
+
+def test_a_stalled_request_times_out():
+    async def main():
+        reader = asyncio.StreamReader()
+        # Headers without the blank line that ends them, and no EOF
+        reader.feed_data(b'POST /hospital HTTP/1.1\r\nContent-Length: 2\r\n')
+        return await read_request(reader, timeout=0.05)
+
+    with pytest.raises(HttpError) as error:
+        asyncio.run(main())
+    assert error.value.status == 408
+
+
+def test_a_failed_run_is_reported_and_not_cached():
+    async def failing(job):
+        await job.publish({'type': 'query'})
+        raise RuntimeError('no beds')
+
+    async def main():
+        simulation = service.SimulationService(workers=1)
+        try:
+            job, cache = simulation.submit({'model': 'test'}, failing)
+            lines = [json.loads(line) async for line in job.follow()]
+            again = simulation.submit({'model': 'test'}, failing)
+            await asyncio.gather(*simulation.tasks)
+            return job, cache, lines, again[1], simulation.running
+        finally:
+            simulation.close()
+
+    job, cache, lines, second, running = asyncio.run(main())
+    assert cache == 'miss' and job.failed and job.done
+    assert lines == [{'type': 'query'}, {'type': 'error', 'error': 'RuntimeError: no beds'}]
+    assert second == 'miss' and not running
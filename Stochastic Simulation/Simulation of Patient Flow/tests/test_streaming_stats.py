@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from arrival_process import arrival_chunks, lambda_t
+from hospital_model import HospitalModel
+from scenarios import load_scenario
+from streaming_stats import (HospitalStats, LogHistogramQuantiles, P2Quantile, TandemStats, TimeWeightedAverage,
+                             Welford)
+from tandem_queue import simulate_tandem_stream
+
+
+def test_welford_matches_numpy_for_single_values_chunks_and_merges():
+    values = np.random.default_rng(0).normal(3.0, 2.0, 1001)
+    single, chunked, merged = Welford(), Welford(), Welford()
+    for x in values[:500]:
+        single.add(x)
+    for start in range(0, 1001, 97):
+        chunked.add_many(values[start:start + 97])
+    other = Welford()
+    other.add_many(values[500:])
+    merged.merge(single)
+    merged.merge(other)
+    assert single.mean == pytest.approx(values[:500].mean())
+    for stats in (chunked, merged):
+        assert stats.n == 1001
+        assert stats.mean == pytest.approx(values.mean())
+        assert stats.variance == pytest.approx(values.var(ddof=1))
+
+
+def test_time_weighted_average():
+    average = TimeWeightedAverage(start=1.0)
+    for t, level in ((2.0, 3), (4.0, 1), (5.0, 0)):
+        average.update(t, level)
+    # Level 0 on [1, 2), 3 on [2, 4), 1 on [4, 5), 0 after
+    assert average.mean() == pytest.approx(7 / 4)
+    assert average.mean(9.0) == pytest.approx(7 / 8)
+
+
+def test_quantile_estimates():
+    values = np.random.default_rng(1).exponential(1.0, 20_000)
+    histogram = LogHistogramQuantiles(accuracy=0.01)
+    histogram.add_many(np.concatenate((values, np.zeros(100))))
+    ordered = np.sort(np.concatenate((values, np.zeros(100))))
+    for p in (0.001, 0.5, 0.9, 0.99):
+        exact = ordered[int(p * (len(ordered) - 1))]
+        assert histogram.quantile(p) == pytest.approx(exact, rel=0.01, abs=1e-12), p
+        marker = P2Quantile(p)
+        marker.add_many(values)
+        # P-squared has no error bound, but is close on a smooth distribution
+        assert marker.value == pytest.approx(-np.log(1 - p), rel=0.05, abs=0.01), p
+
+
+def test_tandem_stats_match_the_notebook_formulas():
+    class Kept(TandemStats):
+        def add_chunk(self, result):
+            super().add_chunk(result)
+            self.chunks.append(result)
+
+    stats = Kept()
+    stats.chunks = []
+    simulate_tandem_stream(arrival_chunks(lambda_t, 5000, chunk_size=999, rng=0), stats, rng=1)
+    column = {name: np.concatenate([chunk[name] for chunk in stats.chunks]) for name in stats.chunks[0]}
+    arrivals, exits, departures = column['ArrivalTime'], column['TimeExitQueue1'], column['DepartureTime']
+    summary = stats.summary()
+    # Questions 3.5 and 3.6 of the notebook; N of the system over the last departure
+    assert summary['Queue1']['T'] == pytest.approx(np.mean(exits - arrivals))
+    assert summary['Queue2']['Tq'] == pytest.approx(np.mean(departures - exits - column['ServiceTime']))
+    assert summary['System']['N'] == pytest.approx(np.sum(departures - arrivals) / departures.max())
+    assert summary['System']['Nq'] == pytest.approx(
+        np.sum(departures - arrivals - column['ServiceTime']) / departures.max())
+
+
+def test_hospital_stats_agree_with_the_model_counts():
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    stats = HospitalStats(list(capacities))
+    admissions, relocations, losses, occupancy = HospitalModel(
+        capacities, relocation_probs, arrival_rates, mean_stay, rng=0, stats=stats).run(365)[:4]
+    counters = stats.counters
+    for i, ward in enumerate(capacities):
+        assert counters.admitted[i] == admissions[ward]
+        assert counters.lost[i] == losses[ward]
+    assert sum(counters.relocated) == sum(relocations.values())
+    summary = stats.summary(365.0)
+    assert all(0 <= summary['mean_occupancy'][ward] <= capacities[ward] for ward in capacities)
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+import sweep
+from scenarios import SCENARIO_DIR, load_scenario
+
+
+def test_reallocate_beds_keeps_the_total():
+    params = load_scenario('new_ward')
+    capacities = sweep.reallocate_beds(params, 170, 30)
+    assert capacities.sum() == 170 and capacities[params.wards.index('F')] == 30
+    assert np.all(capacities >= 0)
+
+
+def test_latin_hypercube_covers_every_integer_level():
+    points = sweep.latin_hypercube_design(6, total_beds=(150, 155), arrival_scale=(0.9, 1.1))
+    assert sorted(point['total_beds'] for point in points) == list(range(150, 156))
+    assert all(0.9 <= point['arrival_scale'] <= 1.1 for point in points)
+
+
+def test_a_restarted_sweep_skips_completed_points(tmp_path, monkeypatch):
+    store = str(tmp_path / 'sweep.sqlite')
+    calls = []
+    run_point = sweep.run_point
+
+    def counted(task):
+        calls.append(task[1])
+        return run_point(task)
+
+    monkeypatch.setattr(sweep, 'run_point', counted)
+    first = sweep.grid_design(total_beds=[160, 170])
+    results = sweep.run_sweep(first, store, days=30, replications=2, workers=1, verbose=False)
+    assert len(calls) == 2 and sorted(results['total_beds']) == [160, 170]
+
+    calls.clear()
+    # One point is new; the duplicate of a finished point is not run again
+    results = sweep.run_sweep(first + sweep.grid_design(total_beds=[180, 170]), store, days=30, replications=2,
+                              workers=1, verbose=False)
+    assert calls == [{'total_beds': 180}]
+    assert sorted(results['total_beds']) == [160, 170, 180]
+    assert len(sweep.load_results(store, where='"total_beds" > 165')) == 2
+
+
+def test_scenarios_with_other_wards_share_a_store(tmp_path):
+    with open(os.path.join(SCENARIO_DIR, 'new_ward.toml')) as file:
+        text = file.read()
+    path = tmp_path / 'seven_wards.toml'
+    path.write_text(text + '\n[wards.G]\ncapacity = 5\narrival_rate = 1.0\nmean_stay = 2.0\n')
+    store = str(tmp_path / 'sweep.sqlite')
+    design = sweep.grid_design(total_beds=[180])
+    six = sweep.run_sweep(design, store, days=20, replications=2, workers=1, verbose=False)
+    seven = sweep.run_sweep(design, store, scenario=str(path), days=20, replications=2, workers=1, verbose=False)
+    assert 'prob_full_G' in seven.columns and 'prob_full_G' not in six.columns
+    assert len(sweep.load_results(store)) == 1
@@ -0,0 +1,56 @@
+import numpy as np
+
+from arrival_process import arrival_chunks, arrivals_by_inversion, lambda_t
+from tandem_queue import simulate_tandem, simulate_tandem_stream, to_dataframe
+
+
+def notebook_recursions(arrivals, trip, service, capacity=10):
+    """ Departure and Queue 1 exit times as in the loops of the notebook (cells 7 and 8) """
+    departures, exits = [0.0], [0.0]
+    for i in range(1, len(arrivals) + 1):
+        ready = arrivals[i - 1] + trip[i - 1]
+        departures.append(max(departures[i - 1] + service[i - 1], ready + service[i - 1]))
+        if i == 1:
+            exits.append(ready)
+        elif i <= capacity:
+            exits.append(max(exits[i - 1], ready))
+        else:
+            exits.append(max(departures[i - capacity], exits[i - 1], ready))
+    return np.array(departures[1:]), np.array(exits[1:])
+
+
+class Collected:
+    """ Stats object keeping every chunk pushed by simulate_tandem_stream """
+
+    def __init__(self):
+        self.chunks = []
+
+    def add_chunk(self, result):
+        self.chunks.append(result)
+
+    def column(self, name):
+        return np.concatenate([chunk[name] for chunk in self.chunks])
+
+
+def test_vectorized_recursions_match_the_notebook_loop():
+    arrivals = arrivals_by_inversion(lambda_t, 3000, rng=1)
+    result = simulate_tandem(arrivals, rng=2)
+    departures, exits = notebook_recursions(arrivals, result['TripRequestTime'], result['ServiceTime'])
+    assert np.allclose(result['DepartureTime'], departures, rtol=0, atol=1e-12)
+    assert np.allclose(result['TimeExitQueue1'], exits, rtol=0, atol=1e-12)
+    assert np.allclose(result['DelayQueue2'], result['DepartureTime'] - result['ServiceTime'] - exits)
+
+
+def test_chunks_carry_the_recursions_across_their_boundaries():
+    stats = simulate_tandem_stream(arrival_chunks(lambda_t, 2500, chunk_size=7, rng=3), Collected(), rng=4)
+    arrivals = stats.column('ArrivalTime')
+    departures, exits = notebook_recursions(arrivals, stats.column('TripRequestTime'), stats.column('ServiceTime'))
+    assert len(stats.chunks) == 358
+    assert np.allclose(stats.column('DepartureTime'), departures, rtol=0, atol=1e-12)
+    assert np.allclose(stats.column('TimeExitQueue1'), exits, rtol=0, atol=1e-12)
+
+
+def test_dataframe_has_the_notebook_layout():
+    df = to_dataframe(simulate_tandem(arrivals_by_inversion(lambda_t, 5, rng=0), rng=0))
+    assert len(df) == 6 and df['Arrivals'].tolist() == list(range(6))
+    assert (df.drop(columns='Arrivals').loc[0] == 0).all()
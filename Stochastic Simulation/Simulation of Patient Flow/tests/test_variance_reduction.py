@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from scipy.stats import poisson
+from scipy.stats import t as student_t
+
+from capacity_search import evaluate_with_variance_reduction
+from queue_controls import tandem_replication
+from scenarios import load_scenario
+from variance_reduction import AntitheticGenerator, controlled_mean, daily_replication, estimate, hospital_replication
+
+
+def linear_replication(rng):
+    """ Two outputs, each following one of two controls with known means """
+    # The noise is folded so that antithetic pairs do not cancel it
+    u, v, noise = rng.random(), rng.exponential(), abs(rng.normal(0.0, 0.05))
+    return {'y': 2 * u**2 + noise, 'z': v + noise}, {'u': u, 'v': v}, {'u': 0.5, 'v': 1.0}
+
+
+def test_plain_estimate_has_factor_one():
+    result = estimate(linear_replication, runs=20, seed=3, controls=False)
+    for name in ('y', 'z'):
+        assert result[name].mean == result[name].plain_mean
+        assert result[name].half_width == pytest.approx(result[name].plain_half_width)
+        assert result[name].variance_reduction_factor == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('antithetic', [False, True])
+def test_factor_is_the_squared_half_width_ratio(antithetic):
+    result = estimate(linear_replication, runs=20, seed=3, antithetic=antithetic)
+    for value in result.values():
+        assert value.variance_reduction_factor == pytest.approx((value.plain_half_width / value.half_width)**2)
+
+
+def test_each_output_uses_its_own_controls():
+    def replication(rng):
+        return linear_replication(rng)
+    replication.controls_of = {'y': ['u'], 'z': ['v']}
+
+    runs = 20
+    result = estimate(replication, runs=runs, seed=5)
+    outputs = np.array([[linear_replication(AntitheticGenerator(child))[k][name] for k, name in
+                         ((0, 'y'), (1, 'u'))] for child in np.random.SeedSequence(5).spawn(runs)])
+    # One control leaves m - 2 degrees of freedom
+    mean, variance = controlled_mean(outputs[:, 0], outputs[:, 1:], np.array([0.5]))
+    assert result['y'].mean == pytest.approx(mean)
+    assert result['y'].half_width == pytest.approx(student_t.ppf(0.975, runs - 2) * np.sqrt(variance))
+    # U explains most of the variance of 2 U^2
+    assert result['y'].variance_reduction_factor > 4
+
+
+def test_an_output_equal_to_its_control_is_exact():
+    def replication(rng):
+        u = rng.random()
+        return {'y': u}, {'u': u}, {'u': 0.5}
+
+    result = estimate(replication, runs=10, seed=1)['y']
+    assert result.mean == pytest.approx(0.5) and result.half_width == 0.0
+    assert result.variance_reduction_factor == np.inf
+
+
+def test_antithetic_uniforms_are_reflected():
+    seed = np.random.SeedSequence(11)
+    u = AntitheticGenerator(seed).uniforms(100)
+    reflected = AntitheticGenerator(seed, antithetic=True).uniforms(100)
+    assert np.allclose(u + reflected, 1.0)
+
+
+def test_scalar_poisson_matches_the_inversion():
+    for lam in (0.0, 0.3, 4.5, 60.0, 499.0):
+        draws = [AntitheticGenerator(seed).poisson(lam) for seed in range(200)]
+        u = np.array([AntitheticGenerator(seed).uniforms(None) for seed in range(200)])
+        assert draws == np.where(lam > 0, poisson.ppf(u, lam), 0).astype(int).tolist(), lam
+
+
+def test_separate_decisions_leave_the_main_stream_in_step():
+    alone = AntitheticGenerator(2, separate_decisions=True)
+    expected = alone.exponential(1.0, 5)
+    mixed = AntitheticGenerator(2, separate_decisions=True)
+    first = mixed.exponential(1.0, 2)
+    decisions = [mixed.random() for _ in range(7)]
+    assert np.array_equal(np.concatenate((first, mixed.exponential(1.0, 3))), expected)
+    assert all(0 < u < 1 for u in decisions)
+
+
+def test_capacity_evaluation_simulates_each_run_once():
+    calls = []
+
+    def replication(rng):
+        calls.append(rng)
+        return linear_replication(rng)
+
+    mean, runs, result = evaluate_with_variance_reduction(replication, 'z', 1.0, seed=4, min_runs=4, max_runs=10,
+                                                          tolerance=0.0)
+    # A target at the mean is never decided, so the pairs grow to max_runs
+    assert runs == len(calls) == result.runs == 10 and mean == result.mean
+
+
+def test_hospital_outputs_use_their_own_ward():
+    params = load_scenario('new_ward')
+    replication = hospital_replication(params, days=60, warmup_days=10)
+    assert replication.controls_of['prob_full_F'] == ['erlang_blocking_F']
+    result = estimate(replication, runs=6, seed=1, antithetic=True)
+    assert np.isfinite(result['hospitalization_rate_F'].half_width)
+
+
+def test_daily_replication_has_no_controls():
+    result = estimate(daily_replication(*load_scenario('new_ward').as_dicts(), days=60), runs=4, seed=1,
+                      antithetic=True)
+    assert 0 < result['hospitalization_rate_F'].mean <= 1
+
+
+def test_tandem_outputs():
+    replication = tandem_replication(cars=500)
+    outputs, controls, control_means = replication(AntitheticGenerator(0))
+    for queue in ('Queue1', 'Queue2', 'System'):
+        assert outputs[f'N_{queue}'] >= outputs[f'Nq_{queue}'] >= 0
+        assert set(replication.controls_of[f'Nq_{queue}']) <= set(controls)
+    result = estimate(replication, runs=8, seed=2, antithetic=True)
+    assert set(result) == set(outputs)
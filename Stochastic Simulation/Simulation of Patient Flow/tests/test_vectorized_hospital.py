@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import Task3
+from scenarios import load_scenario
+from vectorized_hospital import simulate_hospital_batch
+
+DAYS = 100
+
+
+def scalar_metrics(capacities, relocation_probs, seeds):
+    """ Hospitalization rate and P(all beds occupied) per replication of Task3's simulate_hospital_with_new_ward """
+    rates, blocking = [], []
+    for seed in seeds:
+        np.random.seed(seed)
+        admissions, _, losses, _, prob_all_beds_occupied, _, _ = Task3.simulate_hospital_with_new_ward(
+            DAYS, capacities, relocation_probs)
+        rates.append([admissions[ward] / (admissions[ward] + losses[ward]) for ward in capacities])
+        blocking.append([prob_all_beds_occupied[ward] for ward in capacities])
+    return np.array(rates), np.array(blocking)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_batch_agrees_with_scalar_model(seed):
+    capacities, relocation_probs, arrival_rates, mean_stay = load_scenario('new_ward').as_dicts()
+    scalar = scalar_metrics(capacities, relocation_probs, range(1000 * seed, 1000 * seed + 80))
+    _, admissions, _, losses, _, occupied_on_arrival = simulate_hospital_batch(
+        DAYS, 2000, capacities, relocation_probs, arrival_rates, mean_stay, rng=seed)
+    batch = (admissions / (admissions + losses), occupied_on_arrival / (admissions + occupied_on_arrival))
+
+    for name, s, b in zip(('hospitalization rate', 'P(all beds occupied)'), scalar, batch):
+        # Every ward's difference of means lies within 4 standard errors
+        standard_error = np.sqrt(s.var(axis=0, ddof=1) / len(s) + b.var(axis=0, ddof=1) / len(b))
+        difference = np.abs(s.mean(axis=0) - b.mean(axis=0))
+        assert np.all(difference <= 4 * standard_error + 1e-12), (name, difference, standard_error)
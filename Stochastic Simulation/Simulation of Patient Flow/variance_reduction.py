@@ -0,0 +1,313 @@
+import heapq
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+from scipy.stats import poisson
+from scipy.stats import t as student_t
+
+from erlang_loss import erlang_b
+from hospital_model import HospitalModel
+from run_control import DailyHospital
+from scenarios import load_scenario
+
+# Antithetic and control variates for replicated simulations.
+#
+# A replication is a function replication(rng) -> (outputs, controls,
+# control_means): dicts of the estimated quantities, of control quantities of
+# the same run whose expectations are known exactly, and of those
+# expectations. estimate() runs it with one AntitheticGenerator per run, a
+# np.random.Generator that draws every variate by inversion of one uniform, so
+# two runs on the same seed with antithetic=False and True see U and 1 - U:
+#
+#   - antithetic pairs: the observations are the averages of the two runs of a
+#     pair, whose errors partly cancel when an output is monotone in the
+#     uniforms (more arrivals, longer stays: more blocking);
+#   - control variates: every output is regressed on its controls, and the
+#     estimate is mean(Y) - beta (mean(C) - E[C]), with the interval from the
+#     residual variance on m - 1 - k degrees of freedom (k controls). A
+#     replication may name the controls relevant to each output in a
+#     `controls_of` attribute ({output: [control names]}); otherwise every
+#     output uses all controls. Each control costs a degree of freedom and
+#     widens the Lavenberg-Welch factor, so a control unrelated to an output
+#     only makes its interval wider.
+#
+# Both can be combined. The variance reduction factor of an estimate is the
+# squared ratio of the half-width of the plain interval from the same number
+# of independent runs (from the variance of the single runs) to the half-width
+# achieved, t-quantiles and the Lavenberg-Welch factor included. A factor of 4
+# halves the interval width, or gives the same width with about a quarter of
+# the runs; a factor below 1 means the method widened the interval. Plain runs
+# also use inversion, so the reference is the same model.
+#
+# The hospital replication runs HospitalModel and, on the same arrivals and
+# lengths of stay, every ward alone as an M/M/c/c loss system: the blocking
+# of such a shadow ward has the Erlang-B value as its exact expectation
+# (PASTA), and it moves with the blocking of the real ward. The daily
+# replication runs the day model of the Task scripts (run_control.
+# DailyHospital) for antithetic pairs only; a replication may ask for the
+# decision stream of AntitheticGenerator with a `separate_decisions`
+# attribute. The queue
+# replication with the M/M/1 controls is in Queue Simulation/queue_controls.py.
+
+
+class AntitheticGenerator(np.random.Generator):
+    """ Generator drawing every variate by inversion of one uniform, 1 - U when antithetic """
+    # Methods not overridden here (integers, choice, gamma, ...) fall back to
+    # the usual algorithms: still correct, but not antithetic. With
+    # separate_decisions, random() draws from a stream of its own: a model
+    # that uses it for a varying number of decisions (the day model's
+    # relocations) would otherwise shift every later draw of the main stream
+    # out of step with its antithetic partner
+
+    def __init__(self, seed=None, antithetic=False, separate_decisions=False):
+        seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        super().__init__(np.random.PCG64(seed_seq))
+        self.antithetic = antithetic
+        self.decisions = np.random.Generator(np.random.PCG64(seed_seq.spawn(1)[0])) if separate_decisions else None
+
+    def uniforms(self, size, stream=None):
+        """ Uniforms in the open interval (0, 1), reflected when antithetic """
+        u = super().random(size) if stream is None else stream.random(size)
+        if self.antithetic:
+            u = 1.0 - u
+        return np.clip(u, 2.0**-54, 1.0 - 2.0**-53)
+
+    def draw(self, transform, size, *params):
+        """ transform(U, *params) for `size` uniforms, or one per element of the broadcast params """
+        shape = size if size is not None else np.broadcast(*params).shape if params else ()
+        values = transform(self.uniforms(shape), *params)
+        return values[()] if size is None and np.ndim(values) == 0 else values
+
+    def random(self, size=None, dtype=np.float64, out=None):
+        if self.decisions is None:
+            return self.draw(lambda u: u, size)
+        u = self.uniforms(size, self.decisions)
+        return u[()] if size is None else u
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return self.draw(lambda u, low, high: low + (high - low) * u, size, low, high)
+
+    def standard_exponential(self, size=None, dtype=np.float64, method='inv', out=None):
+        return self.draw(lambda u: -np.log1p(-u), size)
+
+    def exponential(self, scale=1.0, size=None):
+        return self.draw(lambda u, scale: -scale * np.log1p(-u), size, scale)
+
+    def standard_normal(self, size=None, dtype=np.float64, out=None):
+        return self.draw(ndtri, size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return self.draw(lambda u, loc, scale: loc + scale * ndtri(u), size, loc, scale)
+
+    def lognormal(self, mean=0.0, sigma=1.0, size=None):
+        return self.draw(lambda u, mean, sigma: np.exp(mean + sigma * ndtri(u)), size, mean, sigma)
+
+    def poisson(self, lam=1.0, size=None):
+        if size is None and np.ndim(lam) == 0 and lam < 500:
+            # One draw with a small mean (the daily departures of a ward):
+            # a sequential search of the cdf costs far less than poisson.ppf
+            u = self.uniforms(None)
+            k, p = 0, np.exp(-lam)
+            cdf = p
+            while u > cdf and p > 0:
+                k += 1
+                p *= lam / k
+                cdf += p
+            return k
+        return self.draw(lambda u, lam: np.where(np.asarray(lam) > 0, poisson.ppf(u, lam), 0).astype(np.int64),
+                         size, lam)
+
+
+class Estimate(NamedTuple):
+    mean: float
+    half_width: float
+    plain_mean: float
+    plain_half_width: float
+    variance_reduction_factor: float
+    runs: int
+
+
+def run_replications(replication, runs, seed, antithetic):
+    """ (outputs, controls, control_means): arrays with one row per observation, a pair average when antithetic """
+    if antithetic and runs % 2:
+        raise ValueError(f"Antithetic pairs need an even number of runs, got {runs}")
+    children = np.random.SeedSequence(seed).spawn(runs // 2 if antithetic else runs)
+    flips = (False, True) if antithetic else (False,)
+    separate_decisions = getattr(replication, 'separate_decisions', False)
+    results = [replication(AntitheticGenerator(child, flip, separate_decisions)) for child in children for flip in flips]
+    names = [list(part) for part in results[0][:2]]
+    outputs, controls = (np.array([[result[k][name] for name in names[k]] for result in results], dtype=float)
+                         for k in (0, 1))
+    control_means = np.array([results[0][2][name] for name in names[1]], dtype=float)
+    return names, outputs, controls, control_means
+
+
+def controlled_mean(y, c, control_means):
+    """ (mean, variance of the mean) of the observations y with the controls c (one column each) """
+    m, k = c.shape
+    if not k:
+        return y.mean(), y.var(ddof=1) / m
+    centred = c - c.mean(axis=0)
+    beta = np.linalg.lstsq(centred, y - y.mean(), rcond=None)[0]
+    mean = y.mean() - (c.mean(axis=0) - control_means) @ beta
+    residuals = y - y.mean() - centred @ beta
+    variance = residuals @ residuals / (m - 1 - k) / m
+    # The factor (1 + T^2 / (m - 1)) for the estimated beta, T^2 the
+    # Hotelling statistic of the control means, as in Lavenberg & Welch
+    deviation = c.mean(axis=0) - control_means
+    covariance = np.atleast_2d(np.cov(c, rowvar=False))
+    hotelling = m * deviation @ np.linalg.solve(covariance, deviation)
+    return mean, variance * (1 + hotelling / (m - 1))
+
+
+def estimate(replication, runs=20, seed=42, antithetic=False, controls=True, level=0.95):
+    """ Estimate of every output of replication(rng), with its variance reduction factor """
+    (output_names, control_names), outputs, control_values, control_means = run_replications(
+        replication, runs, seed, antithetic)
+    quantile = (1 + level) / 2
+    plain_variance = outputs.var(axis=0, ddof=1) / runs
+    plain_half_width = student_t.ppf(quantile, runs - 1) * np.sqrt(plain_variance)
+
+    y, c = outputs, control_values
+    if antithetic:
+        pairs = runs // 2
+        y, c = y.reshape(pairs, 2, y.shape[1]).mean(axis=1), c.reshape(pairs, 2, c.shape[1]).mean(axis=1)
+    m = len(y)
+    # Controls that do not vary (a ward with no beds always blocks) carry
+    # no information and would make the regression singular
+    varies = c.std(axis=0) > 1e-12 * np.maximum(np.abs(control_means), 1.0)
+    controls_of = getattr(replication, 'controls_of', None)
+
+    results = {}
+    for i, name in enumerate(output_names):
+        relevant = control_names if controls_of is None else controls_of.get(name, ())
+        used = [j for j, control in enumerate(control_names) if controls and control in relevant and varies[j]]
+        k = len(used)
+        if m - 1 - k < 1:
+            raise ValueError(f"{m} observations cannot carry {k} controls for {name}; use more runs or fewer controls")
+        mean, variance = controlled_mean(y[:, i], c[:, used], control_means[used])
+        # An output that is a linear function of its controls (the blocking
+        # of a ward no patient is relocated to is its own shadow's) is exact
+        if k and variance <= 1e-20 * plain_variance[i]:
+            variance = 0.0
+        half_width = student_t.ppf(quantile, m - 1 - k) * np.sqrt(variance)
+        if half_width > 0:
+            factor = (plain_half_width[i] / half_width)**2
+        else:
+            factor = np.inf if plain_half_width[i] > 0 else np.nan
+        results[name] = Estimate(float(mean), float(half_width), float(outputs[:, i].mean()),
+                                 float(plain_half_width[i]), float(factor), runs)
+    return results
+
+
+class ShadowedHospitalModel(HospitalModel):
+    """ HospitalModel that also runs every ward alone as a loss system on the same arrivals and stays """
+
+    def reset(self):
+        super().reset()
+        self.shadow_calendars = [[] for _ in self.wards]
+        self.shadow_arrivals = []  # (times, wards, blocked) of every arrival block
+
+    def arrival_block(self):
+        block = super().arrival_block()
+        times, wards, stays, _ = block
+        caps = self.caps.tolist()
+        calendars = self.shadow_calendars
+        blocked = []
+        for t, w, stay in zip(times, wards, stays):
+            calendar = calendars[w]
+            while calendar and calendar[0] <= t:
+                heapq.heappop(calendar)
+            if len(calendar) < caps[w]:
+                heapq.heappush(calendar, t + stay)
+                blocked.append(False)
+            else:
+                blocked.append(True)
+        self.shadow_arrivals.append((np.array(times), np.array(wards), np.array(blocked)))
+        return block
+
+    def shadow_blocking(self, start, end):
+        """ Fraction of the arrivals of every ward in (start, end] that its shadow loss system blocked """
+        times, wards, blocked = (np.concatenate(values) for values in zip(*self.shadow_arrivals))
+        window = (times > start) & (times <= end)
+        n_wards = len(self.wards)
+        arrivals = np.bincount(wards[window], minlength=n_wards)
+        return np.bincount(wards[window], weights=blocked[window], minlength=n_wards) / np.maximum(arrivals, 1)
+
+
+def hospital_replication(params, days=365, warmup_days=30):
+    """ replication(rng) of hospitalization rates and blocking per ward, with the Erlang-B shadow wards as controls """
+    # Measured after warmup_days from an empty hospital, when both the
+    # hospital and the shadow wards are close to their stationary regime
+    capacities, relocation_probs, arrival_rates, mean_stay = params.as_dicts()
+    erlang = erlang_b(params.capacities, params.arrival_rates * params.mean_stay)
+
+    def replication(rng):
+        model = ShadowedHospitalModel(capacities, relocation_probs, arrival_rates, mean_stay, rng=rng)
+        model.advance(warmup_days)
+        before = [np.array(counts) for counts in (model.total_admissions, model.total_losses,
+                                                   model.total_occupied_on_arrival)]
+        model.advance(warmup_days + days)
+        admitted, lost, blocked = (np.array(counts) - start for counts, start in zip(
+            (model.total_admissions, model.total_losses, model.total_occupied_on_arrival), before))
+        shadow = model.shadow_blocking(warmup_days, warmup_days + days)
+        outputs = {}
+        for i, ward in enumerate(params.wards):
+            outputs[f'hospitalization_rate_{ward}'] = admitted[i] / max(admitted[i] + lost[i], 1)
+            outputs[f'prob_full_{ward}'] = blocked[i] / max(admitted[i] + blocked[i], 1)
+        controls = {f'erlang_blocking_{ward}': shadow[i] for i, ward in enumerate(params.wards)}
+        control_means = {f'erlang_blocking_{ward}': erlang[i] for i, ward in enumerate(params.wards)}
+        return outputs, controls, control_means
+
+    # Every ward's outputs are regressed on its own shadow only
+    replication.controls_of = {f'{output}_{ward}': [f'erlang_blocking_{ward}'] for ward in params.wards
+                               for output in ('hospitalization_rate', 'prob_full')}
+    return replication
+
+
+def daily_replication(capacities, relocation_probs, arrival_rates, mean_stay, days=365, warmup_days=0):
+    """ replication(rng) of hospitalization rates and blocking per ward on the day model of the Task scripts """
+    # The dicts of a Task script, in its ward order: relocation column j is
+    # the j-th ward of capacities, as in simulate_hospital_with_new_ward.
+    # From an empty hospital as in the Task scripts by default. There are no
+    # controls: the day model has no shadow with a known mean, and a ward's
+    # own arrivals move too little with its blocking to pay for a degree of
+    # freedom, so it relies on antithetic pairs. The number of relocation
+    # uniforms varies from day to day, so they come from a stream of their own
+
+    def replication(rng):
+        model = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, rng=rng)
+        if warmup_days:
+            model.run(warmup_days)
+        daily = model.run(days)
+        admitted, lost, blocked = (daily[name].sum(axis=0) for name in ('admissions', 'losses', 'occupied_on_arrival'))
+        outputs = {}
+        for i, ward in enumerate(model.wards):
+            outputs[f'hospitalization_rate_{ward}'] = admitted[i] / max(admitted[i] + lost[i], 1)
+            outputs[f'prob_full_{ward}'] = blocked[i] / max(admitted[i] + blocked[i], 1)
+        return outputs, {}, {}
+
+    replication.separate_decisions = True
+    return replication
+
+
+def compare_methods(replication, runs=20, seed=42, outputs=None):
+    """ DataFrame of the estimates of every method: plain, antithetic, control variates and both """
+    rows = []
+    for antithetic, controls in ((False, False), (True, False), (False, True), (True, True)):
+        method = ' + '.join(name for name, used in (('antithetic', antithetic), ('control variates', controls))
+                            if used) or 'plain'
+        for name, result in estimate(replication, runs, seed, antithetic, controls).items():
+            if outputs is None or name in outputs:
+                rows.append({'output': name, 'method': method, **result._asdict()})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    # Ward F's hospitalization rate of the capacity search in Task2.py
+    params = load_scenario('new_ward')
+    table = compare_methods(hospital_replication(params), runs=40,
+                            outputs=['hospitalization_rate_F', 'prob_full_A', 'prob_full_C'])
+    print(table[['output', 'method', 'mean', 'half_width', 'variance_reduction_factor']].to_string(index=False))
@@ -0,0 +1,182 @@
+import numpy as np
+
+# Batched version of simulate_hospital_with_new_ward (Task2.py/Task3.py).
+# Occupancy is kept as an (R replications x W wards) array and every day all
+# R hospitals are advanced together. Within a day the wards are processed in
+# the same order as the scalar model: arrivals, admissions, relocation of the
+# overflow patients, then departures from the ward.
+
+
+def to_arrays(capacities, relocation_probs, arrival_rates, mean_stay):
+    """ Convert the ward dicts used by the Task scripts into aligned arrays """
+    # Relocation column j refers to the j-th key of capacities, exactly as
+    # list(adjusted_capacities.keys())[j] does in the scalar model
+    wards = list(capacities.keys())
+    n_wards = len(wards)
+    caps = np.array([capacities[ward] for ward in wards], dtype=np.int64)
+    rates = np.array([arrival_rates[ward] for ward in wards], dtype=float)
+    stays = np.array([mean_stay[ward] for ward in wards], dtype=float)
+
+    probs = np.zeros((n_wards, n_wards))
+    for i, ward in enumerate(wards):
+        row = np.asarray(relocation_probs[ward], dtype=float)
+        # Rows may be longer than the number of wards when they were written
+        # for a bigger hospital; the extra entries must then be 0.0
+        if np.any(row[n_wards:] != 0.0):
+            raise ValueError(f"Relocation probabilities for {ward} point to unknown wards")
+        probs[i, :min(len(row), n_wards)] = row[:n_wards]
+    return wards, caps, rates, stays, probs
+
+
+def cdf_table(cdf, resolution=1024):
+    """ Flatten CDF rows so one lookup can draw from a different row per sample """
+    # Rows are shifted apart by 3 (all CDF values lie in [0, 2]), so a
+    # position in the flattened table always falls inside the right row. The
+    # guide holds, for every row and every 1/resolution slice of [0, 1), the
+    # first position a uniform from that slice can map to
+    cdf = np.asarray(cdf, dtype=float)
+    n_rows, width = cdf.shape
+    offsets = 3.0 * np.arange(n_rows)
+    flat = np.append((cdf + offsets[:, None]).ravel(), np.inf)
+    grid = offsets[:, None] + np.arange(resolution) / resolution
+    guide = np.searchsorted(flat, grid.ravel(), side='right')
+    return flat, width, guide, resolution
+
+
+def sample_cdf_table(table, rows, u):
+    """ Inverse-transform draw from row `rows[i]` of the table for every uniform `u[i]` """
+    flat, width, guide, resolution = table
+    q = u + 3.0 * rows
+    shape = q.shape
+    q = q.ravel()
+    x = guide[(rows * resolution + (u * resolution).astype(np.int64)).ravel()]
+    # Step forward over the few CDF values inside the guide slice
+    pending = np.flatnonzero(flat[x] <= q)
+    while len(pending):
+        x[pending] += 1
+        pending = pending[flat[x[pending]] <= q[pending]]
+    return x.reshape(shape) - rows * width
+
+
+def poisson_cdf_table(means, limits):
+    """ CDF table of min(Poisson(means[i]), limits[i]) for every row i """
+    means = np.asarray(means, dtype=float)[:, None]
+    limits = np.asarray(limits)[:, None]
+    k = np.arange(limits.max() + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_pmf = k * np.log(means) - means - np.cumsum(np.log(np.maximum(k, 1)))
+    pmf = np.where(means > 0, np.exp(log_pmf), k == 0)
+    # From k = limits[i] on the row is set above 1, so no draw can pass it
+    return cdf_table(np.where(k >= limits, 2.0, np.cumsum(pmf, axis=1)))
+
+
+def relocation_outcome_probs(probs):
+    """ Probability of each relocation outcome for every pattern of free wards """
+    # The scalar model walks the relocation row and moves the patient to the
+    # first ward j with rand() < probs[j] that still has a free bed. For a
+    # given set of free wards (bit i of the mask set when ward i is free) the
+    # patient ends up in ward j with probability
+    #     p_j * prod_{i < j, i free} (1 - p_i)
+    # and is lost with the remaining probability. The last column is the loss
+    n_wards = probs.shape[0]
+    masks = np.arange(2 ** n_wards)
+    free = (masks[:, None] >> np.arange(n_wards)) & 1
+    table = np.zeros((n_wards, len(masks), n_wards + 1))
+    for w in range(n_wards):
+        p = probs[w] * free
+        not_taken = np.cumprod(np.hstack([np.ones((len(masks), 1)), 1 - p]), axis=1)
+        table[w, :, :n_wards] = p * not_taken[:, :-1]
+        table[w, :, n_wards] = not_taken[:, -1]
+    return table
+
+
+def simulate_hospital_batch(days, replications, capacities, relocation_probs, arrival_rates, mean_stay, rng=None):
+    """ Run `replications` independent hospitals for `days` days in array operations """
+    rng = np.random.default_rng(rng)
+    wards, caps, rates, stays, probs = to_arrays(capacities, relocation_probs, arrival_rates, mean_stay)
+    n_wards = len(wards)
+    shape = (replications, n_wards)
+    ward_index = np.arange(n_wards)
+    mask_bits = 1 << ward_index
+
+    # Arrival counts are drawn from a CDF table truncated far in the tail, and
+    # departures from one table row per occupancy level, capped at the
+    # occupancy just like max(0, occupancy - departures) in the scalar model
+    max_arrivals = int(rates.max() + 15 * np.sqrt(rates.max()) + 30)
+    arrival_table = poisson_cdf_table(rates, np.full(n_wards, max_arrivals))
+    departure_tables = [poisson_cdf_table(np.arange(caps[w] + 1) / stays[w], np.arange(caps[w] + 1))
+                        for w in range(n_wards)]
+    outcome_tables = [cdf_table(np.cumsum(outcome, axis=1)[:, :n_wards])
+                      for outcome in relocation_outcome_probs(probs)]
+
+    ward_occupancy = np.zeros(shape, dtype=np.int64)
+    total_admissions = np.zeros(shape, dtype=np.int64)
+    total_relocations = np.zeros(shape, dtype=np.int64)
+    total_losses = np.zeros(shape, dtype=np.int64)
+    total_occupied_on_arrival = np.zeros(shape, dtype=np.int64)
+    occupancy_flat = ward_occupancy.ravel()
+    relocations_flat = total_relocations.ravel()
+    # Bit w of free_mask[r] is set while ward w of replication r has a free bed
+    free_mask = np.full(replications, (caps > 0) @ mask_bits)
+
+    for day in range(days):
+        arrivals = sample_cdf_table(arrival_table, ward_index, rng.random(shape))
+        for w in range(n_wards):
+            # Patients are admitted until the ward is full, the rest overflow
+            admitted = np.minimum(arrivals[:, w], caps[w] - ward_occupancy[:, w])
+            overflow = arrivals[:, w] - admitted
+            ward_occupancy[:, w] += admitted
+            total_admissions[:, w] += admitted
+            total_occupied_on_arrival[:, w] += overflow
+            total_losses[:, w] += overflow
+            free_mask = free_mask & ~mask_bits[w] | (ward_occupancy[:, w] < caps[w]) * mask_bits[w]
+
+            # Overflow patients are relocated one at a time: the k-th overflow
+            # patient of every replication is handled in the same pass, with a
+            # single uniform drawn against the outcome CDF of its free wards.
+            # Rows are sorted by overflow so the rows still active in pass k
+            # are a prefix, and the free-ward bit mask only changes when a
+            # relocated patient takes the last bed of a ward
+            rows = np.flatnonzero(overflow)
+            rows = rows[np.argsort(-overflow[rows].astype(np.int16), kind='stable')]
+            active = np.cumsum(np.bincount(overflow[rows])[::-1])[::-1]
+            mask = free_mask[rows]
+            placed = np.zeros(len(rows), dtype=np.int64)
+            for k in range(overflow.max()):
+                n_active = active[k + 1]
+                outcome = sample_cdf_table(outcome_tables[w], mask[:n_active], rng.random(n_active))
+                relocated = np.flatnonzero(outcome < n_wards)
+                alt_wards = outcome[relocated]
+                cells = rows[relocated] * n_wards + alt_wards
+                occupancy_flat[cells] += 1
+                relocations_flat[cells] += 1
+                placed[relocated] += 1
+                mask[relocated] -= (occupancy_flat[cells] == caps[alt_wards]) * mask_bits[alt_wards]
+            total_losses[rows, w] -= placed
+            free_mask[rows] = mask
+
+            # Handle patient departures based on length of stay
+            ward_occupancy[:, w] -= sample_cdf_table(departure_tables[w], ward_occupancy[:, w], rng.random(replications))
+            free_mask = free_mask & ~mask_bits[w] | (ward_occupancy[:, w] < caps[w]) * mask_bits[w]
+
+    return wards, total_admissions, total_relocations, total_losses, ward_occupancy, total_occupied_on_arrival
+
+
+def summarize_batch(results, days, z=1.96):
+    """ Per-ward mean and confidence half-width over the replications """
+    wards, total_admissions, total_relocations, total_losses, ward_occupancy, total_occupied_on_arrival = results
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics = {
+            'prob_all_beds_occupied': total_occupied_on_arrival / (total_admissions + total_occupied_on_arrival),
+            'hospitalization_rate': total_admissions / (total_admissions + total_losses),
+            'expected_admissions': total_admissions / days,
+            'expected_relocations': total_relocations / days,
+        }
+
+    summary = {}
+    for name, values in metrics.items():
+        mean = np.nanmean(values, axis=0)
+        half_width = z * np.nanstd(values, axis=0, ddof=1) / np.sqrt(np.sum(~np.isnan(values), axis=0))
+        summary[name] = {ward: (mean[i], half_width[i]) for i, ward in enumerate(wards)}
+    return summary
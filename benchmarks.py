@@ -0,0 +1,295 @@
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Benchmarks of the patient-flow and queue simulators. Every benchmark runs at
+# a few sizes and records the best wall time of a few repeats, the events per
+# second and the peak memory (traced in a separate run, since tracing slows
+# Python code down). An event is one patient arrival for the hospital models
+# and one car for the queue models; occupancy counting sees an arrival and a
+# departure per car.
+#
+#     python benchmarks.py                        # all benchmarks, results in benchmark_results.json
+#     python benchmarks.py --quick -k tandem      # smallest size of the matching benchmarks only
+#     python benchmarks.py --save-baseline base.json
+#     python benchmarks.py --baseline base.json   # compare, exit status 1 on a regression
+#
+# Results of different machines are not comparable; save a baseline on the
+# machine the comparison runs on.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PATIENT_FLOW = os.path.join(ROOT, 'Stochastic Simulation', 'Simulation of Patient Flow')
+QUEUES = os.path.join(ROOT, 'Queue Simulation')
+sys.path[:0] = [PATIENT_FLOW, QUEUES]
+# The benchmarks time the simulators, not the result cache of the Task scripts
+os.environ['SIMULATION_CACHE'] = 'off'
+
+from arrival_process import lambda_t, arrivals_by_inversion, arrivals_by_thinning  # noqa: E402
+from hospital_kernel import simulate_hospital as simulate_hospital_kernel  # noqa: E402
+from occupancy import occupancy_on_grid, time_grid  # noqa: E402
+from scenarios import load_scenario, compile_scenario  # noqa: E402
+from tandem_queue import simulate_tandem  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(*sizes):
+    """ Register setup(**size), which returns a function that runs once and returns its number of events """
+    def register(setup):
+        BENCHMARKS[setup.__name__] = (setup, sizes)
+        return setup
+    return register
+
+
+def load_script(name):
+    """ The functions and parameters of a Task script, without running its simulations """
+    # The scripts run their studies at module level, so only the imports
+    # (bar plotting), function definitions and the statements that neither
+    # call the script's own simulate/find functions nor use their results
+    # are executed
+    path = os.path.join(PATIENT_FLOW, name)
+    with open(path) as file:
+        tree = ast.parse(file.read(), path)
+
+    def calls_study(node):
+        return any(isinstance(call, ast.Call) and isinstance(call.func, ast.Name)
+                   and call.func.id.startswith(('simulate_', 'find_', 'compare_', 'format_'))
+                   for call in ast.walk(node))
+
+    def names(node, context):
+        return {name.id for name in ast.walk(node) if isinstance(name, ast.Name) and isinstance(name.ctx, context)}
+
+    body = []
+    skipped = set()  # names set by skipped statements, e.g. the results of a study
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module]
+            if not any(module.startswith('matplotlib') for module in modules):
+                body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            body.append(node)
+        elif isinstance(node, (ast.Assign, ast.AugAssign, ast.For)):
+            if calls_study(node) or names(node, ast.Load) & skipped:
+                skipped |= names(node, ast.Store)
+            else:
+                body.append(node)
+    namespace = {'__name__': name[:-3], '__file__': path}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, 'exec'), namespace)
+    return namespace
+
+
+def patients(admissions, relocations, losses):
+    """ Every arrival is admitted to its own ward, relocated or lost """
+    return sum(admissions.values()) + sum(relocations.values()) + sum(losses.values())
+
+
+@benchmark({'days': 365}, {'days': 1825})
+def task1_simulate_hospital(days):
+    script = load_script('Task1.py')
+
+    def run():
+        # simulate_hospital keeps its occupancy in a module-level dict
+        script['ward_occupancy'] = {ward: 0 for ward in script['wards']}
+        np.random.seed(42)
+        admissions, relocations, losses, _ = script['simulate_hospital'](days)
+        return patients(admissions, relocations, losses)
+    return run
+
+
+@benchmark({'days': 365}, {'days': 1825})
+def task2_simulate_hospital_with_new_ward(days):
+    script = load_script('Task2.py')
+    capacities = script['reallocate_beds'](script['initial_capacities'], script['urgency_points'], 27)
+    capacities['F'] = 27
+    relocation_probs = script['relocation_probs']
+
+    def run():
+        np.random.seed(42)
+        admissions, relocations, losses, _ = script['simulate_hospital_with_new_ward'](days, capacities, relocation_probs)
+        return patients(admissions, relocations, losses)
+    return run
+
+
+@benchmark({'days': 365}, {'days': 1825})
+def task4_simulate_hospital_with_lognorm(days):
+    script = load_script('Task4_Sensitivity_LengthToStayDistribution.py')
+
+    def run():
+        np.random.seed(42)
+        results = script['simulate_hospital_with_lognorm'](days, script['adjusted_capacities'],
+                                                           script['relocation_probs'], script['variances_1'])
+        return patients(*results[:3])
+    return run
+
+
+@benchmark({'days': 365})
+def task2_find_optimal_bed_capacity_for_f(days):
+    script = load_script('Task2.py')
+    simulate = script['simulate_hospital_with_new_ward']
+    counted = [0]
+
+    def counting_simulate(*args, **kwargs):
+        results = simulate(*args, **kwargs)
+        counted[0] += patients(*results[:3])
+        return results
+    # evaluate_bed_capacity_for_f looks the function up in the script globals
+    script['simulate_hospital_with_new_ward'] = counting_simulate
+
+    def run():
+        counted[0] = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            script['find_optimal_bed_capacity_for_f'](days)
+        return counted[0]
+    return run
+
+
+def synthetic_hospital(n_wards):
+    """ The new_ward scenario repeated in groups of six wards, relocating within the group """
+    base = load_scenario('new_ward')
+    wards = {}
+    for i in range(n_wards):
+        b, group = i % len(base.wards), i // len(base.wards)
+        members = range(group * len(base.wards), min((group + 1) * len(base.wards), n_wards))
+        wards[f'{base.wards[b]}{group}'] = {
+            'capacity': int(base.capacities[b]),
+            'arrival_rate': float(base.arrival_rates[b]),
+            'mean_stay': float(base.mean_stay[b]),
+            'relocation': {f'{base.wards[j % len(base.wards)]}{group}': float(base.relocation_probs[b, j % len(base.wards)])
+                           for j in members if j != i and base.relocation_probs[b, j % len(base.wards)] > 0},
+        }
+    return compile_scenario({'name': f'{n_wards} wards', 'wards': wards})
+
+
+@benchmark({'days': 365, 'wards': 6, 'replications': 10}, {'days': 365, 'wards': 6, 'replications': 100},
+           {'days': 365, 'wards': 12, 'replications': 10}, {'days': 3650, 'wards': 6, 'replications': 10})
+def simulate_hospital(days, wards, replications):
+    capacities, relocation_probs, arrival_rates, mean_stay = synthetic_hospital(wards).as_dicts()
+
+    def run():
+        results = simulate_hospital_kernel(days, capacities, relocation_probs, arrival_rates, mean_stay, replications)
+        return int(sum(results[k].sum() for k in (1, 2, 3)))
+    return run
+
+
+@benchmark({'vehicles': 10**5}, {'vehicles': 10**6})
+def nhpp_thinning(vehicles):
+    def run():
+        return len(arrivals_by_thinning(lambda_t, vehicles, rng=42))
+    return run
+
+
+@benchmark({'vehicles': 10**5}, {'vehicles': 10**6})
+def nhpp_inversion(vehicles):
+    def run():
+        return len(arrivals_by_inversion(lambda_t, vehicles, rng=42))
+    return run
+
+
+@benchmark({'vehicles': 10**5}, {'vehicles': 10**6})
+def tandem_queue(vehicles):
+    arrivals = arrivals_by_inversion(lambda_t, vehicles, rng=42)
+
+    def run():
+        return len(simulate_tandem(arrivals, rng=42)['DepartureTime'])
+    return run
+
+
+@benchmark({'vehicles': 10**5}, {'vehicles': 10**6})
+def occupancy_counting(vehicles):
+    result = simulate_tandem(arrivals_by_inversion(lambda_t, vehicles, rng=42), rng=42)
+    arrivals, departures = result['ArrivalTime'], result['DepartureTime']
+    grid = time_grid(departures.max(), 1 / 60)
+
+    def run():
+        occupancy_on_grid(arrivals, departures, grid)
+        return 2 * vehicles
+    return run
+
+
+def measure(setup, size, repeat):
+    run = setup(**size)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = min(times)
+    return {'seconds': seconds, 'events': int(events), 'events_per_second': events / seconds,
+            'peak_memory_mb': peak / 2**20}
+
+
+def run_benchmarks(selected=None, quick=False, repeat=3, verbose=True):
+    """ Results keyed by 'name[size]' """
+    results = {}
+    for name, (setup, sizes) in BENCHMARKS.items():
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        for size in sizes[:1] if quick else sizes:
+            key = f"{name}[{','.join(f'{k}={v}' for k, v in size.items())}]"
+            results[key] = dict(name=name, size=size, **measure(setup, size, repeat))
+            if verbose:
+                r = results[key]
+                print(f"{key:70s} {r['seconds']:9.4f} s {r['events_per_second']:14,.0f} events/s "
+                      f"{r['peak_memory_mb']:9.2f} MB")
+    return results
+
+
+def environment():
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Benchmarks slower than the baseline by more than `tolerance` (as a fraction) """
+    regressions = []
+    print(f"\n{'benchmark':70s} {'baseline':>10s} {'now':>10s} {'ratio':>7s}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[key]['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = '  slower'
+        elif ratio < 1 / (1 + tolerance):
+            flag = '  faster'
+        print(f"{key:70s} {baseline[key]['seconds']:10.4f} {result['seconds']:10.4f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the patient-flow and queue simulators")
+    parser.add_argument('-k', dest='selected', action='append', help="only benchmarks whose name contains this")
+    parser.add_argument('--quick', action='store_true', help="smallest size of every benchmark only")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--save-baseline', help="also write the results to this baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slowdown counted as a regression")
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'results': run_benchmarks(args.selected, args.quick, args.repeat)}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report['results'], json.load(file)['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline")
+            sys.exit(1)
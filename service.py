@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# A small local HTTP/JSON service for what-if queries on the hospital and
+# airport queue models. Replications run in a pool of worker processes that
+# stays up between queries, with the simulator modules imported and the
+# scenarios compiled once, and the running means and 95% confidence intervals
+# are streamed back as newline-delimited JSON while replications finish:
+#
+#     python service.py --port 8765
+#     curl -N localhost:8765/hospital -d '{"bed_changes": {"F": 5, "E": -5}, "replications": 50}'
+#     curl -N localhost:8765/queue -d '{"capacity": 15, "bays": 2}'
+#
+# A hospital query starts from a scenario of scenario_files and may set
+# capacities, add or remove beds per ward (bed_changes), scale the arrival
+# rates and give log-normal stays (variance_factor, as in sweep.py). Its first
+# line is the Erlang fixed point of erlang_loss, available at once; then one
+# 'progress' line per finished replication and a last 'done' line.
+#
+# Queries are normalised first (defaults filled in, capacities resolved), so
+# queries that differ only in how they are written are the same query. A query
+# that is already running is not started twice: the new client follows the
+# running one from its first line. Finished results are kept in an LRU cache
+# and replayed. A run continues when its client disconnects, so a repeated
+# query is then served from the cache.
+#
+# The service has no authentication; keep it on localhost.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PATIENT_FLOW = os.path.join(ROOT, 'Stochastic Simulation', 'Simulation of Patient Flow')
+QUEUES = os.path.join(ROOT, 'Queue Simulation')
+sys.path[:0] = [PATIENT_FLOW, QUEUES]
+
+from arrival_process import lambda_t, arrivals_by_inversion  # noqa: E402
+from erlang_loss import overflow_fixed_point  # noqa: E402
+from queue_network import airport_network, tandem_columns  # noqa: E402
+from run_control import DailyHospital  # noqa: E402
+from scenarios import SCENARIO_DIR, load_scenario, with_capacities  # noqa: E402
+from streaming_stats import TandemStats, Welford  # noqa: E402
+from sweep import replication_metrics  # noqa: E402
+from tandem_queue import PICKUP_CAPACITY  # noqa: E402
+
+MAX_REPLICATIONS = 1000
+MAX_BODY = 2**16
+REQUEST_TIMEOUT = 30.0  # seconds for a client to send its whole request
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+          413: 'Payload Too Large'}
+
+
+class QueryError(ValueError):
+    """ A query the service cannot run, answered with 400 """
+
+
+def integer(query, name, default, low, high):
+    value = query.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise QueryError(f"{name} must be an integer in [{low}, {high}], got {value!r}")
+    return value
+
+
+def positive(query, name, default):
+    value = query.get(name, default)
+    if value is None and default is None:
+        return None
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 < value < math.inf:
+        raise QueryError(f"{name} must be a positive number, got {value!r}")
+    return float(value)
+
+
+def check_keys(query, allowed):
+    if not isinstance(query, dict):
+        raise QueryError("The query must be a JSON object")
+    unknown = set(query) - set(allowed)
+    if unknown:
+        raise QueryError(f"Unknown fields {sorted(unknown)}, expected some of {sorted(allowed)}")
+
+
+def hospital_query(query):
+    """ (normalised query, HospitalParams) of a hospital what-if query """
+    check_keys(query, ('scenario', 'capacities', 'bed_changes', 'days', 'replications', 'seed', 'variance_factor',
+                       'arrival_scale'))
+    scenario = query.get('scenario', 'new_ward')
+    # Only the scenarios shipped in scenario_files, not arbitrary paths. The
+    # path is built here: load_scenario would try a bare name in the working
+    # directory first
+    if not isinstance(scenario, str) or os.path.basename(scenario) != scenario or scenario.startswith('.'):
+        raise QueryError(f"scenario must be the name of a file in scenario_files, got {scenario!r}")
+    path = os.path.join(SCENARIO_DIR, scenario if os.path.splitext(scenario)[1] else scenario + '.toml')
+    try:
+        params = load_scenario(path)
+    except OSError:
+        raise QueryError(f"Unknown scenario {scenario!r}") from None
+    except ValueError as error:  # an unknown format, or a file that does not parse or validate
+        raise QueryError(f"Invalid scenario {scenario!r}: {error}") from None
+
+    capacities = dict(zip(params.wards, params.capacities.tolist()))
+    for field, absolute in (('capacities', True), ('bed_changes', False)):
+        changes = query.get(field, {})
+        if not isinstance(changes, dict) or not set(changes) <= set(params.wards):
+            raise QueryError(f"{field} must map wards of {params.wards} to integers, got {changes!r}")
+        for ward, beds in changes.items():
+            if not isinstance(beds, int) or isinstance(beds, bool):
+                raise QueryError(f"{field}[{ward!r}] must be an integer, got {beds!r}")
+            capacities[ward] = beds if absolute else capacities[ward] + beds
+    try:
+        params = with_capacities(params, capacities)
+    except ValueError as error:
+        raise QueryError(str(error)) from None
+
+    normalised = {
+        'model': 'hospital',
+        'scenario': params.digest,
+        'capacities': [int(c) for c in params.capacities],
+        'days': integer(query, 'days', 365, 1, 100 * 365),
+        'replications': integer(query, 'replications', 20, 2, MAX_REPLICATIONS),
+        'seed': integer(query, 'seed', 42, 0, 2**63 - 1),
+        'variance_factor': positive(query, 'variance_factor', None),
+        'arrival_scale': positive(query, 'arrival_scale', 1.0),
+    }
+    return normalised, params
+
+
+def queue_query(query):
+    """ Normalised airport queue query """
+    check_keys(query, ('capacity', 'bays', 'cars', 'replications', 'seed'))
+    normalised = {
+        'model': 'queue',
+        'capacity': integer(query, 'capacity', PICKUP_CAPACITY, 1, 10**4),
+        'bays': integer(query, 'bays', 1, 1, 10**4),
+        'cars': integer(query, 'cars', 10**5, 1, 10**7),
+        'replications': integer(query, 'replications', 10, 2, MAX_REPLICATIONS),
+        'seed': integer(query, 'seed', 42, 0, 2**63 - 1),
+    }
+    if normalised['bays'] > normalised['capacity']:
+        raise QueryError("bays cannot exceed capacity")
+    return normalised
+
+
+def query_key(normalised):
+    return hashlib.sha256(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+
+
+def hospital_replication(params, days, variance_factor, arrival_scale, seed):
+    """ Metrics of one replication of a hospital query (runs in a worker process) """
+    capacities, relocation_probs, arrival_rates, mean_stay = params.as_dicts()
+    arrival_rates = {ward: rate * arrival_scale for ward, rate in arrival_rates.items()}
+    variances = None
+    if variance_factor is not None:
+        variances = {ward: variance_factor / stay**2 for ward, stay in mean_stay.items()}
+    daily = DailyHospital(capacities, relocation_probs, arrival_rates, mean_stay, variances, rng=seed).run(days)
+    return replication_metrics(daily, days)
+
+
+def queue_replication(capacity, bays, cars, seed):
+    """ Sojourn and waiting times of one replication of an airport queue query (runs in a worker process) """
+    rng = np.random.default_rng(seed)
+    arrivals = arrivals_by_inversion(lambda_t, cars, rng=rng)
+    stats = TandemStats()
+    stats.add_chunk(tandem_columns(airport_network(capacity, bays, rng=rng).simulate(arrivals)))
+    summary = stats.summary()
+    return {f'{name}_{queue}': summary[queue][name] for queue in ('Queue1', 'Queue2', 'System')
+            for name in ('T', 'Tq', 'N', 'Nq')}
+
+
+def warm_worker():
+    """ Compile the default scenario once per worker process """
+    load_scenario('new_ward')
+
+
+def number(value):
+    """ A float, or None for NaN and infinities, which JSON has no numbers for """
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def numbers(values):
+    return [number(value) for value in np.asarray(values, dtype=float)]
+
+
+class RunningIntervals:
+    """ Running means and 95% confidence half-widths of the metrics of finished replications """
+
+    def __init__(self, labels=None):
+        self.labels = labels  # per metric, the labels of its entries; None for scalars
+        self.moments = {}
+
+    def add(self, metrics):
+        for name, value in metrics.items():
+            self.moments.setdefault(name, Welford()).add(np.asarray(value, dtype=float))
+
+    def summary(self):
+        result = {}
+        for name, moments in self.moments.items():
+            half_width = 1.96 * np.sqrt(moments.variance / moments.n) if moments.n > 1 else np.nan * moments.mean
+            if self.labels is None:
+                result[name] = {'mean': number(moments.mean), 'half_width': number(half_width)}
+            else:
+                result[name] = {label: {'mean': number(m), 'half_width': number(h)}
+                                for label, m, h in zip(self.labels[name], moments.mean, half_width)}
+        return result
+
+
+class Job:
+    """ The lines of one query, followed by any number of clients while it runs """
+
+    def __init__(self):
+        self.lines = []
+        self.done = False
+        self.failed = False  # the run raised; its last line is the error and it is not cached
+        self.changed = asyncio.Condition()
+
+    async def publish(self, record, final=False):
+        async with self.changed:
+            self.lines.append((json.dumps(record, allow_nan=False) + '\n').encode())
+            self.done = final
+            self.changed.notify_all()
+
+    async def follow(self):
+        """ Every line, from the first, as it is published """
+        sent = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.lines) > sent or self.done)
+                new, done = self.lines[sent:], self.done
+            for line in new:
+                yield line
+            sent += len(new)
+            if done and sent == len(self.lines):
+                return
+
+
+class ResultCache:
+    """ The finished jobs of the latest `size` distinct queries """
+
+    def __init__(self, size):
+        self.size = size
+        self.jobs = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        job = self.jobs.get(key)
+        if job is None:
+            self.misses += 1
+            return None
+        self.jobs.move_to_end(key)
+        self.hits += 1
+        return job
+
+    def put(self, key, job):
+        self.jobs[key] = job
+        self.jobs.move_to_end(key)
+        while len(self.jobs) > self.size:
+            self.jobs.popitem(last=False)
+
+
+class SimulationService:
+    """ Replications of what-if queries over a warm process pool, deduplicated and cached """
+
+    def __init__(self, workers=None, cache_size=128):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        self.cache = ResultCache(cache_size)
+        self.running = {}
+        self.tasks = set()
+        self.started = time.time()
+        self.queries = 0
+
+    def submit(self, normalised, run):
+        """ (job, 'hit' | 'shared' | 'miss') for a normalised query; `run(job)` produces a new job's lines """
+        self.queries += 1
+        key = query_key(normalised)
+        job = self.cache.get(key)
+        if job is not None:
+            return job, 'hit'
+        if key in self.running:
+            return self.running[key], 'shared'
+        job = self.running[key] = Job()
+        task = asyncio.get_running_loop().create_task(self.produce(key, job, run))
+        # The loop keeps weak references to tasks only
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job, 'miss'
+
+    async def produce(self, key, job, run):
+        try:
+            await run(job)
+        except Exception as error:
+            job.failed = True
+            await job.publish({'type': 'error', 'error': f'{type(error).__name__}: {error}'}, final=True)
+        else:
+            self.cache.put(key, job)
+        finally:
+            del self.running[key]
+
+    async def replications(self, job, normalised, function, args, labels=None):
+        """ Run function(*args, seed) once per replication in the pool, publishing the running intervals """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        total = normalised['replications']
+        # Replication r gets the same seed whatever order the workers finish in
+        futures = [loop.run_in_executor(self.pool, function, *args, child)
+                   for child in np.random.SeedSequence(normalised['seed']).spawn(total)]
+        intervals = RunningIntervals(labels)
+        try:
+            for done, future in enumerate(asyncio.as_completed(futures), 1):
+                intervals.add(await future)
+                record = {'type': 'progress' if done < total else 'done', 'replications': done, 'of': total,
+                          'seconds': time.perf_counter() - started, 'metrics': intervals.summary()}
+                await job.publish(record, final=done == total)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def hospital(self, query):
+        normalised, params = hospital_query(query)
+
+        async def run(job):
+            rates = params.arrival_rates * normalised['arrival_scale']
+            fixed_point = overflow_fixed_point(params.capacities, rates, params.mean_stay, params.relocation_probs)
+            await job.publish({'type': 'surrogate', 'query': normalised, 'wards': list(params.wards),
+                               'blocking': numbers(fixed_point['blocking']),
+                               'hospitalization_rate': numbers(fixed_point['hospitalization_rate']),
+                               'losses_per_day': numbers(fixed_point['losses_per_day'])})
+            labels = {'prob_full': params.wards, 'hospitalization_rate': params.wards,
+                      'losses_per_day': params.wards + ('Total',)}
+            await self.replications(job, normalised, hospital_replication,
+                                    (params, normalised['days'], normalised['variance_factor'],
+                                     normalised['arrival_scale']), labels)
+        return self.submit(normalised, run)
+
+    def queue(self, query):
+        normalised = queue_query(query)
+
+        async def run(job):
+            await job.publish({'type': 'query', 'query': normalised})
+            await self.replications(job, normalised, queue_replication,
+                                    (normalised['capacity'], normalised['bays'], normalised['cars']))
+        return self.submit(normalised, run)
+
+    def status(self):
+        return {'uptime_seconds': time.time() - self.started, 'queries': self.queries, 'running': len(self.running),
+                'cached': len(self.cache.jobs), 'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses}
+
+    async def handle(self, reader, writer):
+        """ One HTTP/1.1 request per connection """
+        try:
+            method, path, body = await read_request(reader)
+            if path == '/status' and method == 'GET':
+                await send_json(writer, 200, self.status())
+            elif path in ('/hospital', '/queue'):
+                if method != 'POST':
+                    await send_json(writer, 405, {'error': f'{path} takes POST'})
+                    return
+                try:
+                    query = json.loads(body or '{}')
+                    job, cache = (self.hospital if path == '/hospital' else self.queue)(query)
+                except (QueryError, json.JSONDecodeError) as error:
+                    await send_json(writer, 400, {'error': str(error)})
+                    return
+                await send_stream(writer, job.follow(), {'X-Cache': cache})
+            else:
+                await send_json(writer, 404, {'error': f'No route {path}, try POST /hospital, POST /queue, GET /status'})
+        except HttpError as error:
+            await send_json(writer, error.status, {'error': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away; its job runs on for the cache
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        # Start the workers now rather than on the first query
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.pool, warm_worker)
+                               for _ in range(self.workers)))
+        print(f"Serving on http://{host}:{port} with {self.workers} workers")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader, timeout=REQUEST_TIMEOUT):
+    """ (method, path, decoded body) of one request, which must arrive within `timeout` seconds """
+    # One deadline for the whole request, so a client sending it a byte at a
+    # time cannot hold its connection open
+    try:
+        return await asyncio.wait_for(read_request_parts(reader), timeout)
+    except asyncio.TimeoutError:
+        raise HttpError(408, f'The request did not arrive within {timeout:g} seconds') from None
+
+
+async def read_request_parts(reader):
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+        raise HttpError(400, 'Malformed request line')
+    method, target, _ = request_line
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HttpError(400, 'Content-Length must be a non-negative integer')
+    if length > MAX_BODY:
+        raise HttpError(413, f'Queries are limited to {MAX_BODY} bytes')
+    body = await reader.readexactly(length) if length else b''
+    try:
+        body = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HttpError(400, 'The body must be UTF-8') from None
+    return method, target.split('?')[0], body
+
+
+def head(status, headers):
+    lines = [f'HTTP/1.1 {status} {STATUS[status]}'] + [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+async def send_json(writer, status, payload):
+    body = json.dumps(payload).encode()
+    writer.write(head(status, {'Content-Type': 'application/json', 'Content-Length': len(body),
+                               'Connection': 'close'}) + body)
+    await writer.drain()
+
+
+async def send_stream(writer, lines, headers=()):
+    """ Newline-delimited JSON in chunked transfer encoding, one chunk per line """
+    writer.write(head(200, {'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked',
+                            'Connection': 'close', **dict(headers)}))
+    async for line in lines:
+        writer.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+        await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Live what-if queries on the hospital and airport queue models")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--cache-size', type=int, default=128, help="finished queries kept for replay")
+    args = parser.parse_args()
+
+    service = SimulationService(args.workers, args.cache_size)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()